@@ -1,10 +1,25 @@
 import streamlit as st
-import pandas as pd
-import duckdb
 import os
-import io
-import datetime
-from src.agent import app as agent_app
+import time
+import functools
+from src.agent import stream_with_tokens, embeddings, embed_question
+from src import answer_cache, query_templates
+from src.db import get_manager
+from src.catalog import get_catalog
+from src.ingestion import ingest_excel, ingest_uploads, read_header
+from src.incremental import INCREMENTAL_KEYS, history_table, reset_incremental
+from src.master_report import (FULFILLED_BILLED_WEIGHT, MASTER_REPORT, OPEN_BILLED_WEIGHT, OPEN_TOTAL_WEIGHT,
+                               is_materialized, refresh_master_report, report_version)
+from src.rollups import rollup_table
+from src.snapshots import PREVIOUS_MONTH, snapshot_dir, snapshot_loads, snapshot_view
+from src.scenarios import build_scenario_base, evaluate_grid
+from src.results import read_page
+from src.ledger import bump_data_epoch, data_version, ensure_ingest_ledger
+from src.schema_context import precompute as precompute_schema_context
+from src.preview import PAGE_SIZE as PREVIEW_PAGE_SIZE, count_rows, fetch_page
+from src.jobs import get_runner
+from src.metrics import PeakRss, get_metrics, hot_operators, new_run_id, profiling
+from src.exports import EXPORT_FORMATS, build_export, pending_export, ready_export, request_export
 
 # from phoenix.otel import register
 
@@ -71,12 +86,23 @@ def login_screen():
 #     st.stop()
 
 # Initialize Database COnnection
-#@st.cache_resource
+# Both return context managers over the process-wide connection manager:
+# writes are serialized on one connection, reads use pooled cursors.
 def get_db_con():
-    return duckdb.connect(db_path, read_only=False)
+    return get_manager(db_path).write()
 
 def get_db_con_ro():
-    return duckdb.connect(db_path, read_only=True)
+    return get_manager(db_path).read()
+
+@st.cache_resource
+def init_bookkeeping(path):
+    """Creates the app's bookkeeping tables once per process, so the hot paths can read them on read cursors."""
+    with get_manager(path).write() as con:
+        answer_cache.ensure_answer_cache(con)
+        query_templates.ensure_query_templates(con)
+        ensure_ingest_ledger(con)
+
+init_bookkeeping(db_path)
 
 # def init_history_db():
 #     with get_db_con() as con: # Assuming this is your connection util
@@ -104,13 +130,68 @@ def get_db_con_ro():
 #     st.session_state.db_initialized = True
 
 def get_all_tables():
-    """Queries DuckDB to find all user-created tables."""
-    with get_db_con_ro() as con:
-        tables = con.execute("""
-            SELECT table_name FROM information_schema.tables
-            WHERE table_schema = 'main'
-            """).fetchall()
-    return [t[0] for t in tables]
+    """All user-created tables, served from the catalog cache."""
+    return get_catalog(db_path).tables()
+
+def invalidate_tables(tables):
+    """Drops cached catalog entries for reloaded tables and everything derived from them,
+    then profiles them again so the first question about them does not wait for it."""
+    tables = list(tables)
+    catalog = get_catalog(db_path)
+    derived = [MASTER_REPORT, rollup_table(MASTER_REPORT), PREVIOUS_MONTH[1]] + [snapshot_view(t) for t in tables]
+    catalog.invalidate(tables + [history_table(t) for t in tables] + derived)
+    existing = set(catalog.tables())
+    precompute_schema_context(catalog, [t for t in tables + derived if t in existing])
+
+JOB_ICONS = {"queued": "🕒", "running": "⏳", "done": "✅", "failed": "❌", "interrupted": "⚠️"}
+
+def track_job(job_id):
+    """Remembers a job started from this session so its outcome is announced when it finishes."""
+    st.session_state.setdefault("tracked_jobs", []).append(job_id)
+
+@st.fragment(run_every="2s")
+def render_jobs():
+    """Polls the job table; reruns the app once a job this session started has finished."""
+    runner = get_runner(db_path)
+    for job in runner.recent(limit=5, kinds=["ingest", "master_report"]):
+        st.caption(f"{JOB_ICONS.get(job.status, '')} {job.label} · {job.status}")
+        if job.status == "running":
+            st.progress(job.progress or 0.0, text=job.message[:80] or None)
+        elif job.result.get("log") or job.error:
+            with st.expander("Details"):
+                for line in job.result.get("log", []):
+                    st.write(line)
+                if job.error:
+                    st.error(job.error)
+
+    finished = []
+    for job_id in st.session_state.get("tracked_jobs", []):
+        job = runner.get(job_id)
+        if job is not None and not job.active:
+            finished.append(job_id)
+            if job.status == "done":
+                st.toast(job.result.get("summary", f"{job.label} finished"))
+            else:
+                st.toast(f"{job.label} {job.status}: {job.error}")
+    if finished:
+        st.session_state.tracked_jobs = [j for j in st.session_state.tracked_jobs if j not in finished]
+        st.rerun()
+
+@st.fragment
+def render_metrics():
+    """p50/p95 per stage over the last questions (and last loads/builds), from the metrics table."""
+    last = st.number_input("Last questions", min_value=5, max_value=500, value=50, step=5, key="metrics_last")
+    metrics = get_metrics(db_path)
+    summary = metrics.stage_summary(int(last))
+    if summary.empty:
+        st.caption("Nothing timed yet.")
+        return
+    st.dataframe(summary.round(3), hide_index=True, width="stretch")
+    for stage, label in [("query", "Last generated SQL"), ("master_report", "Last master report build")]:
+        profile = metrics.latest_profile(stage)
+        if profile:
+            st.caption(f"{label}, slowest operators: "
+                       + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in hot_operators(profile)))
 
 @st.fragment
 def data_ingestion_ui():
@@ -122,200 +203,135 @@ def data_ingestion_ui():
             type=["xlsx", "xlsb"],
             accept_multiple_files=True
         )
+        incremental = st.toggle(
+            "Incremental load",
+            help=f"Merge only changed rows into keyed tables ({', '.join(INCREMENTAL_KEYS)}) instead of replacing them"
+        )
         submit = st.form_submit_button("Create Table", width="stretch")
     
     if submit and uploaded_files:
-        for uploaded_file in uploaded_files:
-            base_name = uploaded_file.name.lower()
-            for ext in [".xlsx", ".xlsb"]:
-                base_name = base_name.replace(ext, "")
-            table_name = base_name.replace(" ","_").strip()
-
-            with st.status(f"Ingesting {table_name} ...", expanded=True) as status:
-                try:
-                    df = pd.read_excel(uploaded_file, engine='calamine', dtype=str)
-                    df['load_date'] = pd.Timestamp.now(tz='Asia/Kolkata').strftime('%Y-%m-%d %H:%M:%S %Z')
-                    with get_db_con() as con:
-                        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
-                    status.update(label=f"✅ {table_name} Loaded", state="complete")
-                    st.toast(f"Table {table_name} created.")
-                except Exception as e:
-                    st.error(f"Faled to load {table_name}: {e}")
-        st.rerun()
+        # Parsing runs as a background job so the session stays responsive; see render_jobs
+        track_job(get_runner(db_path).submit(
+            "ingest", f"Upload of {len(uploaded_files)} file(s)", ingest_uploads_job, uploaded_files, incremental
+        ))
+        st.toast(f"Ingesting {len(uploaded_files)} file(s) in the background ...")
+
+def describe_ingest(result):
+    label = f"{result.source} [{result.sheet_name}] → {result.table_name}"
+    if result.error:
+        line = f"❌ {label}: {result.error}"
+    elif result.skipped:
+        line = f"⏭️ {label}: unchanged since last upload"
+    else:
+        line = f"✅ {label}: {result.rows:,} rows parsed ({result.rows_per_sec:,.0f} rows/sec)"
+    return line
+
+def describe_delta(result):
+    """What an incremental merge changed; only known once the upload has been committed."""
+    d = result.delta
+    line = (f"🔀 {result.table_name}: +{d['inserted_keys']} new, ~{d['updated_keys']} changed, "
+            f"-{d['deleted_keys']} removed, {d['unchanged_keys']} unchanged keys")
+    if d.get("added_columns"):
+        line += f"; new column(s) added: {', '.join(d['added_columns'])}"
+    if d.get("widened_columns"):
+        line += f"; now stored as text: {', '.join(d['widened_columns'])}"
+    return line
+
+def ingest_uploads_job(uploaded_files, incremental, report):
+    """Background job: loads the uploads, re-syncs the master report and re-profiles what changed."""
+    log = []
+    def on_progress(result):
+        log.append(describe_ingest(result))
+        report(log[-1])
+    started = time.perf_counter()
+    # Parsing holds no lock; the writer is taken only to commit the parsed sheets
+    with PeakRss() as peak:
+        results = ingest_uploads(get_manager(db_path), uploaded_files, on_progress=on_progress,
+                                 incremental=incremental)
+    for result in results:
+        if result.delta:
+            log.append(describe_delta(result))
+            report(log[-1])
+    loaded_tables = [r.table_name for r in results if not r.skipped and not r.error]
+    get_metrics(db_path).record("ingest", time.perf_counter() - started,
+                                rows=sum(r.rows for r in results if not r.skipped and not r.error),
+                                detail=f"{len(loaded_tables)} of {len(results)} sheet(s)", peak=peak,
+                                workers_rss_mb=max((r.peak_rss_mb for r in results if r.peak_rss_mb), default=None))
+    with get_db_con() as con:
+        for table_name, month in snapshot_loads(con, loaded_tables, snapshot_dir(db_path)).items():
+            log.append(f"🗂️ {table_name} snapshot saved for {month}")
+        refresh = refresh_master_report_if_stale(con, warn=log.append)
+    invalidate_tables(loaded_tables)
+    if refresh and refresh["mode"] != "fresh":
+        log.append(f"🔄 {MASTER_REPORT} refreshed ({refresh['mode']}, {refresh['projects']:,} projects)")
+    failed = [r for r in results if r.error]
+    skipped = [r for r in results if r.skipped]
+    loaded = len(results) - len(failed) - len(skipped)
+    return {
+        "summary": f"Loaded {loaded} of {len(results)} sheet(s), {len(skipped)} unchanged, {len(failed)} failed",
+        "log": log
+    }
+
+def master_report_job(weights, report):
+    """Background job: rebuilds the master report from scratch with the chosen effective-FTE weights."""
+    report(f"Rebuilding {MASTER_REPORT} ...")
+    with get_db_con() as con:
+        refresh = profiled_refresh(con, force=True, weights=weights)
+    get_catalog(db_path).invalidate([MASTER_REPORT, rollup_table(MASTER_REPORT)])
+    precompute_schema_context(get_catalog(db_path), [MASTER_REPORT, rollup_table(MASTER_REPORT)])
+    return {"summary": f"🚀 Master Project Report Generated! ({refresh['projects']:,} projects)"}
 
-def create_master_report_view(f_weight, d_weight):
-    sql = f"""
-        CREATE OR REPLACE VIEW dashboard15 AS
-            WITH 
-            dept_map AS(
-            SELECT "HCM Department Name" AS department_name, ANY_VALUE("HCM Department ID") AS department_id
-            from utilization_prediction_report
-            where department_name IS NOT NULL
-            GROUP BY 1
-            ),
-            -- 1. Current Month Aggregation
-            util_summarized AS (
-                SELECT 
-                    "Project Id", Practice, "Utilization Location" AS Location, "Grade Name" AS Grade, 
-                    "HCM Department Name" AS department_name,
-                    COUNT("Associate ID") AS headcount,
-                    SUM(TRY_CAST("Billed FTE Internal" AS DOUBLE)) AS billed_fte,
-                    SUM(TRY_CAST("Total FTE" AS DOUBLE)) AS total_fte,
-                    ANY_VALUE("BU") AS bu_id,
-                    ANY_VALUE("Customer Id") AS account_id,
-                    ANY_VALUE("Project Name") AS project_name,
-                    ANY_VALUE("Project Type") AS project_type,
-                    ANY_VALUE("Project Billability") AS project_billability,
-                    ANY_VALUE("Customer Name") AS customer_name,
-                    ANY_VALUE("ParentCustomerID") AS parent_customer_id,
-                    ANY_VALUE("Parent Customer") AS parent_customer,
-                    ANY_VALUE("Is Onsite") AS is_onsite
-                FROM utilization_prediction_report
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-            -- 2. Previous Month Aggregation (Now with Descriptive attributes)
-            previous_util AS (
-                SELECT 
-                    "Project Id", Practice, "Utilization Location" AS Location, "Grade Name" AS Grade,
-                    "HCM Department Name" AS department_name,
-                    SUM(TRY_CAST("Billed FTE Internal" AS DOUBLE)) AS prev_mon_billed_fte,
-                    SUM(TRY_CAST("Total FTE" AS DOUBLE)) AS prev_mon_total_fte,
-                    ANY_VALUE("BU") AS bu_id,
-                    ANY_VALUE("Customer Id") AS account_id,
-                    ANY_VALUE("Project Name") AS project_name,
-                    ANY_VALUE("Project Type") AS project_type,
-                    ANY_VALUE("Project Billability") AS project_billability,
-                    ANY_VALUE("Customer Name") AS customer_name,
-                    ANY_VALUE("ParentCustomerID") AS parent_customer_id,
-                    ANY_VALUE("Parent Customer") AS parent_customer
-                FROM previous_month_actual
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-            -- 2. Your Demand Summary (already correct)
-            demand_summary AS (
-                SELECT "Project Id", Practice, Location, "Grade HR" AS Grade, 
-                "Pool Name" AS department_name,
-                COUNT(*) AS dem_count,
-                ANY_VALUE("BU") AS bu_id,
-                ANY_VALUE("Account Id") AS account_id,
-                ANY_VALUE("Project Description") AS project_name,
-                ANY_VALUE("Project Type") AS project_type,
-                ANY_VALUE("Project Billability") AS project_billability,
-                ANY_VALUE("Account Name") AS customer_name,
-                ANY_VALUE("Account ID") AS customer_id,
-                ANY_VALUE("Parent Customer ID") AS parent_customer_id,
-                ANY_VALUE("Parent Customer") AS parent_customer
-                FROM demand_base
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-            fulfilment_summary AS (
-                SELECT "Project Id", Practice, Location, "Associate Hired Grade" AS Grade, 
-                "Pool Name" AS department_name,
-                SUM(TRY_CAST("FTE Impact" AS DOUBLE)) AS fulfil_count
-                FROM fulfilment
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-
-            release_summary AS (
-            SELECT "Project Id", Practice, Location, Grade, "Department Name" AS department_name,
-                SUM(TRY_CAST("Impact FTE" AS DOUBLE)) AS rel_count
-                FROM releases
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-            attrition_summary AS (
-            SELECT "Project Id", Practice, Location, Grade, "Department Name" AS department_name,
-                SUM(TRY_CAST("FTE Impact" AS DOUBLE)) AS attr_count
-                FROM attrition
-                GROUP BY 1, 2, 3, 4, 5
-            ),
-            -- New Cleaned Up Account Map
-            map_account_unique AS (
-            SELECT "Account ID", ANY_VALUE("PDL ID") AS "PDL ID", ANY_VALUE("PDL Name") AS "PDL Name"
-            FROM map_account
-            GROUP BY "Account ID"
-            ),
-
-            -- 3. Master Keys
-            master_keys AS (
-                SELECT "Project Id", Practice, Location, Grade, department_name FROM util_summarized
-                UNION 
-                SELECT "Project Id", Practice, Location, Grade, department_name FROM previous_util
-                UNION
-                SELECT "Project Id", practice, Location, Grade, department_name From demand_summary
-            )
+def create_master_report_view(f_weight, d_weight, d_total_weight):
+    try:
+        track_job(get_runner(db_path).submit("master_report", f"Rebuild {MASTER_REPORT}", master_report_job,
+                                             (f_weight, d_weight, d_total_weight)))
+        st.toast(f"Rebuilding {MASTER_REPORT} in the background ...")
 
-            -- 4. Final Join
-            SELECT  
-                m."Project Id", 
-                COALESCE(u.project_name, p.project_name, d.project_name) AS project_name,
-                COALESCE(u.project_type, p.project_type, d.project_type) AS project_type,
-                COALESCE(u.project_billability, p.project_billability, d.project_billability) AS project_billability,
-                m.Practice, m.Location, m.Grade,
-                -- Pull from Current, fallback to Previous
-                
-                COALESCE(u.account_id, p.account_id, d.account_id) AS customer_id,
-                COALESCE(u.customer_name, p.customer_name, d.customer_name) AS customer_name,
-                COALESCE(u.parent_customer_id, p.parent_customer_id, d.parent_customer_id) AS parent_customer_id,
-                COALESCE(u.parent_customer, p.parent_customer, d.parent_customer) AS parent_customer_name,
-                COALESCE(u.bu_id, p.bu_id, d.bu_id) AS BU,
-                m.department_name, d_map.department_id, t_map.Tower,
-                
-                --ROUND(COALESCE(u.billed_fte, 0), 5) AS billed_fte, 
-                COALESCE(r.rel_count, 0) AS release_count,
-                COALESCE(a.attr_count, 0) AS attr_count,
-                COALESCE(d.dem_count, 0) AS open_demands, 
-                COALESCE(f.fulfil_count, 0) AS demands_fulfilled,
-                
-                -- ALL computed columns
-                ROUND(CAST(c.Cost AS DOUBLE), 5) AS std_cost,
-                
-                ROUND(COALESCE(p.prev_mon_billed_fte, 0), 5) AS prev_mon_billed_fte,
-                ROUND(COALESCE(p.prev_mon_total_fte, 0), 5) AS prev_mon_total_fte,
-                
-                ROUND((COALESCE(p.prev_mon_billed_fte, 0) + COALESCE(0.5 * demands_fulfilled, 0) + COALESCE(0.2 *open_demands, 0) - COALESCE(attr_count, 0) - COALESCE(release_count, 0) ), 5) AS eff_billed_fte,
-                ROUND((COALESCE(p.prev_mon_total_fte, 0) + COALESCE( demands_fulfilled, 0) + COALESCE(0.5 * open_demands, 0) - COALESCE(attr_count, 0) - COALESCE(release_count, 0) ), 5) AS eff_total_fte,
-                
-                ROUND((COALESCE(p.prev_mon_billed_fte, 0) * std_cost), 5) AS prev_billed_cost,
-                ROUND((COALESCE(p.prev_mon_total_fte, 0) * std_cost), 5) AS prev_mon_total_cost,
-                
-                ROUND((eff_billed_fte * std_cost), 5) AS proj_billed_cost,
-                ROUND((eff_total_fte * std_cost), 5) AS proj_total_cost,
-                
-                l_map.Country, l_map.Geo,
-                b_map.SBU, b_map.Market,
-                a_map."PDL ID",
-                a_map."PDL Name",
-                s_map."SBU Head ID",
-                s_map."SBU Head Name"
-                
-            FROM master_keys m
-            LEFT JOIN dept_map d_map ON m.department_name = d_map.department_name
-            LEFT JOIN map_tower t_map ON d_map.department_id = t_map."Department ID"
-            LEFT JOIN util_summarized u ON m."Project Id" = u."Project Id" AND m.Practice = u.Practice AND m.Location = u.Location AND m.Grade = u.Grade AND m.department_name = u.department_name
-            LEFT JOIN previous_util p ON m."Project Id" = p."Project Id" AND m.Practice = p.Practice AND m.Location = p.Location AND m.Grade = p.Grade AND m.department_name = p.department_name
-            LEFT JOIN demand_summary d ON m."Project Id" = d."Project Id" AND m.Practice = d.Practice AND m.Location = d.Location AND m.Grade = d.Grade AND m.department_name = d.department_name
-            -- IMPORTANT: Join map tables to m (master) or COALESCE values to ensure they work for closed projects
-            LEFT JOIN map_location l_map ON m.Location = l_map."Utilization Location"
-            LEFT JOIN cost_file c ON m.Practice = c.Practice AND l_map.Country = c.Country AND m.Grade = c."Grade name"
-            LEFT JOIN map_bu b_map ON COALESCE(u.bu_id, p.bu_id, d.bu_id) = b_map.BU
-            LEFT JOIN map_sbu s_map ON b_map.SBU = s_map.SBU
-            LEFT JOIN map_account_unique a_map ON COALESCE(u.account_id, p.account_id) = a_map."Account ID"
-            -- Demand and Release still join to m/u/p logic
-            LEFT JOIN fulfilment_summary f ON m."Project Id" = f."Project Id" AND m.Practice = f.Practice AND m.Location = f.Location AND m.Grade = f.Grade AND m.department_name = f.department_name
-            LEFT JOIN attrition_summary a ON m."Project Id" = a."Project Id" AND m.Practice = a.Practice AND m.Location = a.Location AND m.Grade = a.Grade AND m.department_name = a.department_name
-            LEFT JOIN release_summary r ON m."Project Id" = r."Project Id" AND m.Practice = r.Practice AND m.Location = r.Location AND m.Grade = r.Grade AND m.department_name = r.department_name;
+    except Exception as e:
+        st.error(f"Failed to generate report: {e}")
 
-    """
+@st.cache_data(show_spinner=False)
+def load_scenario_base(version):
+    """Weight-independent what-if coefficients, recomputed only when the master report changes."""
+    with get_db_con_ro() as con:
+        return build_scenario_base(con)
 
+def render_scenario_preview(f_weight, d_weight, d_total_weight):
+    with get_db_con_ro() as con:
+        version = report_version(con)
+    if not version:
+        st.caption(f"Build {MASTER_REPORT} to preview projected cost.")
+        return
+    base = load_scenario_base(version)
+    scenario = evaluate_grid(base, [f_weight], [d_weight], d_total_weight).iloc[0]
+    prev_cost = base["prev_billed_cost"].sum()
+    st.metric(
+        "Projected billed cost", f"{scenario.proj_billed_cost:,.0f}",
+        delta=f"{scenario.proj_billed_cost - prev_cost:,.0f} vs previous month", delta_color="inverse"
+    )
+    st.metric("Effective billed FTE", f"{scenario.eff_billed_fte:,.1f}")
+    st.metric("Effective total FTE", f"{scenario.eff_total_fte:,.1f}")
+
+def profiled_refresh(con, force=False, weights=None):
+    """refresh_master_report with its time and the build statement's DuckDB profile recorded in the metrics table."""
+    started = time.perf_counter()
+    with profiling(con), PeakRss() as peak:
+        refresh = refresh_master_report(con, force=force, weights=weights)
+    if refresh["mode"] != "fresh":
+        get_metrics(db_path).record("master_report", time.perf_counter() - started, profile=refresh["profile"],
+                                    detail=f"{refresh['mode']}, {refresh['projects']:,} projects", peak=peak)
+    return refresh
+
+def refresh_master_report_if_stale(con, warn=st.warning):
+    """Re-syncs the materialized master report after a load; a no-op until it has been built once."""
+    if not is_materialized(con):
+        return None
     try:
-        with get_db_con() as con:
-            con.execute(sql)
-        st.success("🚀 Master Project Report Generated!")
-        st.toast("AI Context Updated with  Project-level insights.")
-        st.rerun()
-
+        return profiled_refresh(con)
     except Exception as e:
-        st.error(f"Failed to generate report: {e}")
+        warn(f"Master report not refreshed: {e}")
+        return None
+
 def create_pdl_summary_view():
     """
     Aggregates the Dashboard into PDL-level summary.
@@ -386,23 +402,35 @@ def render_table_group(table_list, key_prefix):
             st.rerun()
     return selected
 
+def reload_table_job(uploaded_file, table_name, key_columns, report):
+    """Background job: replaces (or merges into) one table from a validated upload."""
+    report(f"Loading {uploaded_file.name} into {table_name} ...")
+    with get_db_con() as con:
+        result = ingest_excel(con, uploaded_file, table_name, key_columns=key_columns)
+        if not result.skipped:
+            snapshot_loads(con, [table_name], snapshot_dir(db_path))
+        refresh_master_report_if_stale(con, warn=report)
+    invalidate_tables([table_name])
+    if result.skipped:
+        summary = f"{uploaded_file.name} is already loaded into {table_name}; nothing to do."
+    elif result.delta:
+        summary = describe_delta(result)
+    else:
+        summary = f"Table {table_name} updated: {result.rows:,} rows ({result.rows_per_sec:,.0f} rows/sec)"
+    return {"summary": summary}
+
 @st.dialog("Schema Validator", width="large")
 def upload_and_validate_dialog(table_name):
     st.write(f"Updating data for: **{table_name}**")
 
-    with get_db_con_ro() as con:
-        schema_df = con.execute(f"DESCRIBE {table_name}").df()
-        required_cols = set(schema_df['column_name'].tolist())
+    required_cols = {name for name, _ in get_catalog(db_path).columns(table_name)}
 
     st.info(f"Required Columns: {', '.join(required_cols)}")
     uploaded_file = st.file_uploader("Upload updated Excel file", type=["xlsx", "xlsb"])
 
     if uploaded_file:
         try:
-            df_new = pd.read_excel(uploaded_file, engine='calamine', dtype=str)
-            df_new.columns = df_new.columns.str.strip()
-            df_new['load_date'] = pd.Timestamp.now(tz='Asia/Kolkata').strftime('%Y-%m-%d %H:%M:%S %Z')
-            uploaded_cols = set(df_new.columns)
+            uploaded_cols = set(read_header(uploaded_file)) | {"load_date"}
             st.info(f"Uploaded file columns: {uploaded_cols}")
             missing = required_cols - uploaded_cols
             extra = uploaded_cols - required_cols
@@ -414,10 +442,20 @@ def upload_and_validate_dialog(table_name):
                 st.success("✅ **Validation Passed!** All required columns are present.")
                 if extra:
                     st.caption(f"Note: Extra columns found and will be included: {', '.join(extra)}")
-                if st.button("Confirm & Overwrite Table", type="primary"):
-                    with get_db_con() as con:
-                        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df_new")
-                    st.toast(f"Table {table_name} updated successfully!")
+                mode = st.radio("Load mode", ["Overwrite", "Incremental"], horizontal=True)
+                key_columns = None
+                if mode == "Incremental":
+                    key_columns = st.multiselect(
+                        "Business key",
+                        sorted(required_cols - {"load_date"}),
+                        default=INCREMENTAL_KEYS.get(table_name),
+                        help="Rows are matched on these columns; only new, changed and removed keys are written"
+                    )
+                if st.button(f"Confirm & {'Merge into' if key_columns else 'Overwrite'} Table", type="primary"):
+                    track_job(get_runner(db_path).submit(
+                        "ingest", f"Reload {table_name}", reload_table_job, uploaded_file, table_name, key_columns
+                    ))
+                    st.toast(f"Reloading {table_name} in the background ...")
                     st.rerun()
 
         except Exception as e:
@@ -438,6 +476,8 @@ def confirm_delete_dialog(table_name):
                     con.execute(f'DROP VIEW IF EXISTS "{table_name}"')
                 else:
                     con.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                reset_incremental(con, table_name)
+            get_catalog(db_path).invalidate([table_name, history_table(table_name)])
             del st.session_state.confirm_delete
             st.toast(f"Removed {table_name}")
             st.rerun()
@@ -449,13 +489,45 @@ def confirm_delete_dialog(table_name):
         del st.session_state.confirm_delete
         st.rerun()
 
+def render_export(table_name, columns, search_query):
+    """Builds downloads on request only; files are cached per table data version."""
+    export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+    with get_db_con_ro() as con:
+        version = data_version(con, [table_name])
+    path = ready_export(table_name, export_format, version, search_query)
+    pending = pending_export(db_path, table_name, export_format, version, search_query)
+
+    if path:
+        with open(path, "rb") as f:
+            st.download_button(
+                label=f"Save {export_format.upper()}",
+                data=f,
+                type="primary",
+                file_name=f"{table_name}_download.{export_format}",
+                mime=EXPORT_FORMATS[export_format],
+                width="stretch"
+            )
+    elif pending is not None and pending.active:
+        st.info("Writing the Excel file in the background ...")
+        if st.button("Check again", width="stretch"):
+            st.rerun(scope="fragment")
+    else:
+        if pending is not None and pending.error:
+            st.error(f"Export failed: {pending.error}")
+        if st.button("Prepare file", width="stretch"):
+            if export_format == "xlsx":
+                request_export(db_path, table_name, columns, export_format, version, search_query)
+            else:
+                # CSV and Parquet are written by DuckDB's COPY directly, fast enough to wait for
+                build_export(db_path, table_name, columns, export_format, version, search_query)
+            st.rerun(scope="fragment")
+
 @st.dialog("Table Preview", width="large")
 def preview_table_dialog(table_name):
     st.write(f"Showing rows from **{table_name}**")
 
     try:
-        with get_db_con_ro() as con:
-            df_preview = con.execute(f'SELECT * FROM "{table_name}"').df()
+        columns = [name for name, _ in get_catalog(db_path).columns(table_name)]
         
         col1, col2 = st.columns([3, 1], vertical_alignment="bottom")
         with col1:
@@ -464,29 +536,21 @@ def preview_table_dialog(table_name):
                   placeholder="Type to filter...",
                   label_visibility="visible"
                   )
-        if search_query:
-            mask = df_preview.apply(lambda row: row.astype(str).str.contains(search_query, case=False).any(), axis=1)
-            df_display = df_preview[mask]
-        else:
-            df_display = df_preview
+
+        # Counting, searching and paging all run in DuckDB; only the visible page reaches pandas
+        with get_db_con_ro() as con:
+            total_rows = count_rows(con, table_name, columns)
+            matching_rows = count_rows(con, table_name, columns, search_query) if search_query else total_rows
+            pages = max(1, (matching_rows - 1) // PREVIEW_PAGE_SIZE + 1)
+            page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1) - 1
+            df_display = fetch_page(con, table_name, columns, page, PREVIEW_PAGE_SIZE, search_query)
         
         with col2:
-            if not df_display.empty:
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                    df_display.to_excel(writer, index=False, sheet_name='Ops-Data')
-            
-            st.download_button(
-                label="📥Download",
-                data=buffer.getvalue(),
-                type="primary",
-                file_name=f"{table_name}_download.xlsx",
-                mime="application/vnd.ms-excel",
-                width="stretch"
-            )
-        st.write(f"Showing {len(df_display)} of {len(df_preview)} records")
+            with st.popover("📥Download", width="stretch", disabled=not matching_rows):
+                render_export(table_name, columns, search_query)
+        st.write(f"Showing {len(df_display)} of {matching_rows:,} matching records ({total_rows:,} in total)")
 
-        if not df_preview.empty:
+        if total_rows:
             st.dataframe(df_display, width="stretch", hide_index=True)
         else:
             st.info("This table is currently empty.")
@@ -508,6 +572,7 @@ with st.sidebar:
     # --- ZONE 1: INGESTION ---
     with st.expander("📤 Upload New Data", expanded=False):
         data_ingestion_ui()
+    render_jobs()
     
     #st.divider()
    
@@ -517,7 +582,7 @@ with st.sidebar:
     all_tables = get_all_tables()
 
     # Categorize tables based on namming conventions
-    transactions = [t for t in all_tables if not t.startswith(('map_', '_ref', 'v_','dashboard','archive', 'arv','pdl_summary'))]
+    transactions = [t for t in all_tables if not t.startswith(('map_', '_', 'v_','dashboard','archive', 'arv','pdl_summary'))]
     lookups = [t  for t in all_tables if t.startswith('map_')]
     views = [t for t in all_tables if t.startswith(('pdl', 'dashboard'))]
 
@@ -530,20 +595,34 @@ with st.sidebar:
         selected_lookups = render_table_group(lookups, "look")
 
     with st.expander("⚙️ Adjust Weights", expanded=False):
+        # Defaults are the weights the master report itself uses
         st.session_state.fulfilment_weight = st.slider(
-                "Fulfillment %", 0.0, 1.0, 0.2, 0.1,
-                help="Weightage for fulfilled demands in Effective FTE"
+                "Fulfillment % (billed)", 0.0, 1.0, FULFILLED_BILLED_WEIGHT, 0.1,
+                help="Weightage for fulfilled demands in effective billed FTE"
         )
         st.session_state.demand_weight = st.slider(
-                "Open Demand %", 0.0, 1.0, 0.5, 0.1,
-                help="Weightage for open demands in effective FTE"
+                "Open Demand % (billed)", 0.0, 1.0, OPEN_BILLED_WEIGHT, 0.1,
+                help="Weightage for open demands in effective billed FTE"
+        )
+        st.session_state.total_demand_weight = st.slider(
+                "Open Demand % (total)", 0.0, 1.0, OPEN_TOTAL_WEIGHT, 0.1,
+                help="Weightage for open demands in effective total FTE"
         )
+        render_scenario_preview(st.session_state.fulfilment_weight, st.session_state.demand_weight,
+                                st.session_state.total_demand_weight)
 
     st.subheader("🗄️ Aggreagated Data")
 
     # 2c. Final Reports (Views)
     with st.expander("🚀 Analytics Views", expanded=False):
         selected_views = render_table_group(views, "view")
+        if st.button(f"🪄 Rebuild {MASTER_REPORT}", width="stretch",
+                     help="Materializes the master report with the weights above; later uploads refresh only what changed"):
+            create_master_report_view(
+                f_weight=st.session_state.fulfilment_weight,
+                d_weight=st.session_state.demand_weight,
+                d_total_weight=st.session_state.total_demand_weight
+            )
 
     # Final combined list for AI context
     selected_tables = selected_transactions + selected_lookups + selected_views
@@ -574,12 +653,17 @@ with st.sidebar:
         url = "http://20.84.61.96:6006"
         #st.success("Observability Engine: Online")
         st.link_button("🕵️ Agent Observability", url, type="primary")
+    with st.expander("⏱️ Performance"):
+        render_metrics()
     with st.expander("🛠️ SQL Console"):
         query = st.text_area("Paste your Query here:", height=150)
         if st.button("Run Query"):
             with get_db_con() as con:
                 res = con.execute(query).df()
                 st.dataframe(res)
+                # Console statements can change anything, so cached catalog entries and answers are dropped.
+                bump_data_epoch(con)
+            get_catalog(db_path).invalidate()
 
 if "confirm_delete" in st.session_state:
     confirm_delete_dialog(st.session_state.confirm_delete)
@@ -594,12 +678,26 @@ if "preview_table" in st.session_state and st.session_state.preview_table:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+def render_full_result(result_path, total_rows, key):
+    """Pages through a spilled query result and offers it for download."""
+    if not result_path or not os.path.exists(result_path):
+        return
+    with st.expander(f"📄 Full result ({total_rows:,} rows)"):
+        page_size = 100
+        pages = (total_rows - 1) // page_size + 1
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"page_{key}")
+        with get_db_con_ro() as con:
+            st.dataframe(read_page(con, result_path, page - 1, page_size), width="stretch", hide_index=True)
+        with open(result_path, "rb") as f:
+            st.download_button("📥 Download (Parquet)", f, file_name="query_result.parquet", key=f"dl_{key}")
+
 # Display history
-for msg in st.session_state.messages:
+for i, msg in enumerate(st.session_state.messages):
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
         if msg.get("chart") is not None:
             st.altair_chart(msg["chart"], use_container_width=True)
+        render_full_result(msg.get("result_path"), msg.get("total_rows", 0), key=i)
 
 # Handle Input
 if prompt := st.chat_input("Ask a question about the selected data ..."):
@@ -617,34 +715,101 @@ if prompt := st.chat_input("Ask a question about the selected data ..."):
             # Pass the list of selected tables to the agent
             inputs = {
                 "question": prompt,
-                "active_tables": selected_tables
+                "active_tables": selected_tables,
+                "run_id": new_run_id()
             }
             
             final_response = ""
             current_chart = None
-
-            try:
-                # Stream the graph updates
-                
-                for step in agent_app.stream(inputs):
+            result_meta = {}
+            sql_query = ""
+            # Filled in while the answer streams; ttft is the time to the first summary token
+            run = {"started": time.perf_counter(), "ttft": None, "sql_query": "", "result_meta": {}, "final_response": "",
+                   "chart": None}
+
+            def answer_tokens():
+                """Renders node updates into the status box and yields summary tokens to st.write_stream."""
+                for kind, payload in stream_with_tokens(inputs):
+                    if kind == "token":
+                        if run["ttft"] is None:
+                            run["ttft"] = time.perf_counter() - run["started"]
+                        yield payload
+                        continue
+                    step = payload
                     if "generate_query" in step:
                         #status_container.write(f" User Question : {prompt}")
-                        status_container.write(f" Generated SQL for : `{step['generate_query']['sql_query']}`")
-                    # if "execute_query" in step:
-                    #     status_container.write("Executed Query in Local DuckDB Database")
-                    # if "generate_plot" in step:
-                    #     current_chart = step['generate_plot'].get('chart_spec')
-                    #     if current_chart:
-                    #         status_container.write("✅ Visualization generated")
+                        run["sql_query"] = step['generate_query']['sql_query']
+                        if step['generate_query'].get('sql_source') == "template":
+                            status_container.write(f" Reused SQL template : `{run['sql_query']}`")
+                        else:
+                            status_container.write(f" Generated SQL for : `{run['sql_query']}`")
+                        if step['generate_query'].get('schema_tokens_saved'):
+                            status_container.write(f" Schema context: ~{step['generate_query']['schema_tokens']:,} tokens "
+                                                   f"(~{step['generate_query']['schema_tokens_saved']:,} saved)")
+                    if "execute_query" in step:
+                        run["result_meta"] = step["execute_query"]
+                        if run["result_meta"].get("error"):
+                            status_container.write(f"⚠️ Query failed, repairing : {run['result_meta']['error']}")
+                        elif run["result_meta"].get("result_path"):
+                            status_container.write(f"Large result ({run['result_meta']['total_rows']:,} rows) summarized for the AI")
+                    if "generate_plot" in step:
+                        run["chart"] = step['generate_plot'].get('chart_spec')
+                        if run["chart"] is not None:
+                            status_container.write("✅ Visualization generated")
                     if "summerize" in step:
-                        final_response = step['summerize']['messages'][0]
-                
-                status_container.update(label="Analysis Complete !", state="complete", expanded=False)
-                st.markdown(final_response)
+                        run["final_response"] = step['summerize']['messages'][0]
+                    if "report_error" in step:
+                        run["final_response"] = step['report_error']['messages'][0]
+
+            try:
+                # Repeat questions over unchanged tables are answered without calling the LLM.
+                # Memoized so a lookup miss and the later store share one embedding call.
+                embed = functools.lru_cache(maxsize=1)(embed_question) if embeddings is not None else None
+                with get_db_con_ro() as con:
+                    version = data_version(con, selected_tables)
+                    cached = answer_cache.lookup(con, prompt, selected_tables, version, embed)
+
+                if cached:
+                    with get_manager(db_path).bookkeeping() as con:
+                        answer_cache.record_hit(con, cached["cache_key"])
+                    final_response = cached["answer"]
+                    current_chart = answer_cache.chart_from_json(cached["chart_json"])
+                    result_meta = {"result_path": cached["result_path"], "total_rows": cached["total_rows"]}
+                    status_container.write(f" Answered from cache (SQL: `{cached['sql_query']}`)")
+                    st.markdown(final_response)
+                else:
+                    # Stream the summary token by token; the graph updates go to the status box meanwhile
+                    streamed = st.write_stream(answer_tokens())
+                    final_response = run["final_response"] or streamed
+                    metrics = get_metrics(db_path)
+                    metrics.record("question", time.perf_counter() - run["started"], run_id=inputs["run_id"])
+                    if run["ttft"] is not None:
+                        metrics.record("ttft", run["ttft"], run_id=inputs["run_id"])
+                    if not streamed:
+                        st.markdown(final_response)
+                    sql_query, result_meta, current_chart = run["sql_query"], run["result_meta"], run["chart"]
+                    if not result_meta.get("result_str", "").startswith("Error:"):
+                        with get_manager(db_path).bookkeeping() as con:
+                            answer_cache.store(
+                                con, prompt, selected_tables, version, final_response, sql_query,
+                                answer_cache.chart_to_json(current_chart), result_meta.get("result_path"),
+                                result_meta.get("total_rows", 0), embed
+                            )
+
+                label = "Analysis Complete !"
+                if run["ttft"] is not None:
+                    label += f" (first words in {run['ttft']:.1f}s)"
+                status_container.update(label=label, state="complete", expanded=False)
                 if current_chart:
                     st.altair_chart(current_chart, width="stretch")
+                render_full_result(result_meta.get("result_path"), result_meta.get("total_rows", 0),
+                                   key=len(st.session_state.messages))
                 
-                st.session_state.messages.append({"role":"assistant", "content": final_response, "chart": current_chart})
+                st.session_state.messages.append({
+                    "role":"assistant", "content": final_response, "chart": current_chart,
+                    "result_path": result_meta.get("result_path"), "total_rows": result_meta.get("total_rows", 0),
+                    "ttft": run["ttft"]
+                })
             
             except Exception as e:
                 st.error(f"An error occurred: {e}")
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""Compares two bench.run result files measurement by measurement.
+
+    python -m bench.compare before.json after.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+# Keys holding a time in seconds; everything else in the results is context
+TIME_KEYS = ("median", "seconds")
+
+
+def timings(results: dict, prefix: str = "") -> Dict[str, float]:
+    """Flattens nested results to {"stage.measurement": seconds}."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            time_key = next((k for k in TIME_KEYS if isinstance(value.get(k), (int, float))), None)
+            if time_key:
+                flat[path] = value[time_key]
+            flat.update(timings({k: v for k, v in value.items() if isinstance(v, dict)}, path))
+    return flat
+
+
+def compare(before: dict, after: dict, threshold: float = 0.1) -> List[dict]:
+    """One row per measurement present in both runs; "change" is after/before - 1."""
+    old, new = timings(before["results"]), timings(after["results"])
+    rows = []
+    for path in sorted(old.keys() & new.keys()):
+        change = new[path] / old[path] - 1 if old[path] else None
+        flag = "" if change is None or abs(change) < threshold else ("slower" if change > 0 else "faster")
+        rows.append({"measurement": path, "before": old[path], "after": new[path], "change": change, "flag": flag})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.compare", description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change worth flagging")
+    args = parser.parse_args(argv)
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    for label, run in (("before", before), ("after", after)):
+        env = run["environment"]
+        print(f"{label}: {(env['commit'] or '?')[:10]}{' (dirty)' if env['dirty'] else ''} "
+              f"scale {env['scale']:g}, {env['timestamp']}")
+    if before["environment"]["scale"] != after["environment"]["scale"]:
+        print("warning: the runs used different scales", file=sys.stderr)
+
+    rows = compare(before, after, args.threshold)
+    width = max((len(r["measurement"]) for r in rows), default=20)
+    print(f"\n{'measurement':<{width}}  {'before':>10}  {'after':>10}  {'change':>8}")
+    for r in rows:
+        change = "n/a" if r["change"] is None else f"{r['change']:+.1%}"
+        print(f"{r['measurement']:<{width}}  {r['before']:>10.4f}  {r['after']:>10.4f}  {change:>8}  {r['flag']}")
+    return 1 if any(r["flag"] == "slower" for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""Benchmarks ingestion, the master report, preview search and the agent nodes on synthetic data.
+
+    python -m bench.run --scale 10 --out bench_results.json
+    python -m bench.compare before.json after.json
+
+Everything runs against a scratch database under --work-dir; the LLM is replaced by a stub
+that returns canned SQL and summaries, so agent timings exclude the model and the network.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import duckdb
+
+from bench import synthetic
+from src.db import ConnectionManager, get_manager
+from src.ingestion import ingest_uploads, load_date_stamp
+from src.master_report import MASTER_REPORT, refresh_master_report
+from src.preview import PAGE_SIZE, count_rows, fetch_page
+
+STAGES = ["generate", "ingest", "master_report", "pdl_summary", "preview", "agent"]
+
+# The app's pdl_summary view, over the columns the materialized master report has
+PDL_SUMMARY_SQL = f"""
+    SELECT
+        "PDL Name",
+        parent_customer_name,
+        ANY_VALUE(Practice) AS practice,
+        ANY_VALUE(project_type) AS project_type,
+        ANY_VALUE(Grade) AS grade,
+        ROUND(SUM(prev_mon_billed_fte)) AS last_bfte,
+        ROUND(SUM(prev_mon_total_cost)/NULLIF(last_bfte,0)) AS prev_cost_per_bfte,
+        ROUND(SUM(proj_total_cost)/NULLIF(last_bfte,0)) AS projected_cost_per_bfte,
+        (projected_cost_per_bfte - prev_cost_per_bfte) AS diff
+    FROM {MASTER_REPORT}
+    GROUP BY 1, 2
+    ORDER BY "PDL Name", parent_customer_name
+"""
+
+# Searches typed into the preview dialog: a common value, a rare one and a miss
+PREVIEW_SEARCHES = ["Chennai", "Project 0042", "no such value"]
+PREVIEW_TABLES = ["utilization_prediction_report", MASTER_REPORT]
+
+# (question, SQL the stub answers with); covers the roll-up, detail aggregates and a wide listing
+AGENT_QUESTIONS = [
+    ("What is the projected billed cost by SBU?",
+     f"SELECT SBU, proj_billed_cost FROM {MASTER_REPORT}_rollup WHERE grouping_level = 'SBU' ORDER BY 2 DESC"),
+    ("Show open demands by practice",
+     f"SELECT Practice, SUM(open_demands) AS open_demands FROM {MASTER_REPORT} GROUP BY 1 ORDER BY 2 DESC"),
+    ("Top 20 parent customers by previous month billed FTE",
+     f"SELECT parent_customer_name, SUM(prev_mon_billed_fte) AS prev_mon_billed_fte FROM {MASTER_REPORT} "
+     f"GROUP BY 1 ORDER BY 2 DESC LIMIT 20"),
+    ("List the projects with attrition in Chennai",
+     f"SELECT \"Project Id\", project_name, Grade, attr_count FROM {MASTER_REPORT} "
+     f"WHERE Location ILIKE '%Chennai%' AND attr_count > 0"),
+]
+STUB_SUMMARY = "Here is the breakdown you asked for; the largest values are listed first."
+
+
+class StubLLM:
+    """Stands in for the Gemini chain: canned SQL for AGENT_QUESTIONS, a fixed summary otherwise."""
+
+    def __init__(self, answers: Dict[str, str]):
+        self.answers = answers
+        self.prompt_chars: List[int] = []
+
+    def invoke(self, prompt: str) -> str:
+        self.prompt_chars.append(len(prompt))
+        for question, sql in self.answers.items():
+            if f"USER QUESTION: {question}" in prompt:
+                return sql
+        return STUB_SUMMARY
+
+    async def ainvoke(self, prompt: str) -> str:
+        return self.invoke(prompt)
+
+
+class StubChatModel:
+    """Stands in for llm_config; structured output returns None, so charts fall back to the rules."""
+
+    def with_structured_output(self, schema):
+        return self
+
+    async def ainvoke(self, messages):
+        return None
+
+
+def measure(fn: Callable[..., Optional[dict]], repeat: int, setup: Optional[Callable[[], tuple]] = None) -> dict:
+    """Runs fn repeat times (after an untimed setup() each time, whose result is passed to fn).
+
+    Returns the wall times plus whatever fn returned on its last run.
+    """
+    runs, extra = [], {}
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        extra = fn(*args) or {}
+        runs.append(time.perf_counter() - start)
+    return {"runs": [round(r, 4) for r in runs], "min": round(min(runs), 4),
+            "median": round(statistics.median(runs), 4), **extra}
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(args) -> dict:
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "scale": args.scale,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _upload(path: str) -> io.BytesIO:
+    """An in-memory file shaped like Streamlit's UploadedFile, which is what ingestion reads."""
+    with open(path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    upload.name = os.path.basename(path)
+    return upload
+
+
+def bench_ingest(workbooks: List[str], work_dir: str, repeat: int) -> dict:
+    """Excel ingestion of every workbook into an empty database (so the ingest ledger never skips)."""
+    def setup():
+        path = os.path.join(work_dir, f"ingest_{time.monotonic_ns()}.duckdb")
+        return ConnectionManager(path), path, [_upload(p) for p in workbooks]
+
+    def run(manager, path, uploads):
+        try:
+            results = ingest_uploads(manager, uploads)
+        finally:
+            manager.close()
+            os.remove(path)
+        failed = [f"{r.source}: {r.error}" for r in results if r.error]
+        if failed:
+            raise RuntimeError("; ".join(failed))
+        return {"rows": sum(r.rows for r in results),
+                "bytes": sum(os.path.getsize(p) for p in workbooks)}
+
+    result = measure(run, repeat, setup)
+    result["rows_per_second"] = round(result["rows"] / result["median"]) if result["median"] else None
+    return result
+
+
+def bench_master_report(db_path: str, repeat: int) -> dict:
+    """Full rebuild, then a partial refresh after about 1% of projects change in the utilization report."""
+    manager = get_manager(db_path)
+
+    def full():
+        with manager.write() as con:
+            outcome = refresh_master_report(con, force=True)
+            rows = con.execute(f"SELECT COUNT(*) FROM {MASTER_REPORT}").fetchone()[0]
+        return {"rows": rows, "projects": outcome["projects"]}
+
+    def touch():
+        with manager.write() as con:
+            con.execute("""
+                UPDATE utilization_prediction_report SET "Total FTE" = round(random(), 2)
+                WHERE "Project Id" IN (
+                    SELECT "Project Id" FROM (SELECT DISTINCT "Project Id" FROM utilization_prediction_report)
+                    ORDER BY random()
+                    LIMIT (SELECT greatest(1, COUNT(DISTINCT "Project Id") // 100) FROM utilization_prediction_report))
+            """)
+        return ()
+
+    def partial():
+        with manager.write() as con:
+            outcome = refresh_master_report(con)
+        return {"mode": outcome["mode"], "projects": outcome["projects"]}
+
+    def fresh():
+        with manager.write() as con:
+            return {"mode": refresh_master_report(con)["mode"]}
+
+    return {"full": measure(full, repeat), "partial": measure(partial, repeat, touch), "fresh": measure(fresh, repeat)}
+
+
+def bench_pdl_summary(db_path: str, repeat: int) -> dict:
+    def run():
+        with get_manager(db_path).read() as con:
+            return {"rows": len(con.execute(PDL_SUMMARY_SQL).fetchall())}
+    return measure(run, repeat)
+
+
+def bench_preview(db_path: str, repeat: int) -> dict:
+    """What one keystroke in the preview search costs: the match count plus the first and a deep page."""
+    results = {}
+    with get_manager(db_path).read() as con:
+        for table in PREVIEW_TABLES:
+            columns = [r[0] for r in con.execute(f'DESCRIBE "{table}"').fetchall()]
+            for search in [None] + PREVIEW_SEARCHES:
+                def run():
+                    matches = count_rows(con, table, columns, search)
+                    fetch_page(con, table, columns, 0, search=search)
+                    fetch_page(con, table, columns, max(0, matches // PAGE_SIZE - 1), search=search)
+                    return {"matches": matches}
+                results[f"{table}[{search or ''}]"] = measure(run, repeat)
+    return results
+
+
+def bench_agent(db_path: str, repeat: int) -> dict:
+    """Times each LangGraph node per question, then the whole graph, with the LLM stubbed out."""
+    # src.agent reads its configuration at import time
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    from src import agent
+    from src.query_templates import QUERY_TEMPLATES_TABLE, ensure_query_templates
+
+    stub = StubLLM(dict(AGENT_QUESTIONS))
+    agent.llm, agent.llm_config = stub, StubChatModel()
+    manager = get_manager(db_path)
+    tables = [MASTER_REPORT]
+
+    def forget_templates():
+        with manager.write() as con:
+            ensure_query_templates(con)
+            con.execute(f"DELETE FROM {QUERY_TEMPLATES_TABLE}")
+
+    nodes = {name: [] for name in ["generate_query", "generate_query_template", "execute_query",
+                                   "generate_plot", "summerize", "graph"]}
+    details = {}
+    for _ in range(repeat):
+        for question, _sql in AGENT_QUESTIONS:
+            forget_templates()
+            state = {"question": question, "active_tables": tables, "attempts": 0}
+            steps = [
+                ("generate_query", agent.generate_query_node),
+                ("execute_query", agent.execute_query_node),
+                ("generate_plot", lambda s: asyncio.run(agent.plotting_node(s))),
+                ("summerize", lambda s: asyncio.run(agent.summerize_insight_node(s))),
+                ("generate_query_template", agent.generate_query_node),
+            ]
+            for name, node in steps:
+                start = time.perf_counter()
+                update = node(state)
+                nodes[name].append(time.perf_counter() - start)
+                if name != "generate_query_template":
+                    state = {**state, **update}
+            if state.get("error"):
+                raise RuntimeError(f"{question}: {state['error']}")
+            details[question] = {"total_rows": state["total_rows"], "chart": state.get("chart_spec") is not None,
+                                 "schema_tokens": state.get("schema_tokens")}
+
+            forget_templates()
+            start = time.perf_counter()
+            for _update in agent.stream({"question": question, "active_tables": tables, "attempts": 0}):
+                pass
+            nodes["graph"].append(time.perf_counter() - start)
+
+    return {
+        "nodes": {name: {"median": round(statistics.median(runs), 4), "max": round(max(runs), 4), "calls": len(runs)}
+                  for name, runs in nodes.items()},
+        "questions": details,
+        "llm_calls": len(stub.prompt_chars),
+        "prompt_chars_median": int(statistics.median(stub.prompt_chars)) if stub.prompt_chars else 0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"headcount multiplier (1 = {synthetic.BASE_ASSOCIATES:,} associates)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement")
+    parser.add_argument("--only", nargs="+", choices=STAGES, help="run only these stages")
+    parser.add_argument("--skip", nargs="+", choices=STAGES, default=[], help="skip these stages")
+    parser.add_argument("--workbooks", help="ingest the .xlsx/.xlsb files in this directory instead of "
+                                            "generated workbooks (e.g. real exports saved as xlsb)")
+    parser.add_argument("--work-dir", help="scratch directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--out", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    stages = [s for s in (args.only or STAGES) if s not in args.skip]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ops_assist_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    db_path = os.path.join(work_dir, "bench.duckdb")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    report = {"environment": environment(args), "stages": stages, "results": {}}
+    results = report["results"]
+
+    def log(message: str):
+        print(f"[bench] {message}", file=sys.stderr, flush=True)
+
+    try:
+        log(f"generating scale {args.scale:g} ...")
+        start = time.perf_counter()
+        frames = synthetic.generate(args.scale, args.seed)
+        if "generate" in stages:
+            results["generate"] = {"seconds": round(time.perf_counter() - start, 4)}
+        report["rows"] = {table: len(df) for table, df in frames.items()}
+        with get_manager(db_path).write() as con:
+            synthetic.load_tables(con, frames, load_date_stamp())
+
+        if "ingest" in stages:
+            if args.workbooks:
+                workbooks = sorted(os.path.join(args.workbooks, f) for f in os.listdir(args.workbooks)
+                                   if f.lower().endswith((".xlsx", ".xlsb")))
+            else:
+                log("writing workbooks ...")
+                start = time.perf_counter()
+                workbooks = synthetic.write_workbooks(frames, os.path.join(work_dir, "workbooks"))
+                results["write_workbooks"] = {"seconds": round(time.perf_counter() - start, 4)}
+            log(f"ingesting {len(workbooks)} workbooks ...")
+            results["ingest"] = bench_ingest(workbooks, work_dir, args.repeat)
+        del frames
+
+        if {"master_report", "pdl_summary", "preview", "agent"} & set(stages):
+            log("building the master report ...")
+            master = bench_master_report(db_path, args.repeat)
+            if "master_report" in stages:
+                results["master_report"] = master
+        if "pdl_summary" in stages:
+            log("pdl_summary ...")
+            results["pdl_summary"] = bench_pdl_summary(db_path, args.repeat)
+        if "preview" in stages:
+            log("preview search ...")
+            results["preview"] = bench_preview(db_path, args.repeat)
+        if "agent" in stages:
+            log("agent nodes ...")
+            results["agent"] = bench_agent(db_path, args.repeat)
+    finally:
+        get_manager(db_path).close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+        log(f"results written to {args.out}")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Headcount at scale 1; every other table is sized relative to it.
+BASE_ASSOCIATES = 5_000
+ASSOCIATES_PER_PROJECT = 10
+PROJECTS_PER_ACCOUNT = 5
+ACCOUNTS_PER_PARENT = 3
+
+# Monthly movement as a share of headcount
+DEMAND_RATE = 0.08
+FULFILMENT_RATE = 0.04
+RELEASE_RATE = 0.03
+ATTRITION_RATE = 0.02
+# Share of last month's associates no longer on the report this month
+CHURN_RATE = 0.05
+
+XLSX_MAX_ROWS = 1_048_575
+
+PRACTICES = ["Data", "Cloud", "Testing", "Digital", "Security", "ERP", "Infra", "AI", "Mobility", "CRM", "BPS", "IoT"]
+LOCATIONS = {
+    "Chennai": ("India", "APAC"), "Bangalore": ("India", "APAC"), "Pune": ("India", "APAC"),
+    "Hyderabad": ("India", "APAC"), "Kolkata": ("India", "APAC"), "Manila": ("Philippines", "APAC"),
+    "London": ("United Kingdom", "EMEA"), "Frankfurt": ("Germany", "EMEA"), "Warsaw": ("Poland", "EMEA"),
+    "Budapest": ("Hungary", "EMEA"), "New Jersey": ("United States", "NA"), "Dallas": ("United States", "NA"),
+    "Phoenix": ("United States", "NA"), "Toronto": ("Canada", "NA"), "Guadalajara": ("Mexico", "LATAM"),
+}
+GRADES = ["PA", "PAT", "A", "SA", "M", "SM", "AD", "D", "SD"]
+PROJECT_TYPES = ["FP", "T&M", "Support", "Internal"]
+BILLABILITY = ["Billable", "Non-Billable"]
+TOWERS = ["Application Development", "Application Maintenance", "Testing", "Infrastructure",
+          "Data & Analytics", "Consulting", "Business Process", "Enterprise Apps"]
+MARKETS = ["North America", "Europe", "Growth Markets"]
+N_SBUS = 9
+N_BUS = 30
+N_DEPARTMENTS = 60
+N_PDLS = 40
+
+UTILIZATION_COLUMNS = [
+    "Associate ID", "Project Id", "Practice", "Utilization Location", "Grade Name", "HCM Department Name",
+    "HCM Department ID", "Billed FTE Internal", "Total FTE", "BU", "Customer Id", "Project Name",
+    "Project Type", "Project Billability", "Customer Name", "ParentCustomerID", "Parent Customer", "Is Onsite",
+]
+
+
+def _ids(prefix: str, n: int) -> np.ndarray:
+    return np.array([f"{prefix}{i:0{max(4, len(str(n)))}d}" for i in range(1, n + 1)])
+
+
+def _projects(rng: np.random.Generator, n_projects: int) -> pd.DataFrame:
+    """One row per project with the account hierarchy and BU it belongs to."""
+    n_accounts = max(1, n_projects // PROJECTS_PER_ACCOUNT)
+    n_parents = max(1, n_accounts // ACCOUNTS_PER_PARENT)
+    account = rng.integers(0, n_accounts, n_projects)
+    parent = account % n_parents
+    bu = account % N_BUS
+    project_ids = _ids("P", n_projects)
+    return pd.DataFrame({
+        "Project Id": project_ids,
+        "Project Name": [f"Project {p[1:]}" for p in project_ids],
+        "Project Type": rng.choice(PROJECT_TYPES, n_projects, p=[0.35, 0.4, 0.2, 0.05]),
+        "Project Billability": rng.choice(BILLABILITY, n_projects, p=[0.85, 0.15]),
+        "BU": [f"BU{b + 1:02d}" for b in bu],
+        "Customer Id": [f"C{a + 1:05d}" for a in account],
+        "Customer Name": [f"Customer {a + 1}" for a in account],
+        "ParentCustomerID": [f"PC{p + 1:05d}" for p in parent],
+        "Parent Customer": [f"Parent Customer {p + 1}" for p in parent],
+        # Projects staff mostly from one practice and a couple of locations
+        "_practice": rng.integers(0, len(PRACTICES), n_projects),
+        "_location": rng.integers(0, len(LOCATIONS), n_projects),
+    })
+
+
+def _staffing(rng: np.random.Generator, projects: pd.DataFrame, n: int) -> pd.DataFrame:
+    """n rows assigned to projects (skewed, a few large programmes), with practice, location, grade and department."""
+    weights = rng.pareto(1.5, len(projects)) + 1
+    rows = projects.iloc[rng.choice(len(projects), n, p=weights / weights.sum())].reset_index(drop=True)
+    locations = list(LOCATIONS)
+    same = rng.random(n) < 0.8
+    practice = np.where(same, rows["_practice"], rng.integers(0, len(PRACTICES), n))
+    location = np.where(rng.random(n) < 0.7, rows["_location"], rng.integers(0, len(locations), n))
+    department = (practice * 5 + rng.integers(0, 5, n)) % N_DEPARTMENTS
+    rows["Practice"] = np.array(PRACTICES)[practice]
+    rows["Location"] = np.array(locations)[location]
+    rows["Grade"] = rng.choice(GRADES, n, p=[0.12, 0.15, 0.25, 0.2, 0.12, 0.08, 0.04, 0.03, 0.01])
+    rows["Department Name"] = [f"Dept {d + 1:02d}" for d in department]
+    rows["Department ID"] = [f"D{d + 1:03d}" for d in department]
+    return rows
+
+
+def _utilization(rng: np.random.Generator, staffing: pd.DataFrame, associates: np.ndarray) -> pd.DataFrame:
+    n = len(staffing)
+    billable = staffing["Project Billability"].eq("Billable").to_numpy()
+    total = np.where(rng.random(n) < 0.9, 1.0, 0.5)
+    return pd.DataFrame({
+        "Associate ID": associates,
+        "Project Id": staffing["Project Id"],
+        "Practice": staffing["Practice"],
+        "Utilization Location": staffing["Location"],
+        "Grade Name": staffing["Grade"],
+        "HCM Department Name": staffing["Department Name"],
+        "HCM Department ID": staffing["Department ID"],
+        "Billed FTE Internal": np.where(billable & (rng.random(n) < 0.9), total, 0.0),
+        "Total FTE": total,
+        "BU": staffing["BU"],
+        "Customer Id": staffing["Customer Id"],
+        "Project Name": staffing["Project Name"],
+        "Project Type": staffing["Project Type"],
+        "Project Billability": staffing["Project Billability"],
+        "Customer Name": staffing["Customer Name"],
+        "ParentCustomerID": staffing["ParentCustomerID"],
+        "Parent Customer": staffing["Parent Customer"],
+        "Is Onsite": np.where(staffing["Location"].map(lambda l: LOCATIONS[l][0] != "India"), "Y", "N"),
+    })[UTILIZATION_COLUMNS]
+
+
+def _movements(staffing: pd.DataFrame, grade_column: str, department_column: str, fte_column: str,
+               fte: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Project Id": staffing["Project Id"],
+        "Practice": staffing["Practice"],
+        "Location": staffing["Location"],
+        grade_column: staffing["Grade"],
+        department_column: staffing["Department Name"],
+        fte_column: fte,
+    })
+
+
+def generate(scale: float = 1.0, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """Synthetic source tables (the master report inputs) for scale x BASE_ASSOCIATES associates.
+
+    Keys match the table names the app expects; columns match the uploads the master
+    report SQL reads. The same scale and seed always produce the same data.
+    """
+    rng = np.random.default_rng(seed)
+    n_associates = max(ASSOCIATES_PER_PROJECT, int(BASE_ASSOCIATES * scale))
+    projects = _projects(rng, max(1, n_associates // ASSOCIATES_PER_PROJECT))
+    associates = _ids("A", int(n_associates * (1 + CHURN_RATE)))
+
+    # Last month's report: a slice of associates, most of whom are still here this month
+    previous = _utilization(rng, _staffing(rng, projects, n_associates), associates[:n_associates])
+    current = previous.copy()
+    leavers = rng.random(n_associates) < CHURN_RATE
+    movers = ~leavers & (rng.random(n_associates) < 0.05)
+    current.loc[movers, UTILIZATION_COLUMNS[1:]] = _utilization(
+        rng, _staffing(rng, projects, int(movers.sum())), associates[:int(movers.sum())]
+    )[UTILIZATION_COLUMNS[1:]].to_numpy()
+    joiners = _utilization(rng, _staffing(rng, projects, len(associates) - n_associates), associates[n_associates:])
+    current = pd.concat([current[~leavers], joiners], ignore_index=True)
+
+    demand = _staffing(rng, projects, max(1, int(n_associates * DEMAND_RATE)))
+    demand_base = pd.DataFrame({
+        "Project Id": demand["Project Id"], "Practice": demand["Practice"], "Location": demand["Location"],
+        "Grade HR": demand["Grade"], "Pool Name": demand["Department Name"], "BU": demand["BU"],
+        "Account Id": demand["Customer Id"], "Project Description": demand["Project Name"],
+        "Project Type": demand["Project Type"], "Project Billability": demand["Project Billability"],
+        "Account Name": demand["Customer Name"], "Parent Customer ID": demand["ParentCustomerID"],
+        "Parent Customer": demand["Parent Customer"],
+    })
+    fulfilment = _staffing(rng, projects, max(1, int(n_associates * FULFILMENT_RATE)))
+    releases = _staffing(rng, projects, max(1, int(n_associates * RELEASE_RATE)))
+    attrition = _staffing(rng, projects, max(1, int(n_associates * ATTRITION_RATE)))
+
+    accounts = projects.drop_duplicates("Customer Id")
+    pdl = rng.integers(0, N_PDLS, len(accounts))
+    sbu = np.arange(N_BUS) % N_SBUS
+    countries = sorted({country for country, _ in LOCATIONS.values()})
+    cost = pd.MultiIndex.from_product([PRACTICES, countries, GRADES], names=["Practice", "Country", "Grade name"])
+    grade_factor = {g: 1 + i * 0.35 for i, g in enumerate(GRADES)}
+    country_factor = {c: 1.0 if c == "India" else (1.6 if c in ("Philippines", "Mexico", "Poland", "Hungary") else 4.0)
+                      for c in countries}
+
+    return {
+        "utilization_prediction_report": current,
+        "previous_month_actual": previous,
+        "demand_base": demand_base,
+        "fulfilment": _movements(fulfilment, "Associate Hired Grade", "Pool Name", "FTE Impact",
+                                 np.ones(len(fulfilment))),
+        "releases": _movements(releases, "Grade", "Department Name", "Impact FTE",
+                               np.where(rng.random(len(releases)) < 0.9, 1.0, 0.5)),
+        "attrition": _movements(attrition, "Grade", "Department Name", "FTE Impact", np.ones(len(attrition))),
+        "cost_file": pd.DataFrame({
+            "Practice": cost.get_level_values(0), "Country": cost.get_level_values(1),
+            "Grade name": cost.get_level_values(2),
+            "Cost": [round(3500 * grade_factor[g] * country_factor[c] * rng.uniform(0.9, 1.1), 2)
+                     for _, c, g in cost],
+        }),
+        "map_account": pd.DataFrame({
+            "Account ID": accounts["Customer Id"].to_numpy(),
+            "PDL ID": [f"PDL{p + 1:03d}" for p in pdl],
+            "PDL Name": [f"PDL {p + 1}" for p in pdl],
+        }),
+        "map_tower": pd.DataFrame({
+            "Department ID": [f"D{d + 1:03d}" for d in range(N_DEPARTMENTS)],
+            "Tower": [TOWERS[d % len(TOWERS)] for d in range(N_DEPARTMENTS)],
+        }),
+        "map_location": pd.DataFrame({
+            "Utilization Location": list(LOCATIONS),
+            "Country": [c for c, _ in LOCATIONS.values()],
+            "Geo": [g for _, g in LOCATIONS.values()],
+        }),
+        "map_bu": pd.DataFrame({
+            "BU": [f"BU{b + 1:02d}" for b in range(N_BUS)],
+            "SBU": [f"SBU{s + 1}" for s in sbu],
+            "Market": [MARKETS[s % len(MARKETS)] for s in sbu],
+        }),
+        "map_sbu": pd.DataFrame({
+            "SBU": [f"SBU{s + 1}" for s in range(N_SBUS)],
+            "SBU Head ID": [f"H{s + 1:04d}" for s in range(N_SBUS)],
+            "SBU Head Name": [f"SBU Head {s + 1}" for s in range(N_SBUS)],
+        }),
+    }
+
+
+def load_tables(con, frames: Dict[str, pd.DataFrame], load_date: str):
+    """Creates each frame as a table directly, bypassing Excel; for stages that only need the data."""
+    for table, df in frames.items():
+        con.register("_synthetic", df)
+        try:
+            con.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT *, ? AS load_date FROM _synthetic', [load_date])
+        finally:
+            con.unregister("_synthetic")
+
+
+def write_xlsx(df: pd.DataFrame, path: str):
+    """Writes df as a single-sheet workbook in constant_memory mode, as a user export would be."""
+    if len(df) > XLSX_MAX_ROWS:
+        raise ValueError(f"{os.path.basename(path)}: {len(df):,} rows do not fit on one sheet; lower the scale.")
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    try:
+        sheet = workbook.add_worksheet("Sheet1")
+        sheet.write_row(0, 0, list(df.columns))
+        for row, values in enumerate(df.itertuples(index=False, name=None), start=1):
+            sheet.write_row(row, 0, values)
+    finally:
+        workbook.close()
+
+
+def write_workbooks(frames: Dict[str, pd.DataFrame], out_dir: str) -> List[str]:
+    """One <table>.xlsx per frame, named so ingestion loads it into the table of the same name."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for table, df in frames.items():
+        path = os.path.join(out_dir, f"{table}.xlsx")
+        write_xlsx(df, path)
+        paths.append(path)
+    return paths
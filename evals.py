@@ -1,22 +1,210 @@
-# import pandas as pd
-# from phoenix.client import Client
-# from phoenix.evals import GeminiModel, llm_classify, RAG_RELEVANCY_PROMPT_TEMPLATE
-
-# def run_audit():
-#     client = Client()
-#     spans_df = client.get_spans_dataframe(project_name="ops-assist")
-
-#     if spans_df.empty:
-#         return "No traces found"
-
-#     eval_model = GeminiModel(model="gemini-2.5-flash")
-#     eval_result = llm_classify(
-#         data=spans_df,
-#         template=RAG_RELEVANCY_PROMPT_TEMPLATE,
-#         model=eval_model,
-#         rails=["relevant", "irrevalent"]
-#     )
-
-#     from phoenix.evals.utils import to_annotation_dataframe
-#     client.log_span_annotations_dataframe(to_annotation_dataframe(eval_result))
-#     return eval_result
\ No newline at end of file
+"""Runs the golden question set through the agent graph against a synthetic fixture database.
+
+    python evals.py --mode record     # once, with GOOGLE_API_KEY set: calls Gemini and fills the cassette
+    python evals.py                   # offline: replays the cassette
+    python evals.py --replay-latency  # offline, sleeping as long as each recorded call took
+
+Each question passes when the SQL the agent settled on returns the same rows as the reference
+SQL (column order, float noise below 0.01 and, unless the question is marked ordered, row order
+are ignored). Per-node latency and prompt tokens are reported alongside.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from bench import synthetic
+from src.db import get_manager
+from src.master_report import refresh_master_report
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "golden_questions.json")
+CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "golden_cassette.jsonl")
+# Fixed so the fixture, and with it every prompt, is identical between record and replay
+FIXTURE_SCALE = 0.2
+FIXTURE_SEED = 7
+FIXTURE_LOAD_DATE = "2025-06-30 09:00:00 IST"
+
+
+def build_fixture(db_path: str):
+    frames = synthetic.generate(FIXTURE_SCALE, FIXTURE_SEED)
+    with get_manager(db_path).write() as con:
+        synthetic.load_tables(con, frames, FIXTURE_LOAD_DATE)
+        refresh_master_report(con, force=True)
+
+
+def _normalize(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return round(float(value), 2)
+    return value
+
+
+def _row_key(row) -> tuple:
+    return tuple(sorted((_normalize(v) for v in row), key=lambda v: (type(v).__name__, repr(v))))
+
+
+def same_result(con, expected_sql: str, actual_sql: str, ordered: bool = False) -> Optional[str]:
+    """None when both queries return the same rows, otherwise what differs."""
+    expected = [_row_key(r) for r in con.execute(expected_sql).fetchall()]
+    try:
+        actual = [_row_key(r) for r in con.execute(actual_sql).fetchall()]
+    except Exception as e:
+        return f"agent SQL failed: {e}"
+    if not ordered:
+        expected, actual = sorted(expected, key=repr), sorted(actual, key=repr)
+    if expected == actual:
+        return None
+    if len(expected) != len(actual):
+        return f"{len(actual)} rows, expected {len(expected)}"
+    first = next(i for i, (e, a) in enumerate(zip(expected, actual)) if e != a)
+    return f"row {first}: {list(actual[first])}, expected {list(expected[first])}"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile; fine for the handful of samples an eval run produces."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered) + 0.5) - 1))]
+
+
+def run_question(agent, llm, db_path: str, item: dict) -> dict:
+    calls = []
+    llm.add_listener(calls.append)
+    started, nodes = {}, {}
+    sql, answer, error, attempts = None, None, None, 0
+    start = time.perf_counter()
+    try:
+        with llm.scope(item["id"]):
+            inputs = {"question": item["question"], "active_tables": item["tables"], "attempts": 0}
+            for mode, chunk in agent.stream(inputs, stream_mode=["updates", "debug"]):
+                if mode == "debug":
+                    # task / task_result events carry the node name and when it started / finished
+                    payload, at = chunk["payload"], datetime.fromisoformat(chunk["timestamp"])
+                    if chunk["type"] == "task":
+                        started[payload["id"]] = at
+                    elif chunk["type"] == "task_result" and payload["id"] in started:
+                        seconds = (at - started.pop(payload["id"])).total_seconds()
+                        nodes[payload["name"]] = nodes.get(payload["name"], 0.0) + seconds
+                    continue
+                for node, update in (chunk or {}).items():
+                    update = update or {}
+                    if node == "generate_query":
+                        sql, attempts = update.get("sql_query"), attempts + 1
+                    if node == "execute_query":
+                        error = update.get("error")
+                    if node in ("summerize", "report_error"):
+                        answer = update["messages"][0]
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        llm.remove_listener(calls.append)
+    seconds = time.perf_counter() - start
+
+    mismatch = None
+    if sql and not error:
+        with get_manager(db_path).read() as con:
+            mismatch = same_result(con, item["sql"], sql, item.get("ordered", False))
+    prompt_tokens: Dict[str, int] = {}
+    for call in calls:
+        prompt_tokens[call.node or "?"] = prompt_tokens.get(call.node or "?", 0) + call.prompt_tokens
+    return {
+        "id": item["id"],
+        "passed": bool(sql) and error is None and mismatch is None,
+        "error": error,
+        "mismatch": mismatch,
+        "sql": sql,
+        "answer": answer,
+        "attempts": attempts,
+        "seconds": round(seconds, 4),
+        "nodes": {n: round(s, 4) for n, s in nodes.items()},
+        "llm_calls": len(calls),
+        "llm_seconds": round(sum(c.seconds for c in calls), 4),
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+def summarize(results: List[dict]) -> dict:
+    by_node: Dict[str, List[float]] = {}
+    tokens: Dict[str, int] = {}
+    for r in results:
+        for node, seconds in r["nodes"].items():
+            by_node.setdefault(node, []).append(seconds)
+        for node, n in r["prompt_tokens"].items():
+            tokens[node] = tokens.get(node, 0) + n
+    totals = [r["seconds"] for r in results]
+    return {
+        "passed": sum(r["passed"] for r in results),
+        "total": len(results),
+        "seconds_p50": round(percentile(totals, 0.5), 4) if totals else None,
+        "seconds_p95": round(percentile(totals, 0.95), 4) if totals else None,
+        "nodes": {n: {"p50": round(percentile(s, 0.5), 4), "p95": round(percentile(s, 0.95), 4), "calls": len(s)}
+                  for n, s in sorted(by_node.items())},
+        "prompt_tokens": tokens,
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["replay", "record", "live"], default="replay")
+    parser.add_argument("--cassette", default=CASSETTE_PATH)
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--only", nargs="+", help="question ids to run")
+    parser.add_argument("--replay-latency", action="store_true",
+                        help="sleep for each recorded call's duration when replaying")
+    parser.add_argument("--out", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    with open(args.golden) as f:
+        golden = [q for q in json.load(f) if not args.only or q["id"] in args.only]
+
+    work_dir = tempfile.mkdtemp(prefix="ops_assist_evals_")
+    db_path = os.path.join(work_dir, "fixture.duckdb")
+    try:
+        build_fixture(db_path)
+        # src.agent and src.llm read their configuration at import time
+        os.environ["DATABASE_PATH"] = db_path
+        os.environ["OPS_ASSIST_LLM_MODE"] = args.mode
+        os.environ["OPS_ASSIST_LLM_CASSETTE"] = args.cassette
+        if args.replay_latency:
+            os.environ["OPS_ASSIST_LLM_REPLAY_LATENCY"] = "1"
+        from src import agent, llm
+
+        results = []
+        for item in golden:
+            result = run_question(agent, llm, db_path, item)
+            results.append(result)
+            status = "PASS" if result["passed"] else "FAIL"
+            detail = result["error"] or result["mismatch"] or ""
+            print(f"{status}  {item['id']:<28} {result['seconds']:>7.2f}s  "
+                  f"{sum(result['prompt_tokens'].values()):>6} prompt tokens  {detail}")
+    finally:
+        get_manager(db_path).close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = summarize(results)
+    print(f"\n{summary['passed']}/{summary['total']} passed; "
+          f"p50 {summary['seconds_p50']}s, p95 {summary['seconds_p95']}s per question")
+    for node, stats in summary["nodes"].items():
+        print(f"  {node:<16} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  "
+              f"{summary['prompt_tokens'].get(node, 0):>7} prompt tokens")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"commit": _commit(), "mode": args.mode, "cassette": args.cassette,
+                       "summary": summary, "results": results}, f, indent=2, default=str)
+    return 0 if summary["passed"] == summary["total"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
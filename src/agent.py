@@ -1,20 +1,36 @@
 import os
-import duckdb
+import time
+import logging
+import asyncio
 import pandas as pd
 import streamlit as st
 import altair as alt
 from typing import TypedDict, List, Optional
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import HumanMessage
+from src.db import get_manager
+from src.catalog import get_catalog
+from src.results import run_bounded, format_for_llm
+from src import query_templates
+from src.preflight import check_plan, run_with_timeout
+from src.schema_context import SchemaContext, build_schema_context
+from src.master_report import MASTER_REPORT
+from src.rollups import rollup_note, rollup_table
+from src.snapshots import SNAPSHOT_PREFIX, snapshot_note
+from src.incremental import INCREMENTAL_KEYS, history_note, history_table
+from src.charts import build_chart, chart_data, plan_chart
+from src.llm import LLM_MODE, add_listener, backend
+from src.metrics import PeakRss, get_metrics, llm_listener, profiling, timed_node
+
+logger = logging.getLogger(__name__)
 
 # from openinference.instrumentation.langchain import LangChainInstrumentor
 # LangChainInstrumentor().instrument(skip_if_installed=True)
 
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+if not api_key and LLM_MODE != "replay":
     api_key = st.secrets["passwords"]["GOOGLE_API_KEY"]
 
 db_path = os.getenv("DATABASE_PATH")
@@ -23,14 +39,33 @@ if not db_path:
 
 # Setup Gemini for now.
 # TODO : give option to set the api key from UI 
-llm_config = ChatGoogleGenerativeAI(
+# Replay mode answers from recorded calls (see src.llm), so no model or key is needed
+chat_model = None if LLM_MODE == "replay" else ChatGoogleGenerativeAI(
     model="gemini-2.5-flash", 
     #model="gemini-3-pro-preview", 
     api_key=api_key,
     temperature=0
 )
 
-llm = llm_config | StrOutputParser()
+llm_config = backend(chat_model)
+llm = backend(chat_model | StrOutputParser() if chat_model is not None else None)
+# Every model call is recorded in the metrics table with its node and token counts
+add_listener(llm_listener(db_path))
+
+# Created up front so template lookups can run on read cursors
+with get_manager(db_path).write() as con:
+    query_templates.ensure_query_templates(con)
+
+# Failed SQL is sent back to the model with the error at most this many times
+MAX_REPAIR_ATTEMPTS = int(os.getenv("OPS_ASSIST_MAX_REPAIR_ATTEMPTS", "2"))
+
+# Paraphrase matching in the answer cache costs one embedding call per question; opt-in.
+embeddings = None
+if os.getenv("OPS_ASSIST_SEMANTIC_CACHE"):
+    embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001", google_api_key=api_key)
+
+def embed_question(text: str) -> List[float]:
+    return embeddings.embed_query(text)
 
 class ChartSpec(BaseModel):
     chart_type: str = Field(description="bar, line or pie")
@@ -49,82 +84,196 @@ class AgentState(TypedDict):
     result_str: str
     messages: List[str]
     chart_spec: Optional[alt.Chart]
-
-
-def get_schema(tables: List[str]):
-    """Fetches the schema from the database tables"""
+    total_rows: int
+    result_path: Optional[str]
+    sql_source: str
+    error: Optional[str]
+    attempts: int
+    schema_tokens: int
+    schema_tokens_saved: int
+    run_id: str
+
+
+def get_schema(tables: List[str], question: str):
+    """Builds the schema context from the cached catalog, narrowed to what the question needs"""
     if not tables:
-        return "No tables selected."
-    con = duckdb.connect(db_path, read_only=True)
-    schema_context = []
-
+        return SchemaContext(text="No tables selected.", tokens=0, full_tokens=0, tables=[])
+    catalog = get_catalog(db_path)
+    # The master report brings its roll-up along, flagged as the preferred source for level totals
+    notes = {}
+    if MASTER_REPORT in tables and rollup_table(MASTER_REPORT) in catalog.tables():
+        notes[rollup_table(MASTER_REPORT)] = rollup_note(MASTER_REPORT)
+        tables = tables + [t for t in notes if t not in tables]
+    # Snapshot views must be filtered by month to benefit from partition pruning
     for table in tables:
-        description = con.execute(f"DESCRIBE {table}").fetchall()
-        cols = [f"{col[0]} ({col[1]})" for col in description]
-        schema_context.append(f"Table: {table}\nColumns: {', '.join(cols)}")
-    
-    con.close()
-    return "\n\n".join(schema_context)
+        if table.startswith(SNAPSHOT_PREFIX):
+            notes[table] = snapshot_note(table[len(SNAPSHOT_PREFIX):])
+    # History tables of incremental loads need their as-of query to be read correctly
+    histories = {history_table(t): t for t in INCREMENTAL_KEYS if history_table(t) in tables}
+    if histories:
+        with get_manager(db_path).read() as con:
+            for history, table in histories.items():
+                notes[history] = history_note(con, table)
+    return build_schema_context(catalog, tables, question, notes)
+
+def get_schema_fingerprint(tables: List[str]) -> str:
+    catalog = get_catalog(db_path)
+    return query_templates.schema_fingerprint({table: catalog.columns(table) for table in tables})
 
 def generate_query_node(state: AgentState):
     """Node 1: Translate Question to SQL"""
-    schema = get_schema(state['active_tables'])
+    # A question shaped like one answered before on the same schema reuses that SQL with new values
+    if not state.get('error'):
+        fingerprint = get_schema_fingerprint(state['active_tables'])
+        with get_manager(db_path).read() as con:
+            found = query_templates.find(con, state['question'], fingerprint)
+        if found:
+            with get_manager(db_path).bookkeeping() as con:
+                query_templates.record_use(con, fingerprint, found[0])
+            return {"sql_query": found[1], "sql_source": "template"}
+
+    schema = get_schema(state['active_tables'], state['question'])
+
+    repair = ""
+    if state.get('error'):
+        repair = f"""
+    YOUR PREVIOUS QUERY FAILED. Fix it and return the corrected query only.
+    Previous query: {state['sql_query']}
+    Error: {state['error']}
+    """
 
     prompt = f"""
     You are a DuckDB SQL Expert. Write a query to answer the user's question based on the schema below.
 
     DATABASE SCHEMA:
-    {schema}
+    {schema.text}
 
     IMPORTANT RULES:
-    1. All columns are stored as strings. Use TRY_CAST(column_name AS DOUBLE) for any mathematical operations (SUM, AVG, etc.).
+    1. Numeric measure columns may be DOUBLE, everything else is stored as strings. Use TRY_CAST(column_name AS DOUBLE) for any mathematical operations (SUM, AVG, etc.) on string columns.
     2. Use ILIKE for string comparisons to ensure case-insensitivity. Also put % before and after when you are doing string comparison with ILIKE.
     3. Use the exact table names provided in the schema.
     4. Output the SQL query as plain text only. Do not use markdown blocks or backticks.
 
     USER QUESTION: {state['question']}
-    """
+    {repair}"""
 
     response = llm.invoke(prompt)
     #sql = response.replace("```sql", "").replace("```", "").strip()
 
-    return {"sql_query": response}
+    return {"sql_query": response, "sql_source": "llm",
+            "schema_tokens": schema.tokens, "schema_tokens_saved": schema.tokens_saved}
+
+def remember_sql_template(state: AgentState, succeeded: bool):
+    """Keeps LLM-written SQL that ran as a template; drops a template whose SQL failed."""
+    try:
+        fingerprint = get_schema_fingerprint(state['active_tables'])
+        with get_manager(db_path).bookkeeping() as con:
+            if succeeded and state.get('sql_source') == "llm":
+                query_templates.remember(con, state['question'], state['sql_query'], fingerprint)
+            elif not succeeded and state.get('sql_source') == "template":
+                query_templates.forget(con, state['question'], fingerprint)
+    except Exception:
+        # Template bookkeeping never decides whether the query itself succeeded
+        logger.exception("Could not update the SQL template for %r", state['question'])
 
 def execute_query_node(state: AgentState):
     """Node 2: Run SQL in DuckDB"""
 
-    with duckdb.connect(db_path) as con:
+    sql = state['sql_query']
+    with get_manager(db_path).read() as con:
         try:
-            df_result = con.execute(state['sql_query']).df()
-
-            if df_result.empty:
-                return {
-                    "query_result": [], 
-                    "result_summary": "No data found."
-                }  
-            # else:
-            #     result_str = df_result.to_string(index=False)
-            raw_data = df_result.to_dict(orient="records")
-            formatted_text = df_result.to_string(index=False)
-            return {
-                "query_result": raw_data,
-                "result_str": formatted_text
-            }
+            # Checked first: only one SELECT may run, and syntax/binding errors and runaway plans
+            # are caught by EXPLAIN before any data is read
+            check_plan(con, sql)
+            started = time.perf_counter()
+            with profiling(con), PeakRss() as peak:
+                result = run_with_timeout(con, lambda: run_bounded(con, sql))
+            get_metrics(db_path).record("query", time.perf_counter() - started, rows=result.total_rows,
+                                        profile=result.profile, detail=sql, peak=peak)
         except Exception as e:
+            remember_sql_template(state, succeeded=False)
             return {
                 "query_result": [],
-                "result_str": f"Error: {str(e)}"
+                "result_str": f"Error: {str(e)}",
+                "total_rows": 0,
+                "result_path": None,
+                "error": str(e),
+                "attempts": state.get('attempts', 0) + 1
             }
-            
-def plotting_node(state: AgentState):
+
+    remember_sql_template(state, succeeded=True)
+    if result.total_rows == 0:
+        return {
+            "query_result": [],
+            "result_str": "No data found.",
+            "total_rows": 0,
+            "result_path": None,
+            "error": None
+        }
+    # Only a bounded preview goes into the state; the full result stays on disk.
+    return {
+        "query_result": result.rows,
+        "result_str": format_for_llm(result),
+        "total_rows": result.total_rows,
+        "result_path": result.artifact,
+        "error": None
+    }
+
+def route_after_execute(state: AgentState):
+    """Successful results fan out to chart and summary; failures go back for repair until the budget runs out."""
+    if not state.get('error'):
+        return ["generate_plot", "summerize"]
+    if state.get('attempts', 0) <= MAX_REPAIR_ATTEMPTS:
+        return "generate_query"
+    return "report_error"
+
+def report_error_node(state: AgentState):
+    """Answers without an LLM call once the repair attempts are used up"""
+    return {"messages": [
+        f"I couldn't build a working query for this question after {state['attempts']} attempts. "
+        f"Last error: {state['error']}"
+    ]}
+
+# Results with fewer rows than this are not charted
+MIN_CHART_ROWS = 3
+
+def chart_expected(state: AgentState) -> bool:
+    """Whether generate_plot will draw a chart; lets the summary run without waiting for it."""
+    data = state.get("query_result") or []
+    return len(data) >= MIN_CHART_ROWS and plan_chart(pd.DataFrame(data), state['question']) is not None
+
+async def plotting_node(state: AgentState):
     data = state.get("query_result", [])
 
-    print(f"DEBUG: Plotting Node data length: {len(data)}")
     # If the query result has less than 3 rows, dont generate chart
-    if not data or len(data) < 3:
+    if not chart_expected(state):
         return {"chart_spec": None}
 
     df = pd.DataFrame(data)
+    # Axes and chart type come from the column roles; the LLM is only asked when the rules had to guess
+    spec = plan_chart(df, state['question'])
+    if not spec.confident:
+        spec = await ask_chart_spec(state['question'], df) or spec
+
+    try:
+        # Aggregate over the full result (spilled to Parquet when large), not just the preview rows
+        with get_manager(db_path).read() as con:
+            if state.get('result_path'):
+                source = f"read_parquet('{state['result_path']}')"
+            else:
+                con.register("_chart_source", df)
+                source = "_chart_source"
+            try:
+                plot_df = chart_data(con, source, spec)
+            finally:
+                if source == "_chart_source":
+                    con.unregister("_chart_source")
+        return {"chart_spec": build_chart(plot_df, spec)}
+    except Exception as e:
+        print(f"Plotting Error: {e}")
+        return {"chart_spec": None}
+
+async def ask_chart_spec(question: str, df: pd.DataFrame) -> Optional[ChartSpec]:
     headers = list(df.columns)
 
     # Force the LLM to understand the data and return chart_type, x-axis, y-axis and title
@@ -138,40 +287,24 @@ def plotting_node(state: AgentState):
     Return null if a chart is not helpful
     """
 
-    user_prompt = f"Question: {state['question']} \nData Preview: {data[:3]}"
+    user_prompt = f"Question: {question} \nData Preview: {df.head(3).to_dict('records')}"
 
     try:
         # LLM acts as architect and picks the columns for plotting
-        spec = visualizer.invoke([ ("system", system_prompt), ("human", user_prompt)])
-        if not spec: return {"chart_spec": None}
-
-        #Python acts a buider for generating chart
-        df[spec.y_axis] = pd.to_numeric(df[spec.y_axis], errors='coerce')
-
-        chart = alt.Chart(df).mark_bar(cornerRadiusTopLeft=3, cornerRadiusTopRight=3).encode(
-            #x=alt.X(f"{spec.x_axis}:N", sort='-y', title=spec.x_axis.replace("_", " ")),
-            x=alt.X(f"{spec.x_axis}:N", title=spec.x_axis.replace("_", " ")),
-            y=alt.Y(f"{spec.y_axis}:Q", title=spec.y_axis.replace("_", " ")),
-            tooltip=headers,
-            color=alt.value("#4C78A8")
-        ).properties(
-            title=spec.title,
-            width='container',
-            height=350
-        ).configure_title(anchor='start', fontSize=18)
-        print("DEBUG: Chart created successfully!")
-        return {"chart_spec": chart}
+        spec = await visualizer.ainvoke([ ("system", system_prompt), ("human", user_prompt)])
+        if spec and spec.x_axis in headers and spec.y_axis in headers:
+            return spec
     except Exception as e:
         print(f"Plotting Error: {e}")
-        return {"chart_spec": None}
+    return None
 
 
 
-def summerize_insight_node(state: AgentState):
-    """Node 3: Human-readable answer"""
+async def summerize_insight_node(state: AgentState):
+    """Node 3: Human-readable answer, written while generate_plot runs alongside"""
     question = state['question']
     result = state['result_str']
-    chart_present = state.get('chart_spec') is not None
+    chart_present = chart_expected(state)
 
     prompt = f"""
     The User asked: {question}
@@ -187,7 +320,7 @@ def summerize_insight_node(state: AgentState):
     """
     # - If the result is '0' or 'No data', explain that the records might be empty or improperly formatted in the source file.
 
-    response = llm.invoke(prompt)
+    response = await llm.ainvoke(prompt)
     return {"messages": [response]}
     # output = llm.invoke(prompt)
     # response = output.content if hasattr(output, 'content') else output
@@ -208,26 +341,50 @@ def summerize_insight_node(state: AgentState):
 #     #return {"final_summary": response.content}
 #     return {"messages": [response]}
 
+def join_node(state: AgentState):
+    """Fan-in point: runs once both generate_plot and summerize have written their results."""
+    return {}
+
 workflow = StateGraph(AgentState)
 
-workflow.add_node("generate_query", generate_query_node)
-workflow.add_node("execute_query", execute_query_node)
-workflow.add_node("generate_plot", plotting_node)
-workflow.add_node("summerize", summerize_insight_node)
+# Each node's wall time goes to the metrics table (see src.metrics)
+workflow.add_node("generate_query", timed_node(db_path, "generate_query", generate_query_node))
+workflow.add_node("execute_query", timed_node(db_path, "execute_query", execute_query_node))
+workflow.add_node("generate_plot", timed_node(db_path, "generate_plot", plotting_node))
+workflow.add_node("summerize", timed_node(db_path, "summerize", summerize_insight_node))
+workflow.add_node("join", join_node)
+workflow.add_node("report_error", timed_node(db_path, "report_error", report_error_node))
 
 workflow.set_entry_point("generate_query")
 workflow.add_edge("generate_query", "execute_query")
 
-workflow.add_edge("execute_query", "generate_plot")
-workflow.add_edge("generate_plot", "summerize")
-
-# workflow.add_edge("execute_query", "summerize")
+# Chart spec and summary are independent LLM calls, so they run in the same step
+workflow.add_conditional_edges(
+    "execute_query", route_after_execute, ["generate_query", "generate_plot", "summerize", "report_error"]
+)
+workflow.add_edge(["generate_plot", "summerize"], "join")
 
-workflow.add_edge("summerize", END)
+workflow.add_edge("join", END)
+workflow.add_edge("report_error", END)
 
 app = workflow.compile()
 
 
+def stream(inputs: dict, stream_mode="updates"):
+    """Synchronous iterator over app.astream, for callers without an event loop (Streamlit)."""
+    loop = asyncio.new_event_loop()
+    updates = app.astream(inputs, stream_mode=stream_mode)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(updates.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(updates.aclose())
+        loop.close()
+
+
 # if __name__== "__main__":
 #     # schema = get_schema()
 #     # print(f"The schema :: {schema}")
@@ -239,3 +396,17 @@ app = workflow.compile()
 
 #         }
 #     chartspec = plotting_node()
+
+
+def stream_with_tokens(inputs: dict):
+    """Like stream(), but also yields ("token", text) for each summary chunk as Gemini produces it.
+
+    Node updates are yielded as ("updates", {node: update}).
+    """
+    for mode, chunk in stream(inputs, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") == "summerize" and message.text:
+                yield "token", message.text
+        else:
+            yield mode, chunk
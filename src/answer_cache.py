@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+from typing import Callable, List, Optional
+
+import altair as alt
+
+from src.query_templates import normalize_question
+from src.results import RESULT_TTL_SECONDS
+
+ANSWER_CACHE_TABLE = "_answer_cache"
+
+# Entries expire after TTL and the least recently used ones are evicted beyond MAX_ENTRIES.
+# The TTL defaults to that of the spilled results an entry may point at.
+ANSWER_CACHE_TTL_HOURS = int(os.getenv("OPS_ASSIST_ANSWER_CACHE_TTL_HOURS", str(RESULT_TTL_SECONDS // 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("OPS_ASSIST_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Cosine similarity above which a paraphrase counts as the same question.
+SIMILARITY_THRESHOLD = float(os.getenv("OPS_ASSIST_ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def ensure_answer_cache(con):
+    """Creates the cache table."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ANSWER_CACHE_TABLE} (
+            cache_key VARCHAR PRIMARY KEY, question VARCHAR, tables VARCHAR, data_version VARCHAR,
+            answer VARCHAR, sql_query VARCHAR, chart_json VARCHAR, result_path VARCHAR, total_rows BIGINT,
+            embedding FLOAT[], created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, hits BIGINT DEFAULT 0
+        )
+    """)
+
+
+def _tables_key(tables: List[str]) -> str:
+    return ",".join(sorted(tables))
+
+
+def cache_key(question: str, tables: List[str], data_version: str) -> str:
+    raw = "\n".join([normalize_question(question), _tables_key(tables), data_version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def lookup(con, question: str, tables: List[str], data_version: str,
+           embed: Optional[Callable[[str], List[float]]] = None) -> Optional[dict]:
+    """Returns a cached answer for the question over the same tables and data, or None.
+
+    Exact (normalized) matches are tried first; with embed, the closest earlier question
+    above SIMILARITY_THRESHOLD is accepted as a paraphrase. An entry whose spilled result
+    has since been pruned is a miss. Hits are counted by record_hit.
+    """
+    fresh = f"created_at > CURRENT_TIMESTAMP - INTERVAL {ANSWER_CACHE_TTL_HOURS} HOUR"
+    columns = "cache_key, answer, sql_query, chart_json, result_path, total_rows"
+    row = con.execute(
+        f"SELECT {columns} FROM {ANSWER_CACHE_TABLE} WHERE cache_key = ? AND {fresh}",
+        [cache_key(question, tables, data_version)]
+    ).fetchone()
+    if row is None and embed is not None:
+        embedding = embed(normalize_question(question))
+        row = con.execute(f"""
+            SELECT {columns} FROM {ANSWER_CACHE_TABLE}
+            WHERE tables = ? AND data_version = ? AND embedding IS NOT NULL AND {fresh}
+              AND list_cosine_similarity(embedding, ?::FLOAT[]) >= ?
+            ORDER BY list_cosine_similarity(embedding, ?::FLOAT[]) DESC
+            LIMIT 1
+        """, [_tables_key(tables), data_version, embedding, SIMILARITY_THRESHOLD, embedding]).fetchone()
+    if row is None or (row[4] and not os.path.exists(row[4])):
+        return None
+    return dict(zip(["cache_key", "answer", "sql_query", "chart_json", "result_path", "total_rows"], row))
+
+
+def record_hit(con, key: str):
+    """Marks an entry as used, keeping it out of the least-recently-used eviction."""
+    con.execute(f"UPDATE {ANSWER_CACHE_TABLE} SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP WHERE cache_key = ?",
+                [key])
+
+
+def store(con, question: str, tables: List[str], data_version: str, answer: str, sql_query: str = "",
+          chart_json: Optional[str] = None, result_path: Optional[str] = None, total_rows: int = 0,
+          embed: Optional[Callable[[str], List[float]]] = None):
+    """Saves an answer and evicts expired and least recently used entries.
+
+    Pass the same embed as to lookup; wrap it in a cache so the question is embedded only once.
+    """
+    embedding = embed(normalize_question(question)) if embed is not None else None
+    con.execute(f"""
+        INSERT OR REPLACE INTO {ANSWER_CACHE_TABLE}
+            (cache_key, question, tables, data_version, answer, sql_query, chart_json, result_path, total_rows, embedding)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [cache_key(question, tables, data_version), question, _tables_key(tables), data_version,
+          answer, sql_query, chart_json, result_path, total_rows, embedding])
+    con.execute(f"""
+        DELETE FROM {ANSWER_CACHE_TABLE}
+        WHERE created_at <= CURRENT_TIMESTAMP - INTERVAL {ANSWER_CACHE_TTL_HOURS} HOUR
+           OR cache_key IN (
+                SELECT cache_key FROM {ANSWER_CACHE_TABLE}
+                ORDER BY last_hit_at DESC OFFSET {ANSWER_CACHE_MAX_ENTRIES}
+           )
+    """)
+
+
+def chart_to_json(chart) -> Optional[str]:
+    return chart.to_json() if chart is not None else None
+
+
+def chart_from_json(chart_json: Optional[str]):
+    if not chart_json:
+        return None
+    return alt.Chart.from_dict(json.loads(chart_json))
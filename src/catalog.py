@@ -0,0 +1,109 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.db import get_manager, quote_identifier
+
+# Distinct example values are taken from a bounded sample so profiling a wide,
+# high-cardinality table stays cheap.
+SAMPLE_ROWS = 10_000
+SAMPLE_VALUES = 5
+
+
+@dataclass
+class TableProfile:
+    row_count: int
+    cardinality: Dict[str, int] = field(default_factory=dict)
+    samples: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class Catalog:
+    """Cached table list, column types and profiles for one database.
+
+    Entries are filled lazily and live until invalidate() is called by whatever changed
+    the table (ingestion, the Schema Validator, deletion, master report rebuilds).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._tables: Optional[List[str]] = None
+        self._views: set = set()
+        self._columns: Dict[str, List[Tuple[str, str]]] = {}
+        self._profiles: Dict[str, TableProfile] = {}
+        self.version = 0
+
+    def tables(self) -> List[str]:
+        with self._lock:
+            if self._tables is None:
+                with get_manager(self.db_path).read() as con:
+                    rows = con.execute("""
+                        SELECT table_name, table_type FROM information_schema.tables
+                        WHERE table_schema = 'main'
+                        """).fetchall()
+                self._tables = [r[0] for r in rows]
+                self._views = {r[0] for r in rows if r[1] == "VIEW"}
+            return list(self._tables)
+
+    def columns(self, table: str) -> List[Tuple[str, str]]:
+        """(column_name, column_type) pairs, as DESCRIBE reports them."""
+        with self._lock:
+            if table not in self._columns:
+                with get_manager(self.db_path).read() as con:
+                    rows = con.execute(f'DESCRIBE "{table}"').fetchall()
+                self._columns[table] = [(r[0], r[1]) for r in rows]
+            return list(self._columns[table])
+
+    def profile(self, table: str) -> TableProfile:
+        """Row count, approximate distinct counts and a few example values per column."""
+        columns = self.columns(table)
+        with self._lock:
+            if table not in self._profiles:
+                self._profiles[table] = self._build_profile(table, columns)
+            return self._profiles[table]
+
+    def _build_profile(self, table: str, columns: List[Tuple[str, str]]) -> TableProfile:
+        names = [c for c, _ in columns]
+        quoted = [quote_identifier(c) for c in names]
+        with get_manager(self.db_path).read() as con:
+            counts = con.execute(
+                f'SELECT COUNT(*), {", ".join(f"approx_count_distinct({c})" for c in quoted)} FROM "{table}"'
+            ).fetchone() if names else con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()
+            samples = con.execute(
+                f'SELECT {", ".join(f"list_slice(list(DISTINCT CAST({c} AS VARCHAR)), 1, {SAMPLE_VALUES})" for c in quoted)} '
+                f'FROM (SELECT * FROM "{table}" USING SAMPLE {SAMPLE_ROWS} ROWS)'
+            ).fetchone() if names else []
+        return TableProfile(
+            row_count=counts[0],
+            cardinality=dict(zip(names, counts[1:])),
+            samples={c: [v for v in (s or []) if v is not None] for c, s in zip(names, samples)},
+        )
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None):
+        """Forgets cached entries for tables (all tables if None); the table list is always refreshed.
+
+        View profiles are dropped on every invalidation since any source table may feed them.
+        """
+        with self._lock:
+            self._tables = None
+            if tables is None:
+                self._columns.clear()
+                self._profiles.clear()
+            else:
+                for table in tables:
+                    self._columns.pop(table, None)
+                    self._profiles.pop(table, None)
+                for view in self._views:
+                    self._profiles.pop(view, None)
+            self.version += 1
+
+
+_catalogs: Dict[str, Catalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(db_path: str) -> Catalog:
+    with _catalogs_lock:
+        if db_path not in _catalogs:
+            _catalogs[db_path] = Catalog(db_path)
+        return _catalogs[db_path]
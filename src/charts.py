@@ -0,0 +1,175 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from src.db import quote_identifier
+from src.ingestion import KEY_COLUMN_PATTERN
+
+TEMPORAL_NAME_PATTERN = re.compile(r"(date|month|year|week|quarter|period|day)", re.IGNORECASE)
+SHARE_WORDS = {"share", "split", "distribution", "proportion", "percentage", "percent", "mix", "breakdown"}
+PIE_MAX_SLICES = 8
+# Bounds on what reaches the Vega-Lite spec, whatever the result size
+MAX_CATEGORIES = 20
+MAX_LINE_POINTS = 500
+OTHER_LABEL = "Other"
+
+
+@dataclass
+class ChartPlan:
+    chart_type: str
+    x_axis: str
+    y_axis: str
+    title: str
+    # False when the rules had to guess between equally plausible measures; the caller may ask the LLM.
+    confident: bool = True
+
+
+def _words(text: str) -> set:
+    return {w for w in re.split(r"[^0-9a-z]+", text.lower()) if w}
+
+
+def column_roles(df: pd.DataFrame) -> dict:
+    """Classifies each column as "numeric", "temporal" or "categorical" from its dtype and name."""
+    roles = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            roles[column] = "temporal"
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            # Year-like integers and identifier columns are labels, not measures
+            roles[column] = "temporal" if TEMPORAL_NAME_PATTERN.search(str(column)) else (
+                "categorical" if KEY_COLUMN_PATTERN.search(str(column)) else "numeric")
+        elif TEMPORAL_NAME_PATTERN.search(str(column)) and _parses_as_dates(series):
+            roles[column] = "temporal"
+        else:
+            roles[column] = "categorical"
+    return roles
+
+
+def _parses_as_dates(series: pd.Series) -> bool:
+    sample = series.dropna().astype(str).head(20)
+    if sample.empty:
+        return False
+    return pd.to_datetime(sample, errors="coerce", format="mixed").notna().mean() > 0.8
+
+
+def _pick(candidates: List[str], question_words: set) -> Tuple[Optional[str], bool]:
+    """The candidate the question names, else the first one; the flag is False when that was a guess."""
+    named = [c for c in candidates if _words(str(c)) & question_words]
+    if named:
+        return named[0], True
+    return (candidates[0] if candidates else None), len(candidates) <= 1
+
+
+def plan_chart(df: pd.DataFrame, question: str) -> Optional[ChartPlan]:
+    """Chooses chart type and axes from the column roles, or None when nothing is worth plotting.
+
+    A time column gives a line chart, a category a bar chart (a pie for share-of-total
+    questions over a few categories). The measure is the numeric column the question
+    mentions, otherwise the first one.
+    """
+    roles = column_roles(df)
+    numeric = [c for c, r in roles.items() if r == "numeric"]
+    temporal = [c for c, r in roles.items() if r == "temporal"]
+    categorical = [c for c, r in roles.items() if r == "categorical" and df[c].nunique(dropna=True) > 1]
+    if not numeric or not (temporal or categorical):
+        return None
+
+    question_words = _words(question)
+    y_axis, confident = _pick(numeric, question_words)
+    if temporal:
+        chart_type, x_axis = "line", temporal[0]
+    else:
+        x_axis, _ = _pick(categorical, question_words)
+        share = bool(SHARE_WORDS & question_words) and df[x_axis].nunique() <= PIE_MAX_SLICES
+        chart_type = "pie" if share else "bar"
+
+    title = f"{_label(y_axis)} by {_label(x_axis)}"
+    return ChartPlan(chart_type=chart_type, x_axis=x_axis, y_axis=y_axis, title=title, confident=confident)
+
+
+def _label(column: str) -> str:
+    return str(column).replace("_", " ").strip().title()
+
+
+def chart_data(con, source: str, spec) -> pd.DataFrame:
+    """Aggregates source (any relation DuckDB can select from) to one row per x value.
+
+    Bars and pies keep the largest categories and fold the rest into "Other"; lines are
+    ordered by x and downsampled with LTTB. Only the two plotted columns are returned.
+    """
+    x, y = quote_identifier(spec.x_axis), quote_identifier(spec.y_axis)
+    aggregated = f"SELECT {x} AS x, SUM(TRY_CAST({y} AS DOUBLE)) AS y FROM {source} WHERE {x} IS NOT NULL GROUP BY 1"
+    if spec.chart_type == "line":
+        df = con.execute(f"{aggregated} ORDER BY 1").df()
+        df = df.iloc[lttb_indices(df["y"].fillna(0).to_numpy(), MAX_LINE_POINTS)]
+    else:
+        limit = PIE_MAX_SLICES if spec.chart_type == "pie" else MAX_CATEGORIES
+        df = con.execute(f"""
+            WITH ranked AS (SELECT *, row_number() OVER (ORDER BY y DESC NULLS LAST) AS rn FROM ({aggregated}))
+            SELECT CASE WHEN rn < {limit} OR (SELECT COUNT(*) FROM ranked) = {limit}
+                        THEN CAST(x AS VARCHAR) ELSE '{OTHER_LABEL}' END AS x,
+                   SUM(y) AS y, MIN(rn) AS rn
+            FROM ranked GROUP BY 1 ORDER BY rn
+        """).df().drop(columns="rn")
+    return df.rename(columns={"x": spec.x_axis, "y": spec.y_axis}).reset_index(drop=True)
+
+
+def lttb_indices(values: np.ndarray, threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of threshold points that keep the series' visual shape."""
+    n = len(values)
+    if n <= threshold or threshold < 3:
+        return list(range(n))
+    positions = np.arange(n, dtype=float)
+    bucket_size = (n - 2) / (threshold - 2)
+    selected, a = [0], 0
+    for i in range(threshold - 2):
+        start, end = int(i * bucket_size) + 1, int((i + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, n)
+        avg_x, avg_y = positions[next_start:next_end].mean(), values[next_start:next_end].mean()
+        areas = np.abs(
+            (positions[a] - avg_x) * (values[start:end] - values[a])
+            - (positions[a] - positions[start:end]) * (avg_y - values[a])
+        )
+        a = start + int(areas.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def build_chart(df: pd.DataFrame, spec) -> alt.Chart:
+    """Altair chart for a ChartPlan (or the LLM's ChartSpec, which has the same fields).
+
+    Pass the output of chart_data so the embedded dataset stays small.
+    """
+    df = df.copy()
+    df[spec.y_axis] = pd.to_numeric(df[spec.y_axis], errors='coerce')
+    tooltip = [spec.x_axis, spec.y_axis]
+    y = alt.Y(f"{spec.y_axis}:Q", title=_label(spec.y_axis))
+
+    if spec.chart_type == "line":
+        chart = alt.Chart(df).mark_line(point=True).encode(
+            x=alt.X(f"{spec.x_axis}:{'T' if pd.api.types.is_datetime64_any_dtype(df[spec.x_axis]) else 'O'}",
+                    title=_label(spec.x_axis)),
+            y=y, tooltip=tooltip, color=alt.value("#4C78A8")
+        )
+    elif spec.chart_type == "pie":
+        chart = alt.Chart(df).mark_arc(innerRadius=60).encode(
+            theta=alt.Theta(f"{spec.y_axis}:Q"),
+            color=alt.Color(f"{spec.x_axis}:N", title=_label(spec.x_axis), sort=None),
+            tooltip=tooltip
+        )
+    else:
+        chart = alt.Chart(df).mark_bar(cornerRadiusTopLeft=3, cornerRadiusTopRight=3).encode(
+            x=alt.X(f"{spec.x_axis}:N", title=_label(spec.x_axis), sort=None),
+            y=y, tooltip=tooltip, color=alt.value("#4C78A8")
+        )
+    return chart.properties(
+        title=spec.title,
+        width='container',
+        height=350
+    ).configure_title(anchor='start', fontSize=18)
@@ -0,0 +1,124 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+# Tunables, overridable from the environment (docker-compose passes them through).
+MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT")
+THREADS = os.getenv("DUCKDB_THREADS")
+READ_POOL_SIZE = int(os.getenv("DUCKDB_READ_POOL_SIZE", "8"))
+
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def table_exists(con, table_name: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [table_name]
+    ).fetchone() is not None
+
+
+def as_text_sql(column: str, col_type: str) -> str:
+    """SQL rendering column as VARCHAR, DOUBLEs the way ingestion renders a float (1.0 -> "1", 0.5 -> "0.5")."""
+    if col_type != "DOUBLE":
+        return f"CAST({column} AS VARCHAR)"
+    return (f'CASE WHEN {column} = trunc({column}) AND abs({column}) < 1e38 '
+            f'THEN CAST(CAST({column} AS HUGEINT) AS VARCHAR) ELSE CAST({column} AS VARCHAR) END')
+
+
+class ConnectionManager:
+    """One DuckDB database instance per process: a single serialized writer plus pooled read cursors.
+
+    Every cursor shares the instance's catalog and buffer cache, so hot tables stay in memory
+    across Streamlit reruns, sessions and agent steps instead of being re-read from disk.
+    """
+
+    def __init__(self, path: str, memory_limit=MEMORY_LIMIT, threads=THREADS, pool_size: int = READ_POOL_SIZE):
+        config = {}
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        if threads:
+            config["threads"] = int(threads)
+        self.path = path
+        self._root = duckdb.connect(path, read_only=False, config=config)
+        self._writer = self._root.cursor()
+        self._write_lock = threading.RLock()
+        self._bookkeeper = self._root.cursor()
+        self._bookkeeping_lock = threading.Lock()
+        self._readers = queue.LifoQueue(maxsize=pool_size)
+
+    @contextmanager
+    def write(self):
+        """Exclusive access to the writer; any transaction left open by a failure is rolled back."""
+        with self._write_lock:
+            try:
+                yield self._writer
+            except Exception:
+                try:
+                    self._writer.execute("ROLLBACK")
+                except duckdb.Error:
+                    pass
+                raise
+
+    @contextmanager
+    def bookkeeping(self):
+        """Exclusive access to a second writing cursor for the app's own small tables (answer cache,
+        query templates), so those writes never queue behind an ingest or rebuild holding the writer.
+
+        Statements here autocommit; keep them off tables the writer's transactions touch.
+        """
+        with self._bookkeeping_lock:
+            yield self._bookkeeper
+
+    @contextmanager
+    def read(self):
+        """A pooled cursor for the duration of the block; extra cursors are opened when the pool is empty.
+
+        Cursors of one instance cannot be opened read-only, so nothing stops a write here:
+        use these for reads (and exports' COPY TO files) only, and pass untrusted SQL through
+        src.preflight.check_read_only first.
+        """
+        try:
+            cursor = self._readers.get_nowait()
+        except queue.Empty:
+            cursor = self._root.cursor()
+        healthy = True
+        try:
+            yield cursor
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                try:
+                    self._readers.put_nowait(cursor)
+                except queue.Full:
+                    cursor.close()
+            else:
+                cursor.close()
+
+    def cursor(self):
+        """A dedicated cursor outside both the writer lock and the read pool; the caller serializes its use."""
+        return self._root.cursor()
+
+    def close(self):
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self._writer.close()
+        self._bookkeeper.close()
+        self._root.close()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(path: str) -> ConnectionManager:
+    """The process-wide manager for path, created on first use."""
+    with _managers_lock:
+        if path not in _managers:
+            _managers[path] = ConnectionManager(path)
+        return _managers[path]
@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import xlsxwriter
+
+from src.db import get_manager, quote_identifier
+from src.jobs import Job, get_runner
+from src.preview import search_filter
+
+EXPORT_DIR = os.getenv("OPS_ASSIST_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "ops_assist_exports"))
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_TTL_SECONDS = 24 * 3600
+XLSX_MAX_ROWS = 1_048_575  # per sheet, below the header row
+FETCH_BATCH_ROWS = 10_000
+
+# Export job per cached path, so asking again while one is running joins it.
+_pending: Dict[str, str] = {}
+_pending_lock = threading.Lock()
+
+
+def export_path(table: str, fmt: str, version: str, search: Optional[str] = None) -> str:
+    """Where the export of table (filtered by search) at data version is cached."""
+    key = hashlib.sha256("\n".join([table, search or "", version]).encode()).hexdigest()[:24]
+    return os.path.join(EXPORT_DIR, f"{table}_{key}.{fmt}")
+
+
+def prune_exports(max_age: int = EXPORT_TTL_SECONDS):
+    """Removes exports older than max_age seconds, including those of superseded data versions."""
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _copy(con, table: str, columns: List[str], search: Optional[str], fmt: str, path: str):
+    where, params = search_filter(columns, search)
+    options = "FORMAT csv, HEADER" if fmt == "csv" else "FORMAT parquet, COMPRESSION zstd"
+    con.execute(f"COPY (SELECT * FROM {quote_identifier(table)} {where}) TO '{path}' ({options})", params)
+
+
+def _write_xlsx(con, table: str, columns: List[str], search: Optional[str], path: str):
+    """Streams the rows into an xlsx in constant_memory mode, starting a new sheet every XLSX_MAX_ROWS rows."""
+    where, params = search_filter(columns, search)
+    reader = con.execute(f"SELECT * FROM {quote_identifier(table)} {where}", params).fetch_record_batch(FETCH_BATCH_ROWS)
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    try:
+        sheet, row = None, XLSX_MAX_ROWS
+        for batch in reader:
+            for values in zip(*(column.to_pylist() for column in batch.columns)):
+                if row >= XLSX_MAX_ROWS:
+                    sheet = workbook.add_worksheet(f"Ops-Data{'' if sheet is None else len(workbook.worksheets()) + 1}")
+                    sheet.write_row(0, 0, reader.schema.names)
+                    row = 0
+                row += 1
+                sheet.write_row(row, 0, values)
+        if sheet is None:
+            workbook.add_worksheet("Ops-Data").write_row(0, 0, reader.schema.names)
+    finally:
+        workbook.close()
+
+
+def build_export(db_path: str, table: str, columns: List[str], fmt: str, version: str,
+                 search: Optional[str] = None) -> str:
+    """Writes the export unless it already exists for this data version; returns its path.
+
+    Files are written under a temporary name and renamed, so a cached path is always complete.
+    """
+    path = export_path(table, fmt, version, search)
+    if os.path.exists(path):
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    prune_exports()
+    partial = f"{path}.{threading.get_ident()}.part"
+    with get_manager(db_path).read() as con:
+        if fmt == "xlsx":
+            _write_xlsx(con, table, columns, search, partial)
+        else:
+            _copy(con, table, columns, search, fmt, partial)
+    os.replace(partial, path)
+    return path
+
+
+def _export_job(db_path: str, table: str, columns: List[str], fmt: str, version: str,
+                search: Optional[str], report) -> dict:
+    report(f"Writing {table}.{fmt} ...")
+    return {"path": build_export(db_path, table, columns, fmt, version, search)}
+
+
+def request_export(db_path: str, table: str, columns: List[str], fmt: str, version: str,
+                   search: Optional[str] = None) -> str:
+    """Starts (or joins) a read-only background job building the export; returns the job id.
+
+    XLSX is written row by row in Python, which is what makes it worth moving off the UI thread.
+    """
+    path = export_path(table, fmt, version, search)
+    runner = get_runner(db_path)
+    with _pending_lock:
+        job = runner.get(_pending[path]) if path in _pending else None
+        if job is None or (not job.active and not os.path.exists(path)):
+            _pending[path] = runner.submit("export", os.path.basename(path), _export_job,
+                                           db_path, table, columns, fmt, version, search, writes=False)
+        return _pending[path]
+
+
+def pending_export(db_path: str, table: str, fmt: str, version: str, search: Optional[str] = None) -> Optional[Job]:
+    """The export job last requested for these arguments, if any."""
+    with _pending_lock:
+        job_id = _pending.get(export_path(table, fmt, version, search))
+    return get_runner(db_path).get(job_id) if job_id else None
+
+
+def ready_export(table: str, fmt: str, version: str, search: Optional[str] = None) -> Optional[str]:
+    """Path of a finished export, or None if it has not been built for this data version."""
+    path = export_path(table, fmt, version, search)
+    return path if os.path.exists(path) else None
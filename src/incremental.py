@@ -0,0 +1,245 @@
+from typing import List, Optional
+
+from src.db import as_text_sql, table_exists
+
+# Business keys for tables that support incremental refresh. A key does not have to be
+# unique: all rows sharing a key are treated as one versioned group.
+INCREMENTAL_KEYS = {
+    "utilization_prediction_report": ["Associate ID", "Project Id"],
+    "previous_month_actual": ["Associate ID", "Project Id"],
+}
+
+LOAD_BATCHES_TABLE = "_load_batches"
+
+
+def history_table(table_name: str) -> str:
+    return f"{table_name}_history"
+
+
+def keys_table(table_name: str) -> str:
+    return f"_keys_{table_name}"
+
+
+def _key_expr(key_columns: List[str]) -> str:
+    parts = [f"COALESCE(CAST(\"{c}\" AS VARCHAR), '')" for c in key_columns]
+    return f"concat_ws(chr(31), {', '.join(parts)})"
+
+
+def _row_hash_expr(columns: List[str]) -> str:
+    parts = [f"COALESCE(CAST(\"{c}\" AS VARCHAR), '<null>')" for c in columns]
+    return f"md5(concat_ws(chr(31), {', '.join(parts)}))"
+
+
+def ensure_ledger(con):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_BATCHES_TABLE} (
+            table_name VARCHAR, load_date VARCHAR, mode VARCHAR,
+            inserted_keys BIGINT, updated_keys BIGINT, deleted_keys BIGINT, unchanged_keys BIGINT,
+            rows_written BIGINT
+        )
+    """)
+
+
+def _seed_history(con, table_name: str, key_columns: List[str]):
+    """Seeds the history from the table as it stands, so the first delta has a baseline."""
+    con.execute(f"""
+        CREATE TABLE "{history_table(table_name)}" AS
+        SELECT *, {_key_expr(key_columns)} AS _key, false AS _deleted FROM "{table_name}"
+    """)
+
+
+def _seed_keys(con, table_name: str, key_columns: List[str], columns: List[str]):
+    """(Re)computes the per-key content hashes from the table as it stands."""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE "{keys_table(table_name)}" AS
+        SELECT _key, md5(string_agg(_row_hash, '|' ORDER BY _row_hash)) AS _key_hash
+        FROM (SELECT {_key_expr(key_columns)} AS _key, {_row_hash_expr(columns)} AS _row_hash FROM "{table_name}")
+        GROUP BY _key
+    """)
+
+
+def reset_incremental(con, table_name: str):
+    """Drops the key hashes and history of table_name once the table is replaced or dropped.
+
+    Both describe the previous table; the next incremental load seeds them afresh.
+    """
+    for table in (keys_table(table_name), history_table(table_name)):
+        con.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+
+def _widen_columns(con, stage: str, table_name: str, stage_types: dict, target: list) -> List[str]:
+    """Turns target columns into VARCHAR where the stage holds values their type cannot take.
+
+    Stored rows are re-rendered as text (history too), so 'N/A' in a column loaded as
+    DOUBLE is kept rather than cast to NULL.
+    """
+    candidates = [(name, col_type) for name, col_type, *_ in target
+                  if name in stage_types and col_type != "VARCHAR" and stage_types[name] != col_type]
+    if not candidates:
+        return []
+    failed = con.execute("SELECT " + ", ".join(
+        f'COUNT_IF("{name}" IS NOT NULL AND TRY_CAST("{name}" AS {col_type}) IS NULL)'
+        for name, col_type in candidates
+    ) + f" FROM {stage}").fetchone()
+    widened = [(name, col_type) for (name, col_type), count in zip(candidates, failed) if count]
+    for name, col_type in widened:
+        column = f'"{name}"'
+        for table in (table_name, history_table(table_name)):
+            if table_exists(con, table):
+                con.execute(f'ALTER TABLE "{table}" ALTER {column} TYPE VARCHAR USING {as_text_sql(column, col_type)}')
+    return [name for name, _ in widened]
+
+
+def _incoming_column(name: str, col_type: str, stage_type: Optional[str]) -> str:
+    column = f'"{name}"'
+    if stage_type is None:
+        return f'NULL::{col_type} AS {column}'
+    if stage_type == col_type:
+        return column
+    if col_type == "VARCHAR":
+        return f'{as_text_sql(column, stage_type)} AS {column}'
+    return f'CAST({column} AS {col_type}) AS {column}'
+
+
+def apply_incremental(con, stage: str, table_name: str, key_columns: List[str]) -> dict:
+    """Merges the staged rows into table_name, touching only keys whose content changed.
+
+    New and changed key groups replace the current rows, keys absent from the stage are
+    removed from table_name and tombstoned in <table>_history, and the batch is recorded
+    in _load_batches. Columns only the stage has are added to table_name and its history
+    (listed in the returned "added_columns"), and target columns whose type cannot hold
+    the staged values become VARCHAR ("widened_columns"). Must run inside the caller's transaction;
+    stage is any readable relation carrying a load_date column (a table or an attached
+    scratch database).
+    """
+    stage_types = dict(r[:2] for r in con.execute(f"DESCRIBE SELECT * FROM {stage}").fetchall())
+    stage_cols = list(stage_types)
+    if not table_exists(con, table_name):
+        con.execute(f'CREATE TABLE "{table_name}" AS SELECT * FROM {stage} LIMIT 0')
+
+    existing = {r[0] for r in con.execute(f'DESCRIBE "{table_name}"').fetchall()}
+    added_columns = [c for c in stage_cols if c not in existing]
+    for name in added_columns:
+        for table in (table_name, history_table(table_name)):
+            if table_exists(con, table):
+                con.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {stage_types[name]}')
+
+    target = con.execute(f'DESCRIBE "{table_name}"').fetchall()
+    columns = [r[0] for r in target if r[0] != "load_date"]
+    missing = [c for c in key_columns if c not in columns or c not in stage_cols]
+    if missing:
+        raise ValueError(f"Key column(s) missing for incremental load: {', '.join(missing)}")
+
+    widened_columns = _widen_columns(con, stage, table_name, stage_types, target)
+    if widened_columns:
+        target = con.execute(f'DESCRIBE "{table_name}"').fetchall()
+    if not table_exists(con, history_table(table_name)):
+        _seed_history(con, table_name, key_columns)
+    if widened_columns or not table_exists(con, keys_table(table_name)):
+        # Widened values hash as their new text, so the stored hashes are recomputed to match.
+        _seed_keys(con, table_name, key_columns, columns)
+    ensure_ledger(con)
+
+    # Cast the stage to the target's types so hashes compare like for like.
+    projection = ", ".join(
+        _incoming_column(name, col_type, stage_types.get(name)) for name, col_type, *_ in target if name != "load_date"
+    )
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _incoming AS
+        SELECT *, {_key_expr(key_columns)} AS _key, {_row_hash_expr(columns)} AS _row_hash
+        FROM (SELECT {projection}, load_date FROM {stage})
+    """)
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _incoming_keys AS
+        SELECT _key, md5(string_agg(_row_hash, '|' ORDER BY _row_hash)) AS _key_hash
+        FROM _incoming GROUP BY _key
+    """)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _delta AS
+        SELECT COALESCE(i._key, k._key) AS _key, i._key_hash,
+            CASE WHEN k._key IS NULL THEN 'insert' WHEN i._key IS NULL THEN 'delete' ELSE 'update' END AS _change
+        FROM _incoming_keys i
+        FULL OUTER JOIN "{keys_table(table_name)}" k ON i._key = k._key
+        WHERE k._key IS NULL OR i._key IS NULL OR i._key_hash <> k._key_hash
+    """)
+
+    counts = dict(con.execute("SELECT _change, COUNT(*) FROM _delta GROUP BY 1").fetchall())
+    total_incoming = con.execute("SELECT COUNT(*) FROM _incoming_keys").fetchone()[0]
+    load_date = con.execute("SELECT ANY_VALUE(load_date) FROM _incoming").fetchone()[0]
+
+    con.execute(f"""
+        DELETE FROM "{table_name}"
+        WHERE {_key_expr(key_columns)} IN (SELECT _key FROM _delta WHERE _change <> 'insert')
+    """)
+    changed_rows = "SELECT * FROM _incoming WHERE _key IN (SELECT _key FROM _delta WHERE _change <> 'delete')"
+    rows_written = con.execute(f"""
+        INSERT INTO "{table_name}" BY NAME SELECT * EXCLUDE (_key, _row_hash) FROM ({changed_rows})
+    """).fetchone()[0]
+
+    history = history_table(table_name)
+    con.execute(f"""
+        INSERT INTO "{history}" BY NAME
+        SELECT * EXCLUDE (_row_hash), false AS _deleted FROM ({changed_rows})
+    """)
+    con.execute(f"""
+        INSERT INTO "{history}" BY NAME
+        SELECT _key, ? AS load_date, true AS _deleted FROM _delta WHERE _change = 'delete'
+    """, [load_date])
+
+    con.execute(f'DELETE FROM "{keys_table(table_name)}" WHERE _key IN (SELECT _key FROM _delta)')
+    con.execute(f"""
+        INSERT INTO "{keys_table(table_name)}"
+        SELECT _key, _key_hash FROM _delta WHERE _change <> 'delete'
+    """)
+
+    stats = {
+        "table_name": table_name,
+        "load_date": load_date,
+        "mode": "incremental",
+        "inserted_keys": counts.get("insert", 0),
+        "updated_keys": counts.get("update", 0),
+        "deleted_keys": counts.get("delete", 0),
+        "unchanged_keys": total_incoming - counts.get("insert", 0) - counts.get("update", 0),
+        "rows_written": rows_written,
+    }
+    con.execute(f"INSERT INTO {LOAD_BATCHES_TABLE} BY NAME SELECT * FROM (SELECT {', '.join('? AS ' + k for k in stats)})",
+                list(stats.values()))
+    con.execute("DROP TABLE _incoming; DROP TABLE _incoming_keys; DROP TABLE _delta")
+    stats["added_columns"] = added_columns
+    stats["widened_columns"] = widened_columns
+    return stats
+
+
+def snapshot_sql(table_name: str, as_of: Optional[str] = None) -> str:
+    """SQL returning table_name as it stood after the load batch as_of (latest if None)."""
+    cutoff = f"WHERE load_date <= '{as_of}'" if as_of else ""
+    return f"""
+        SELECT * EXCLUDE (_key, _deleted, _version) FROM (
+            SELECT *, dense_rank() OVER (PARTITION BY _key ORDER BY load_date DESC) AS _version
+            FROM "{history_table(table_name)}" {cutoff}
+        )
+        WHERE _version = 1 AND NOT _deleted
+    """
+
+
+def list_load_batches(con, table_name: str) -> List[str]:
+    """Load dates recorded in a table's history, newest first."""
+    if not table_exists(con, history_table(table_name)):
+        return []
+    rows = con.execute(
+        f'SELECT DISTINCT load_date FROM "{history_table(table_name)}" ORDER BY load_date DESC'
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def history_note(con, table_name: str, max_batches: int = 12) -> str:
+    """How the agent should read a history table, shown next to it in the schema context."""
+    batches = list_load_batches(con, table_name)
+    as_of = batches[1] if len(batches) > 1 else (batches[0] if batches else None)
+    example = " ".join(snapshot_sql(table_name, as_of).split())
+    listed = ", ".join(f"'{b}'" for b in batches[:max_batches]) or "none yet"
+    return (
+        f"Row versions of {table_name}, one set per load batch (load_date, newest first: {listed}); "
+        f"_deleted marks keys removed in that batch. To query {table_name} as it stood after a batch, "
+        f"select from this subquery with that load_date: ({example})"
+    )
@@ -0,0 +1,421 @@
+import os
+import hashlib
+import re
+import time
+import shutil
+import tempfile
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from pyxlsb import open_workbook as open_xlsb
+from python_calamine import CalamineWorkbook
+
+from src.db import as_text_sql
+from src.incremental import INCREMENTAL_KEYS, apply_incremental, reset_incremental
+from src.ledger import current_load, file_hash, record_load, unchanged_tables
+from src.metrics import self_peak_rss_mb
+
+# Rows per Arrow record batch. For xlsb, which pyxlsb reads row by row, peak memory is
+# bounded by this; calamine parses a whole xlsx sheet first, so xlsx also holds that sheet.
+BATCH_SIZE = 50_000
+
+# Upper bound on parser processes; each one also gets a small DuckDB of its own.
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+WORKER_MEMORY_LIMIT = "1GB"
+
+# Identifier-like columns stay VARCHAR even when every value is numeric,
+# otherwise "Project Id" would join as DOUBLE in one table and VARCHAR in another.
+KEY_COLUMN_PATTERN = re.compile(r"(id|code|no|number)$", re.IGNORECASE)
+# Only measures are typed DOUBLE. Numeric-looking dimensions (BU, Grade, Practice and
+# Location codes) stay VARCHAR so they join and union across tables and read "1101", not "1101.0".
+MEASURE_COLUMN_PATTERN = re.compile(r"\b(fte|cost|impact|attr|amount|rate|revenue|hours)\b", re.IGNORECASE)
+
+
+@dataclass
+class IngestResult:
+    table_name: str
+    rows: int = 0
+    seconds: float = 0.0
+    column_types: dict = field(default_factory=dict)
+    source: str = ""
+    sheet_name: Optional[str] = None
+    error: Optional[str] = None
+    delta: Optional[dict] = None
+    content_hash: Optional[str] = None
+    skipped: bool = False
+    # Peak RSS of the parse worker process, in MB (parallel ingest only)
+    peak_rss_mb: Optional[float] = None
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def table_name_from_upload(file_name: str) -> str:
+    """Derives the DuckDB table name from an uploaded file name."""
+    base_name = file_name.lower()
+    for ext in [".xlsx", ".xlsb"]:
+        base_name = base_name.replace(ext, "")
+    return base_name.replace(" ", "_").strip()
+
+
+def sheet_table_names(file_name: str, sheet_names: List[str]) -> dict:
+    """First sheet keeps the file-based table name, later sheets get a sheet suffix."""
+    base_name = table_name_from_upload(file_name)
+    names = {}
+    for i, sheet in enumerate(sheet_names):
+        suffix = re.sub(r"[^0-9a-z]+", "_", sheet.lower()).strip("_")
+        names[sheet] = base_name if i == 0 else f"{base_name}_{suffix}"
+    return names
+
+
+def load_date_stamp() -> str:
+    return pd.Timestamp.now(tz='Asia/Kolkata').strftime('%Y-%m-%d %H:%M:%S %Z')
+
+
+def _is_xlsb(uploaded_file) -> bool:
+    return getattr(uploaded_file, "name", "").lower().endswith(".xlsb")
+
+
+def list_sheets(uploaded_file) -> List[str]:
+    uploaded_file.seek(0)
+    if _is_xlsb(uploaded_file):
+        with open_xlsb(uploaded_file) as wb:
+            return list(wb.sheets)
+    return CalamineWorkbook.from_filelike(uploaded_file).sheet_names
+
+
+def _iter_raw_rows(uploaded_file, sheet_name: Optional[str]) -> Iterator[list]:
+    """Yields raw cell values row by row.
+
+    Only xlsb streams (pyxlsb reads the sheet incrementally). For xlsx, calamine loads the
+    whole sheet's cell range into memory first and the rows are then walked from it.
+    """
+    uploaded_file.seek(0)
+    if _is_xlsb(uploaded_file):
+        with open_xlsb(uploaded_file) as wb:
+            with wb.get_sheet(sheet_name or 1) as sheet:
+                for row in sheet.rows():
+                    yield [cell.v for cell in row]
+    else:
+        wb = CalamineWorkbook.from_filelike(uploaded_file)
+        sheet = wb.get_sheet_by_name(sheet_name) if sheet_name else wb.get_sheet_by_index(0)
+        yield from sheet.iter_rows()
+
+
+def _clean(value):
+    return None if value is None or value == "" else value
+
+
+def _normalize_header(raw_header: list) -> List[str]:
+    """Strips header names and mirrors pandas' naming of blank and duplicate headers."""
+    names, seen = [], {}
+    for i, value in enumerate(raw_header):
+        name = str(value).strip() if _clean(value) is not None else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def read_header(uploaded_file, sheet_name: Optional[str] = None) -> List[str]:
+    """Returns the column names of a sheet without reading its data rows."""
+    for raw in _iter_raw_rows(uploaded_file, sheet_name):
+        if any(_clean(v) is not None for v in raw):
+            return _normalize_header(raw)
+    return []
+
+
+def iter_row_batches(uploaded_file, sheet_name: Optional[str] = None, batch_size: int = BATCH_SIZE):
+    """Yields (header, rows) with at most batch_size non-blank rows per batch."""
+    rows_iter = _iter_raw_rows(uploaded_file, sheet_name)
+    header = None
+    for raw in rows_iter:
+        if any(_clean(v) is not None for v in raw):
+            header = _normalize_header(raw)
+            break
+    if header is None:
+        return
+
+    width = len(header)
+    batch, emitted = [], False
+    for raw in rows_iter:
+        row = [_clean(v) for v in raw[:width]]
+        if all(v is None for v in row):
+            continue
+        row.extend([None] * (width - len(row)))
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield header, batch
+            batch, emitted = [], True
+    if batch or not emitted:
+        # A header-only sheet still yields once so the (empty) table gets created.
+        yield header, batch
+
+
+def _is_number(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(str(value).replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def _as_text(value) -> Optional[str]:
+    """Formats a cell the way pd.read_excel(dtype=str) did, so existing SQL keeps matching."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return str(pd.Timestamp(value))
+    return str(value)
+
+
+def infer_column_types(header: List[str], rows: List[list]) -> dict:
+    """DOUBLE for measure columns (see MEASURE_COLUMN_PATTERN) whose sampled values are all numeric, VARCHAR otherwise."""
+    types = {}
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows if row[i] is not None]
+        numeric = bool(values) and all(_is_number(v) for v in values)
+        measure = MEASURE_COLUMN_PATTERN.search(name) and not KEY_COLUMN_PATTERN.search(name)
+        types[name] = "DOUBLE" if numeric and measure else "VARCHAR"
+    return types
+
+
+def _to_record_batch(header: List[str], rows: List[list], column_types: dict) -> pa.RecordBatch:
+    arrays = []
+    for i, name in enumerate(header):
+        column = [row[i] for row in rows]
+        if column_types[name] == "DOUBLE":
+            arrays.append(pa.array([None if v is None else float(str(v).replace(",", "")) for v in column], pa.float64()))
+        else:
+            arrays.append(pa.array([_as_text(v) for v in column], pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=header)
+
+
+def _with_load_date(record_batch: pa.RecordBatch, load_date: str) -> pa.RecordBatch:
+    return record_batch.append_column("load_date", pa.array([load_date] * record_batch.num_rows, pa.string()))
+
+
+def _drop_view(con, table_name: str):
+    """A table may stand in as a view (e.g. previous_month_actual over a snapshot); loading it replaces the view."""
+    if con.execute("SELECT 1 FROM duckdb_views() WHERE view_name = ? AND NOT internal", [table_name]).fetchone():
+        con.execute(f'DROP VIEW "{table_name}"')
+
+
+def _create_table_sql(table_name: str, column_types: dict) -> str:
+    cols = ", ".join(f'"{name}" {col_type}' for name, col_type in column_types.items())
+    return f'CREATE OR REPLACE TABLE "{table_name}" ({cols}, load_date VARCHAR)'
+
+
+def _widen_columns(con, table_name: str, header: List[str], rows: List[list], column_types: dict):
+    """Falls back to VARCHAR when a later batch holds text in a column inferred as DOUBLE.
+
+    Rows already stored are re-rendered like the text of later batches, so a value
+    reads "1234567" whichever batch it came from.
+    """
+    for i, name in enumerate(header):
+        if column_types[name] != "DOUBLE":
+            continue
+        if any(row[i] is not None and not _is_number(row[i]) for row in rows):
+            column = f'"{name}"'
+            con.execute(f'ALTER TABLE "{table_name}" ALTER {column} TYPE VARCHAR USING {as_text_sql(column, "DOUBLE")}')
+            column_types[name] = "VARCHAR"
+
+
+def write_batches(con, table_name: str, batches, load_date: Optional[str] = None) -> IngestResult:
+    """Creates table_name from the first batch's inferred types and appends every batch as Arrow.
+
+    Runs inside a single transaction so a failed upload leaves the previous table intact.
+    """
+    result = IngestResult(table_name=table_name)
+    load_date = load_date or load_date_stamp()
+    content = hashlib.blake2b(digest_size=16)
+    start = time.perf_counter()
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for header, rows in batches:
+            if not result.column_types:
+                result.column_types = infer_column_types(header, rows)
+                _drop_view(con, table_name)
+                reset_incremental(con, table_name)
+                con.execute(_create_table_sql(table_name, result.column_types))
+            else:
+                _widen_columns(con, table_name, header, rows, result.column_types)
+
+            record_batch = _to_record_batch(header, rows, result.column_types)
+            content.update(record_batch.serialize())
+            con.register("_ingest_batch", _with_load_date(record_batch, load_date))
+            con.execute(f'INSERT INTO "{table_name}" BY NAME SELECT * FROM _ingest_batch')
+            con.unregister("_ingest_batch")
+            result.rows += len(rows)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    result.seconds = time.perf_counter() - start
+    result.content_hash = content.hexdigest()
+    return result
+
+
+def ingest_excel(con, uploaded_file, table_name: str, sheet_name: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE, key_columns: Optional[List[str]] = None) -> IngestResult:
+    """Streams one sheet of an uploaded workbook into DuckDB in bounded row batches.
+
+    With key_columns the sheet is staged and merged incrementally instead of replacing the table.
+    Re-uploading the file the table was last loaded from is a no-op (result.skipped).
+    """
+    digest = file_hash(uploaded_file.getvalue())
+    # Record the sheet by name, as ingest_uploads does, so both paths recognise each other's loads
+    sheet_name = sheet_name or list_sheets(uploaded_file)[0]
+    loaded = current_load(con, table_name)
+    if loaded and loaded[0] == digest and loaded[1] == sheet_name:
+        return IngestResult(table_name, source=uploaded_file.name, sheet_name=sheet_name, skipped=True)
+
+    load_date = load_date_stamp()
+    batches = iter_row_batches(uploaded_file, sheet_name, batch_size)
+    if not key_columns:
+        result = write_batches(con, table_name, batches, load_date)
+        record_load(con, table_name, uploaded_file.name, digest, sheet_name, result.content_hash, result.rows, load_date)
+        return result
+
+    stage = f"_stage_{table_name}"
+    result = write_batches(con, stage, batches, load_date)
+    result.table_name = table_name
+    try:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            result.delta = apply_incremental(con, f'"{stage}"', table_name, key_columns)
+            record_load(con, table_name, uploaded_file.name, digest, sheet_name, result.content_hash,
+                        result.rows, load_date)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.execute(f'DROP TABLE IF EXISTS "{stage}"')
+    return result
+
+
+def _parse_sheet_job(upload_path: str, file_name: str, sheet_name: str, table_name: str,
+                     db_file: str, load_date: str, batch_size: int) -> IngestResult:
+    """Worker-process entry point: parses one sheet of the workbook at upload_path into a scratch DuckDB file."""
+    with open(upload_path, "rb") as upload, \
+            duckdb.connect(db_file, config={"threads": 1, "memory_limit": WORKER_MEMORY_LIMIT}) as con:
+        result = write_batches(con, "sheet", iter_row_batches(upload, sheet_name, batch_size), load_date)
+    result.table_name, result.source, result.sheet_name = table_name, file_name, sheet_name
+    result.peak_rss_mb = self_peak_rss_mb()
+    return result
+
+
+def _commit_parsed(con, parsed: List[tuple], digests: dict, load_date: str, incremental: bool):
+    """Copies the parsed scratch sheets into the main database in one transaction."""
+    for i, (db_file, _) in enumerate(parsed):
+        con.execute(f"ATTACH '{db_file}' AS ingest_{i} (READ_ONLY)")
+    try:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            for i, (_, result) in enumerate(parsed):
+                key_columns = INCREMENTAL_KEYS.get(result.table_name) if incremental else None
+                loaded = current_load(con, result.table_name)
+                if loaded and loaded[2] == result.content_hash:
+                    result.skipped = True
+                elif key_columns:
+                    result.delta = apply_incremental(con, f"ingest_{i}.sheet", result.table_name, key_columns)
+                else:
+                    _drop_view(con, result.table_name)
+                    reset_incremental(con, result.table_name)
+                    con.execute(f'CREATE OR REPLACE TABLE "{result.table_name}" AS SELECT * FROM ingest_{i}.sheet')
+                record_load(con, result.table_name, result.source, digests[result.source], result.sheet_name,
+                            result.content_hash, result.rows, load_date)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        for i in range(len(parsed)):
+            con.execute(f"DETACH ingest_{i}")
+
+
+def ingest_uploads(manager, uploaded_files, on_progress: Optional[Callable[[IngestResult], None]] = None,
+                   max_workers: int = MAX_WORKERS, batch_size: int = BATCH_SIZE,
+                   incremental: bool = False) -> List[IngestResult]:
+    """Parses every sheet of every upload in a process pool, then commits them all in one transaction.
+
+    Each upload is written to a scratch file once and workers read it from there. Workers
+    never touch the main database: each writes its sheet to a scratch DuckDB file, and the
+    finished sheets are copied across under manager.write(), the only time the writer is
+    held; the ledger checks before parsing use a read cursor. on_progress is called from
+    the calling thread as each sheet finishes parsing, so it is safe to update Streamlit from it.
+    Sheets that fail to parse, or have no header row, are reported with result.error and
+    left out of the commit.
+    With incremental=True, tables listed in INCREMENTAL_KEYS are merged rather than replaced.
+
+    Uploads are checked against the ingest ledger first: a file identical to the one its
+    tables were last loaded from is skipped without parsing, and sheets whose parsed
+    content is unchanged are not rewritten (both reported with result.skipped).
+    """
+    load_date = load_date_stamp()
+    scratch_dir = tempfile.mkdtemp(prefix="ops_assist_ingest_")
+    results = []
+    try:
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        with pool:
+            futures, digests = {}, {}
+            for n, uploaded_file in enumerate(uploaded_files):
+                payload = uploaded_file.getvalue()
+                digests[uploaded_file.name] = file_hash(payload)
+                with manager.read() as con:
+                    unchanged = unchanged_tables(con, uploaded_file.name, digests[uploaded_file.name])
+                if unchanged:
+                    for table_name, sheet, rows in unchanged:
+                        result = IngestResult(table_name, rows=rows, source=uploaded_file.name,
+                                              sheet_name=sheet, skipped=True)
+                        results.append((None, result))
+                        if on_progress:
+                            on_progress(result)
+                    continue
+                # Keep the extension: the reader is chosen by file name
+                upload_path = os.path.join(scratch_dir, f"upload_{n}{os.path.splitext(uploaded_file.name)[1]}")
+                with open(upload_path, "wb") as f:
+                    f.write(payload)
+                for sheet, table_name in sheet_table_names(uploaded_file.name, list_sheets(uploaded_file)).items():
+                    db_file = os.path.join(scratch_dir, f"{len(futures)}.duckdb")
+                    future = pool.submit(_parse_sheet_job, upload_path, uploaded_file.name, sheet,
+                                         table_name, db_file, load_date, batch_size)
+                    futures[future] = (db_file, IngestResult(table_name, source=uploaded_file.name, sheet_name=sheet))
+
+            for future in as_completed(futures):
+                db_file, result = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result.error = str(e)
+                if result.error is None and not result.column_types:
+                    result.error = "Sheet is empty: no header row found."
+                results.append((db_file, result))
+                if on_progress:
+                    on_progress(result)
+
+        parsed = [(db_file, r) for db_file, r in results if db_file and r.error is None]
+        with manager.write() as con:
+            _commit_parsed(con, parsed, digests, load_date, incremental)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return [r for _, r in results]
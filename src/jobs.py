@@ -0,0 +1,131 @@
+import os
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from src.db import get_manager
+
+JOBS_TABLE = "_jobs"
+# Writing jobs run one at a time; read-only jobs (exports) run alongside them.
+READ_WORKERS = int(os.getenv("OPS_ASSIST_JOB_READ_WORKERS", "4"))
+
+_COLUMNS = ["job_id", "kind", "label", "status", "progress", "message", "error", "result",
+            "created_at", "started_at", "finished_at"]
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    label: str
+    status: str
+    progress: Optional[float] = None
+    message: str = ""
+    error: Optional[str] = None
+    result: dict = field(default_factory=dict)
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+class JobRunner:
+    """Runs heavy work off the Streamlit script thread and records it in the _jobs table.
+
+    Jobs that write go through a single worker so they never contend for the DuckDB writer;
+    read-only jobs share a small pool. Status lives in the database, so a rerun, a new
+    browser session or another user sees the same jobs. Job functions receive a
+    report(message, progress=None) callback and return a JSON-serializable dict.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Job bookkeeping uses its own cursor so progress can be recorded while a job holds the writer.
+        self._con = get_manager(db_path).cursor()
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ops-assist-job-writer")
+        self._readers = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="ops-assist-job-reader")
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+                job_id VARCHAR PRIMARY KEY, kind VARCHAR, label VARCHAR, status VARCHAR,
+                progress DOUBLE, message VARCHAR, error VARCHAR, result VARCHAR,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, started_at TIMESTAMP, finished_at TIMESTAMP
+            )
+        """)
+        # Whatever was queued or running belonged to a process that no longer exists.
+        self._execute(f"""
+            UPDATE {JOBS_TABLE} SET status = 'interrupted', finished_at = CURRENT_TIMESTAMP,
+                error = 'The app restarted before the job finished'
+            WHERE status IN ('queued', 'running')
+        """)
+
+    def _execute(self, sql: str, params: Optional[list] = None) -> list:
+        with self._lock:
+            return self._con.execute(sql, params or []).fetchall()
+
+    def submit(self, kind: str, label: str, fn: Callable[..., Optional[dict]], *args,
+               writes: bool = True, **kwargs) -> str:
+        """Queues fn(*args, report=..., **kwargs) and returns the job id."""
+        job_id = uuid.uuid4().hex
+        self._execute(f"INSERT INTO {JOBS_TABLE} (job_id, kind, label, status) VALUES (?, ?, ?, 'queued')",
+                      [job_id, kind, label])
+        (self._writer if writes else self._readers).submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., Optional[dict]], args: tuple, kwargs: dict):
+        self._execute(f"UPDATE {JOBS_TABLE} SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+                      [job_id])
+
+        def report(message: str, progress: Optional[float] = None):
+            self._execute(f"UPDATE {JOBS_TABLE} SET message = ?, progress = COALESCE(?, progress) WHERE job_id = ?",
+                          [message, progress, job_id])
+
+        try:
+            result = fn(*args, report=report, **kwargs) or {}
+            self._execute(f"""
+                UPDATE {JOBS_TABLE} SET status = 'done', progress = 1, result = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            """, [json.dumps(result, default=str), job_id])
+        except Exception as e:
+            self._execute(f"""
+                UPDATE {JOBS_TABLE} SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE job_id = ?
+            """, [str(e), job_id])
+
+    def get(self, job_id: str) -> Optional[Job]:
+        rows = self._execute(f"SELECT {', '.join(_COLUMNS)} FROM {JOBS_TABLE} WHERE job_id = ?", [job_id])
+        return _to_job(rows[0]) if rows else None
+
+    def recent(self, limit: int = 10, kinds: Optional[List[str]] = None) -> List[Job]:
+        """The newest jobs, active ones first."""
+        where = f"WHERE kind IN ({', '.join('?' * len(kinds))})" if kinds else ""
+        rows = self._execute(f"""
+            SELECT {', '.join(_COLUMNS)} FROM {JOBS_TABLE} {where}
+            ORDER BY status IN ('queued', 'running') DESC, created_at DESC LIMIT {int(limit)}
+        """, list(kinds or []))
+        return [_to_job(r) for r in rows]
+
+
+def _to_job(row) -> Job:
+    values = dict(zip(_COLUMNS, row))
+    values["result"] = json.loads(values["result"]) if values["result"] else {}
+    values["message"] = values["message"] or ""
+    return Job(**values)
+
+
+_runners: Dict[str, JobRunner] = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(db_path: str) -> JobRunner:
+    """The process-wide runner for db_path, created on first use."""
+    with _runners_lock:
+        if db_path not in _runners:
+            _runners[db_path] = JobRunner(db_path)
+        return _runners[db_path]
@@ -0,0 +1,122 @@
+import hashlib
+from typing import List, Optional
+
+from src.db import table_exists
+from src.master_report import MASTER_REPORT, report_version
+
+# One row per (table, sheet) load. The latest row for a table says which file content
+# it currently holds, so an identical re-upload can be skipped before any parsing.
+INGEST_LEDGER_TABLE = "_ingest_ledger"
+
+
+def ensure_ingest_ledger(con):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INGEST_LEDGER_TABLE} (
+            table_name VARCHAR, file_name VARCHAR, file_hash VARCHAR,
+            sheet_name VARCHAR, sheet_hash VARCHAR, rows BIGINT, load_date VARCHAR,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def table_exists(con, table_name: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [table_name]
+    ).fetchone() is not None
+
+
+def file_hash(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _latest_loads() -> str:
+    """Latest ledger row per table, whether or not the table still exists."""
+    return f"""
+        SELECT * FROM {INGEST_LEDGER_TABLE}
+        QUALIFY row_number() OVER (PARTITION BY table_name ORDER BY loaded_at DESC) = 1
+    """
+
+
+def _current_loads(con) -> str:
+    """Latest ledger row per table, restricted to tables that still exist."""
+    return f"""
+        SELECT * FROM ({_latest_loads()})
+        WHERE table_name IN (SELECT table_name FROM information_schema.tables WHERE table_schema = 'main')
+    """
+
+
+def unchanged_tables(con, file_name: str, digest: str) -> List[tuple]:
+    """(table_name, sheet_name, rows) for every table currently loaded from this exact file.
+
+    Empty when the file is new, changed, or any table it produced has since been
+    reloaded from something else or dropped.
+    """
+    if not table_exists(con, INGEST_LEDGER_TABLE):
+        return []
+    rows = con.execute(f"""
+        SELECT table_name, sheet_name, rows, file_hash,
+               table_name IN (SELECT table_name FROM information_schema.tables WHERE table_schema = 'main')
+        FROM ({_latest_loads()})
+        WHERE table_name IN (SELECT table_name FROM {INGEST_LEDGER_TABLE} WHERE file_name = ? AND file_hash = ?)
+    """, [file_name, digest]).fetchall()
+    if not rows or any(r[3] != digest or not r[4] for r in rows):
+        return []
+    return [r[:3] for r in rows]
+
+
+def current_load(con, table_name: str) -> Optional[tuple]:
+    """(file_hash, sheet_name, sheet_hash) of the load table_name currently holds."""
+    if not table_exists(con, INGEST_LEDGER_TABLE):
+        return None
+    return con.execute(
+        f"SELECT file_hash, sheet_name, sheet_hash FROM ({_current_loads(con)}) WHERE table_name = ?",
+        [table_name]
+    ).fetchone()
+
+
+def record_load(con, table_name: str, file_name: str, digest: str, sheet_name: Optional[str],
+                sheet_hash: Optional[str], rows: int, load_date: Optional[str] = None):
+    ensure_ingest_ledger(con)
+    con.execute(f"""
+        INSERT INTO {INGEST_LEDGER_TABLE} (table_name, file_name, file_hash, sheet_name, sheet_hash, rows, load_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [table_name, file_name, digest, sheet_name, sheet_hash, rows, load_date])
+
+
+# Bumped by changes the ledger cannot see (e.g. statements run from the SQL console).
+DATA_EPOCH_TABLE = "_data_epoch"
+
+
+def bump_data_epoch(con):
+    con.execute(f"CREATE TABLE IF NOT EXISTS {DATA_EPOCH_TABLE} (epoch BIGINT)")
+    con.execute(f"INSERT INTO {DATA_EPOCH_TABLE} SELECT COALESCE(MAX(epoch), 0) + 1 FROM {DATA_EPOCH_TABLE}")
+
+
+def data_version(con, tables: List[str]) -> str:
+    """A stamp that changes whenever the data behind any of tables may have changed.
+
+    Loaded tables are identified by their latest ledger entry and the master report by its
+    source versions; anything untracked (views, console-made tables) falls back to the
+    newest load of any table. The data epoch is mixed into every stamp; a missing ledger
+    counts as no loads.
+    """
+    loads, latest_load = {}, None
+    if table_exists(con, INGEST_LEDGER_TABLE):
+        loads = dict(con.execute(
+            f"SELECT table_name, file_hash || ':' || sheet_hash || ':' || loaded_at FROM ({_current_loads(con)})"
+        ).fetchall())
+        latest_load = con.execute(f"SELECT MAX(loaded_at) FROM {INGEST_LEDGER_TABLE}").fetchone()[0]
+    report = report_version(con) or ""
+    epoch = con.execute(f"SELECT MAX(epoch) FROM {DATA_EPOCH_TABLE}").fetchone()[0] \
+        if table_exists(con, DATA_EPOCH_TABLE) else 0
+
+    stamps = []
+    for table in sorted(tables):
+        if table == MASTER_REPORT and report:
+            stamps.append(f"{table}={report}")
+        elif table in loads:
+            stamps.append(f"{table}={loads[table]}")
+        else:
+            stamps.append(f"{table}=*{latest_load}|{report}")
+    stamps.append(f"epoch={epoch}")
+    return hashlib.sha256("\n".join(stamps).encode()).hexdigest()
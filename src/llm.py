@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langgraph.config import get_config
+
+from src.schema_context import estimate_tokens
+
+# live: call the model. record: call it and append every prompt/response to the cassette.
+# replay: answer from the cassette only, offline; a prompt that was never recorded raises ReplayMiss.
+LLM_MODES = ("live", "record", "replay")
+LLM_MODE = os.getenv("OPS_ASSIST_LLM_MODE", "live")
+CASSETTE_PATH = os.getenv("OPS_ASSIST_LLM_CASSETTE", "llm_cassette.jsonl")
+# Replay sleeps for as long as the recorded call took, so end-to-end timings stay realistic
+REPLAY_LATENCY = os.getenv("OPS_ASSIST_LLM_REPLAY_LATENCY", "").lower() in ("1", "true", "yes")
+
+
+class ReplayMiss(LookupError):
+    """Replay mode met a prompt the cassette has no recording for."""
+
+
+@dataclass
+class LLMCall:
+    """One model call, as passed to listeners; token counts are estimate_tokens (len/4) estimates."""
+    node: Optional[str]
+    kind: str
+    prompt_tokens: int
+    response_tokens: int
+    seconds: float
+    replayed: bool
+
+
+@dataclass
+class _Scope:
+    name: str
+    counters: Dict[Tuple[Optional[str], str], int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def next_seq(self, node: Optional[str], kind: str) -> int:
+        with self.lock:
+            seq = self.counters.get((node, kind), 0)
+            self.counters[(node, kind)] = seq + 1
+            return seq
+
+
+_scope: ContextVar[Optional[_Scope]] = ContextVar("llm_scope", default=None)
+_listeners: List[Callable[[LLMCall], None]] = []
+
+
+@contextmanager
+def scope(name: str):
+    """Names the calls made inside the block (e.g. one eval question).
+
+    Replay first looks a prompt up exactly; within a scope it falls back to the call recorded
+    at the same position for the same node, so prompts that embed run-dependent text (sampled
+    example values, unordered results) still replay.
+    """
+    token = _scope.set(_Scope(name))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def add_listener(listener: Callable[[LLMCall], None]):
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[LLMCall], None]):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _current_node() -> Optional[str]:
+    try:
+        return get_config().get("metadata", {}).get("langgraph_node")
+    except RuntimeError:
+        return None  # called outside the graph
+
+
+def _prompt_json(prompt) -> Any:
+    """Strings as they are; message lists as [role, content] pairs."""
+    if isinstance(prompt, str):
+        return prompt
+    return [[m.type, m.content] if hasattr(m, "content") else list(m) for m in prompt]
+
+
+def _prompt_text(prompt) -> str:
+    return prompt if isinstance(prompt, str) else "\n".join(str(c) for _, c in _prompt_json(prompt))
+
+
+class Cassette:
+    """Recorded calls in a JSONL file, indexed by prompt hash and by (scope, node, kind, seq)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, dict] = {}
+        self._by_position: Dict[tuple, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: dict):
+        self._by_key[entry["key"]] = entry
+        if entry.get("scope") is not None:
+            self._by_position[(entry["scope"], entry["node"], entry["kind"], entry["seq"])] = entry
+
+    def find(self, key: str, position: Optional[tuple]) -> Optional[dict]:
+        with self._lock:
+            return self._by_key.get(key) or (self._by_position.get(position) if position else None)
+
+    def append(self, entry: dict):
+        """Later recordings of the same prompt or position win; delete the file to start over."""
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+            self._index(entry)
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str = CASSETTE_PATH) -> Cassette:
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+class LLMBackend:
+    """Stands in for a LangChain runnable (invoke, ainvoke, with_structured_output) in any LLM_MODE.
+
+    kind tells apart the plain-text chain from structured-output variants, whose responses
+    are stored as dicts and rebuilt into schema on replay. In replay mode inner may be None.
+    """
+
+    def __init__(self, inner, mode: str = LLM_MODE, cassette: Optional[Cassette] = None,
+                 kind: str = "text", schema=None):
+        if mode not in LLM_MODES:
+            raise ValueError(f"Unknown LLM mode {mode!r}; expected one of {', '.join(LLM_MODES)}.")
+        if mode != "live" and cassette is None:
+            cassette = get_cassette()
+        self.inner, self.mode, self.cassette, self.kind, self.schema = inner, mode, cassette, kind, schema
+
+    def with_structured_output(self, schema) -> "LLMBackend":
+        inner = self.inner.with_structured_output(schema) if self.inner is not None else None
+        return LLMBackend(inner, self.mode, self.cassette, f"structured:{schema.__name__}", schema)
+
+    def _key(self, prompt) -> str:
+        return hashlib.sha256(json.dumps([self.kind, _prompt_json(prompt)]).encode()).hexdigest()
+
+    def _position(self, node: Optional[str]) -> Optional[tuple]:
+        current = _scope.get()
+        return (current.name, node, self.kind, current.next_seq(node, self.kind)) if current else None
+
+    def _replay(self, prompt, node: Optional[str], position: Optional[tuple]) -> dict:
+        entry = self.cassette.find(self._key(prompt), position)
+        if entry is None:
+            raise ReplayMiss(f"No recorded {self.kind} response for node {node!r} in {self.cassette.path}; "
+                             f"record it with OPS_ASSIST_LLM_MODE=record.")
+        return entry
+
+    def _dump(self, response) -> Any:
+        return response.model_dump() if hasattr(response, "model_dump") else response
+
+    def _load(self, response) -> Any:
+        return self.schema(**response) if self.schema is not None and response is not None else response
+
+    def _finish(self, prompt, response, seconds: float, node: Optional[str], position: Optional[tuple],
+                replayed: bool):
+        stored = self._dump(response)
+        if self.mode == "record":
+            self.cassette.append({
+                "key": self._key(prompt),
+                "scope": position[0] if position else None, "node": node, "kind": self.kind,
+                "seq": position[3] if position else None,
+                "prompt": _prompt_json(prompt), "response": stored, "seconds": round(seconds, 4),
+            })
+        call = LLMCall(node=node, kind=self.kind, prompt_tokens=estimate_tokens(_prompt_text(prompt)),
+                       response_tokens=estimate_tokens(json.dumps(stored, default=str)) if stored is not None else 0,
+                       seconds=seconds, replayed=replayed)
+        for listener in list(_listeners):
+            listener(call)
+        return response
+
+    def invoke(self, prompt):
+        node = _current_node()
+        position = self._position(node)
+        start = time.perf_counter()
+        if self.mode == "replay":
+            entry = self._replay(prompt, node, position)
+            if REPLAY_LATENCY:
+                time.sleep(entry.get("seconds") or 0)
+            response = self._load(entry["response"])
+        else:
+            response = self.inner.invoke(prompt)
+        return self._finish(prompt, response, time.perf_counter() - start, node, position, self.mode == "replay")
+
+    async def ainvoke(self, prompt):
+        node = _current_node()
+        position = self._position(node)
+        start = time.perf_counter()
+        if self.mode == "replay":
+            entry = self._replay(prompt, node, position)
+            if REPLAY_LATENCY:
+                await asyncio.sleep(entry.get("seconds") or 0)
+            response = self._load(entry["response"])
+        else:
+            response = await self.inner.ainvoke(prompt)
+        return self._finish(prompt, response, time.perf_counter() - start, node, position, self.mode == "replay")
+
+
+def backend(inner, mode: str = LLM_MODE) -> LLMBackend:
+    """Wraps a runnable for the configured mode; pass inner=None in replay mode."""
+    return LLMBackend(inner, mode)
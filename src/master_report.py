@@ -0,0 +1,370 @@
+from typing import Optional
+
+from src.metrics import last_profile
+from src.rollups import build_rollups
+
+MASTER_REPORT = "dashboard15"
+
+# Fact tables are aggregated per "Project Id", so a reload only invalidates the projects
+# whose rows changed. Lookups feed every row, so any change to them rebuilds everything.
+FACT_SOURCES = [
+    "utilization_prediction_report", "previous_month_actual", "demand_base",
+    "fulfilment", "releases", "attrition",
+]
+LOOKUP_SOURCES = ["cost_file", "map_account", "map_tower", "map_location", "map_bu", "map_sbu"]
+
+# Weights of the effective-FTE formulas:
+#   eff_billed_fte = prev_billed + FULFILLED_BILLED_WEIGHT * fulfilled + OPEN_BILLED_WEIGHT * open - exits
+#   eff_total_fte  = prev_total  + fulfilled                           + OPEN_TOTAL_WEIGHT * open  - exits
+FULFILLED_BILLED_WEIGHT = 0.5
+OPEN_BILLED_WEIGHT = 0.2
+OPEN_TOTAL_WEIGHT = 0.5
+DEFAULT_WEIGHTS = (FULFILLED_BILLED_WEIGHT, OPEN_BILLED_WEIGHT, OPEN_TOTAL_WEIGHT)
+# The weights a report was built with are stored with its source versions under this name,
+# so refreshes after an upload keep them and a new choice rebuilds every row.
+WEIGHTS_SOURCE = "_weights"
+
+# dept_map (department name -> ID) is read from the whole utilization table and feeds every
+# row like a lookup, so a change to its pairs rebuilds everything too.
+DEPT_MAP_SOURCE = "dept_map"
+
+SOURCES_TABLE = "_mv_sources"
+DIGEST_TABLE = "_mv_digest"
+
+# Restricts a fact CTE to the projects being refreshed (NULL Project Id included).
+SCOPE_FILTER = """WHERE ("Project Id" IN (SELECT "Project Id" FROM _mv_scope)
+                    OR ("Project Id" IS NULL AND (SELECT COUNT(*) FROM _mv_scope WHERE "Project Id" IS NULL) > 0))"""
+
+MASTER_REPORT_SQL = """
+            WITH 
+            dept_map AS(
+            SELECT "HCM Department Name" AS department_name, ANY_VALUE("HCM Department ID") AS department_id
+            from utilization_prediction_report
+            where department_name IS NOT NULL
+            GROUP BY 1
+            ),
+            -- 1. Current Month Aggregation
+            util_summarized AS (
+                SELECT 
+                    "Project Id", Practice, "Utilization Location" AS Location, "Grade Name" AS Grade, 
+                    "HCM Department Name" AS department_name,
+                    COUNT("Associate ID") AS headcount,
+                    SUM(TRY_CAST("Billed FTE Internal" AS DOUBLE)) AS billed_fte,
+                    SUM(TRY_CAST("Total FTE" AS DOUBLE)) AS total_fte,
+                    ANY_VALUE("BU") AS bu_id,
+                    ANY_VALUE("Customer Id") AS account_id,
+                    ANY_VALUE("Project Name") AS project_name,
+                    ANY_VALUE("Project Type") AS project_type,
+                    ANY_VALUE("Project Billability") AS project_billability,
+                    ANY_VALUE("Customer Name") AS customer_name,
+                    ANY_VALUE("ParentCustomerID") AS parent_customer_id,
+                    ANY_VALUE("Parent Customer") AS parent_customer,
+                    ANY_VALUE("Is Onsite") AS is_onsite
+                FROM utilization_prediction_report
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+            -- 2. Previous Month Aggregation (Now with Descriptive attributes)
+            previous_util AS (
+                SELECT 
+                    "Project Id", Practice, "Utilization Location" AS Location, "Grade Name" AS Grade,
+                    "HCM Department Name" AS department_name,
+                    SUM(TRY_CAST("Billed FTE Internal" AS DOUBLE)) AS prev_mon_billed_fte,
+                    SUM(TRY_CAST("Total FTE" AS DOUBLE)) AS prev_mon_total_fte,
+                    ANY_VALUE("BU") AS bu_id,
+                    ANY_VALUE("Customer Id") AS account_id,
+                    ANY_VALUE("Project Name") AS project_name,
+                    ANY_VALUE("Project Type") AS project_type,
+                    ANY_VALUE("Project Billability") AS project_billability,
+                    ANY_VALUE("Customer Name") AS customer_name,
+                    ANY_VALUE("ParentCustomerID") AS parent_customer_id,
+                    ANY_VALUE("Parent Customer") AS parent_customer
+                FROM previous_month_actual
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+            -- 2. Your Demand Summary (already correct)
+            demand_summary AS (
+                SELECT "Project Id", Practice, Location, "Grade HR" AS Grade, 
+                "Pool Name" AS department_name,
+                COUNT(*) AS dem_count,
+                ANY_VALUE("BU") AS bu_id,
+                ANY_VALUE("Account Id") AS account_id,
+                ANY_VALUE("Project Description") AS project_name,
+                ANY_VALUE("Project Type") AS project_type,
+                ANY_VALUE("Project Billability") AS project_billability,
+                ANY_VALUE("Account Name") AS customer_name,
+                ANY_VALUE("Account ID") AS customer_id,
+                ANY_VALUE("Parent Customer ID") AS parent_customer_id,
+                ANY_VALUE("Parent Customer") AS parent_customer
+                FROM demand_base
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+            fulfilment_summary AS (
+                SELECT "Project Id", Practice, Location, "Associate Hired Grade" AS Grade, 
+                "Pool Name" AS department_name,
+                SUM(TRY_CAST("FTE Impact" AS DOUBLE)) AS fulfil_count
+                FROM fulfilment
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+
+            release_summary AS (
+            SELECT "Project Id", Practice, Location, Grade, "Department Name" AS department_name,
+                SUM(TRY_CAST("Impact FTE" AS DOUBLE)) AS rel_count
+                FROM releases
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+            attrition_summary AS (
+            SELECT "Project Id", Practice, Location, Grade, "Department Name" AS department_name,
+                SUM(TRY_CAST("FTE Impact" AS DOUBLE)) AS attr_count
+                FROM attrition
+                {scope}
+                GROUP BY 1, 2, 3, 4, 5
+            ),
+            -- New Cleaned Up Account Map
+            map_account_unique AS (
+            SELECT "Account ID", ANY_VALUE("PDL ID") AS "PDL ID", ANY_VALUE("PDL Name") AS "PDL Name"
+            FROM map_account
+            GROUP BY "Account ID"
+            ),
+
+            -- 3. Master Keys
+            master_keys AS (
+                SELECT "Project Id", Practice, Location, Grade, department_name FROM util_summarized
+                UNION 
+                SELECT "Project Id", Practice, Location, Grade, department_name FROM previous_util
+                UNION
+                SELECT "Project Id", practice, Location, Grade, department_name From demand_summary
+            )
+
+            -- 4. Final Join
+            SELECT  
+                m."Project Id", 
+                COALESCE(u.project_name, p.project_name, d.project_name) AS project_name,
+                COALESCE(u.project_type, p.project_type, d.project_type) AS project_type,
+                COALESCE(u.project_billability, p.project_billability, d.project_billability) AS project_billability,
+                m.Practice, m.Location, m.Grade,
+                -- Pull from Current, fallback to Previous
+                
+                COALESCE(u.account_id, p.account_id, d.account_id) AS customer_id,
+                COALESCE(u.customer_name, p.customer_name, d.customer_name) AS customer_name,
+                COALESCE(u.parent_customer_id, p.parent_customer_id, d.parent_customer_id) AS parent_customer_id,
+                COALESCE(u.parent_customer, p.parent_customer, d.parent_customer) AS parent_customer_name,
+                COALESCE(u.bu_id, p.bu_id, d.bu_id) AS BU,
+                m.department_name, d_map.department_id, t_map.Tower,
+                
+                --ROUND(COALESCE(u.billed_fte, 0), 5) AS billed_fte, 
+                COALESCE(r.rel_count, 0) AS release_count,
+                COALESCE(a.attr_count, 0) AS attr_count,
+                COALESCE(d.dem_count, 0) AS open_demands, 
+                COALESCE(f.fulfil_count, 0) AS demands_fulfilled,
+                
+                -- ALL computed columns
+                ROUND(CAST(c.Cost AS DOUBLE), 5) AS std_cost,
+                
+                ROUND(COALESCE(p.prev_mon_billed_fte, 0), 5) AS prev_mon_billed_fte,
+                ROUND(COALESCE(p.prev_mon_total_fte, 0), 5) AS prev_mon_total_fte,
+                
+                ROUND((COALESCE(p.prev_mon_billed_fte, 0) + COALESCE({fulfilled_billed} * demands_fulfilled, 0) + COALESCE({open_billed} *open_demands, 0) - COALESCE(attr_count, 0) - COALESCE(release_count, 0) ), 5) AS eff_billed_fte,
+                ROUND((COALESCE(p.prev_mon_total_fte, 0) + COALESCE( demands_fulfilled, 0) + COALESCE({open_total} * open_demands, 0) - COALESCE(attr_count, 0) - COALESCE(release_count, 0) ), 5) AS eff_total_fte,
+                
+                ROUND((COALESCE(p.prev_mon_billed_fte, 0) * std_cost), 5) AS prev_billed_cost,
+                ROUND((COALESCE(p.prev_mon_total_fte, 0) * std_cost), 5) AS prev_mon_total_cost,
+                
+                ROUND((eff_billed_fte * std_cost), 5) AS proj_billed_cost,
+                ROUND((eff_total_fte * std_cost), 5) AS proj_total_cost,
+                
+                l_map.Country, l_map.Geo,
+                b_map.SBU, b_map.Market,
+                a_map."PDL ID",
+                a_map."PDL Name",
+                s_map."SBU Head ID",
+                s_map."SBU Head Name"
+                
+            FROM master_keys m
+            LEFT JOIN dept_map d_map ON m.department_name = d_map.department_name
+            LEFT JOIN map_tower t_map ON d_map.department_id = t_map."Department ID"
+            LEFT JOIN util_summarized u ON m."Project Id" = u."Project Id" AND m.Practice = u.Practice AND m.Location = u.Location AND m.Grade = u.Grade AND m.department_name = u.department_name
+            LEFT JOIN previous_util p ON m."Project Id" = p."Project Id" AND m.Practice = p.Practice AND m.Location = p.Location AND m.Grade = p.Grade AND m.department_name = p.department_name
+            LEFT JOIN demand_summary d ON m."Project Id" = d."Project Id" AND m.Practice = d.Practice AND m.Location = d.Location AND m.Grade = d.Grade AND m.department_name = d.department_name
+            -- IMPORTANT: Join map tables to m (master) or COALESCE values to ensure they work for closed projects
+            LEFT JOIN map_location l_map ON m.Location = l_map."Utilization Location"
+            LEFT JOIN cost_file c ON m.Practice = c.Practice AND l_map.Country = c.Country AND m.Grade = c."Grade name"
+            LEFT JOIN map_bu b_map ON COALESCE(u.bu_id, p.bu_id, d.bu_id) = b_map.BU
+            LEFT JOIN map_sbu s_map ON b_map.SBU = s_map.SBU
+            LEFT JOIN map_account_unique a_map ON COALESCE(u.account_id, p.account_id) = a_map."Account ID"
+            -- Demand and Release still join to m/u/p logic
+            LEFT JOIN fulfilment_summary f ON m."Project Id" = f."Project Id" AND m.Practice = f.Practice AND m.Location = f.Location AND m.Grade = f.Grade AND m.department_name = f.department_name
+            LEFT JOIN attrition_summary a ON m."Project Id" = a."Project Id" AND m.Practice = a.Practice AND m.Location = a.Location AND m.Grade = a.Grade AND m.department_name = a.department_name
+            LEFT JOIN release_summary r ON m."Project Id" = r."Project Id" AND m.Practice = r.Practice AND m.Location = r.Location AND m.Grade = r.Grade AND m.department_name = r.department_name
+"""
+
+
+def master_report_sql(scoped: bool = False, weights: tuple = DEFAULT_WEIGHTS) -> str:
+    """The consolidation query; scoped=True limits every fact CTE to the projects in _mv_scope.
+
+    weights are (fulfilled billed, open billed, open total), see the effective-FTE formulas above.
+    """
+    fulfilled_billed, open_billed, open_total = (float(w) for w in weights)
+    return MASTER_REPORT_SQL.format(scope=SCOPE_FILTER if scoped else "", fulfilled_billed=fulfilled_billed,
+                                    open_billed=open_billed, open_total=open_total)
+
+
+def _ensure_state(con):
+    con.execute(f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} (report VARCHAR, source VARCHAR, version VARCHAR)")
+    con.execute(f'CREATE TABLE IF NOT EXISTS {DIGEST_TABLE} (source VARCHAR, "Project Id" VARCHAR, digest HUGEINT)')
+
+
+def _relation_type(con, name: str) -> Optional[str]:
+    row = con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [name]
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _content_columns(con, table_name: str) -> str:
+    cols = [r[0] for r in con.execute(f'DESCRIBE "{table_name}"').fetchall() if r[0] != "load_date"]
+    return ", ".join(f'"{c}"' for c in cols)
+
+
+def source_version(con, table_name: str) -> Optional[str]:
+    """Row count plus an order-independent content hash; load_date is ignored so identical reloads match."""
+    if not _relation_type(con, table_name):
+        return None
+    count, total = con.execute(
+        f'SELECT COUNT(*), SUM(hash({_content_columns(con, table_name)})::HUGEINT) FROM "{table_name}"'
+    ).fetchone()
+    return f"{count}|{total}"
+
+
+def dept_map_version(con) -> Optional[str]:
+    """Version of the distinct department name/ID pairs the dept_map CTE chooses from."""
+    if not _relation_type(con, "utilization_prediction_report"):
+        return None
+    count, total = con.execute("""
+        SELECT COUNT(*), SUM(hash(name, id)::HUGEINT) FROM (
+            SELECT DISTINCT "HCM Department Name" AS name, "HCM Department ID" AS id
+            FROM utilization_prediction_report WHERE "HCM Department Name" IS NOT NULL
+        )
+    """).fetchone()
+    return f"{count}|{total}"
+
+
+def _project_digests_sql(table_name: str, columns: str) -> str:
+    return f"""
+        SELECT '{table_name}' AS source, CAST("Project Id" AS VARCHAR) AS "Project Id",
+            SUM(hash({columns})::HUGEINT) AS digest
+        FROM "{table_name}" GROUP BY 2
+    """
+
+
+def _stored_versions(con, report: str) -> dict:
+    return dict(con.execute(f"SELECT source, version FROM {SOURCES_TABLE} WHERE report = ?", [report]).fetchall())
+
+
+def _save_versions(con, report: str, versions: dict):
+    con.execute(f"DELETE FROM {SOURCES_TABLE} WHERE report = ?", [report])
+    con.executemany(f"INSERT INTO {SOURCES_TABLE} VALUES (?, ?, ?)", [(report, s, v) for s, v in versions.items()])
+
+
+def _weights_version(weights: tuple) -> str:
+    return ",".join(str(float(w)) for w in weights)
+
+
+def _parse_weights(version: Optional[str]) -> Optional[tuple]:
+    return tuple(float(w) for w in version.split(",")) if version else None
+
+
+def refresh_master_report(con, force: bool = False, weights: Optional[tuple] = None) -> dict:
+    """Brings the materialized master report up to date with its source tables.
+
+    Nothing is recomputed when no source changed. When only fact tables changed, per-project
+    digests of those tables identify the affected Project Ids and only their rows are
+    rebuilt; a lookup change (including a new department name/ID pairing in the utilization
+    report), a missing report, new weights or force=True triggers a full rebuild.
+    weights (fulfilled billed, open billed, open total) default to those the report was last
+    built with, or DEFAULT_WEIGHTS for a first build.
+    The roll-up table (see src.rollups) is rebuilt in the same transaction.
+    Returns {"mode": "fresh" | "partial" | "full", "changed": [...], "projects": n, "profile": json}, where
+    profile is the DuckDB profile of the build statement when profiling is enabled on con (else None).
+    """
+    _ensure_state(con)
+    stored = _stored_versions(con, MASTER_REPORT)
+    weights = weights or _parse_weights(stored.get(WEIGHTS_SOURCE)) or DEFAULT_WEIGHTS
+    versions = {s: source_version(con, s) for s in FACT_SOURCES + LOOKUP_SOURCES}
+    versions[DEPT_MAP_SOURCE] = dept_map_version(con)
+    versions[WEIGHTS_SOURCE] = _weights_version(weights)
+    changed = [s for s, v in versions.items() if stored.get(s) != v]
+    report_type = _relation_type(con, MASTER_REPORT)
+
+    if report_type == "BASE TABLE" and not changed and not force:
+        return {"mode": "fresh", "changed": [], "projects": 0, "profile": None}
+
+    full = force or report_type != "BASE TABLE" or any(
+        s in LOOKUP_SOURCES + [DEPT_MAP_SOURCE, WEIGHTS_SOURCE] for s in changed)
+    profile = None
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if full:
+            if report_type == "VIEW":
+                con.execute(f"DROP VIEW {MASTER_REPORT}")
+            con.execute(f"CREATE OR REPLACE TABLE {MASTER_REPORT} AS {master_report_sql(weights=weights)}")
+            profile = last_profile(con)
+            con.execute(f"DELETE FROM {DIGEST_TABLE}")
+            for source in FACT_SOURCES:
+                con.execute(f"INSERT INTO {DIGEST_TABLE} {_project_digests_sql(source, _content_columns(con, source))}")
+            projects = con.execute(f'SELECT COUNT(DISTINCT "Project Id") FROM {MASTER_REPORT}').fetchone()[0]
+        else:
+            con.execute(f'CREATE OR REPLACE TEMP TABLE _mv_scope ("Project Id" VARCHAR)')
+            for source in changed:
+                con.execute(f"CREATE OR REPLACE TEMP TABLE _mv_new_digest AS "
+                            f"{_project_digests_sql(source, _content_columns(con, source))}")
+                con.execute(f"""
+                    INSERT INTO _mv_scope
+                    SELECT COALESCE(n."Project Id", o."Project Id")
+                    FROM _mv_new_digest n
+                    FULL OUTER JOIN (SELECT * FROM {DIGEST_TABLE} WHERE source = ?) o
+                        ON n."Project Id" IS NOT DISTINCT FROM o."Project Id"
+                    WHERE n.digest IS DISTINCT FROM o.digest
+                """, [source])
+                con.execute(f"DELETE FROM {DIGEST_TABLE} WHERE source = ?", [source])
+                con.execute(f"INSERT INTO {DIGEST_TABLE} SELECT * FROM _mv_new_digest")
+                con.execute("DROP TABLE _mv_new_digest")
+
+            projects = con.execute('SELECT COUNT(DISTINCT COALESCE("Project Id", chr(0))) FROM _mv_scope').fetchone()[0]
+            if projects:
+                con.execute(f"""
+                    DELETE FROM {MASTER_REPORT}
+                    WHERE ("Project Id" IN (SELECT "Project Id" FROM _mv_scope)
+                        OR ("Project Id" IS NULL AND (SELECT COUNT(*) FROM _mv_scope WHERE "Project Id" IS NULL) > 0))
+                """)
+                con.execute(f"INSERT INTO {MASTER_REPORT} BY NAME {master_report_sql(scoped=True, weights=weights)}")
+                profile = last_profile(con)
+            con.execute("DROP TABLE _mv_scope")
+
+        # Level-based questions read the roll-up instead of scanning the detail
+        build_rollups(con, MASTER_REPORT)
+        _save_versions(con, MASTER_REPORT, versions)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return {"mode": "full" if full else "partial", "changed": changed, "projects": projects, "profile": profile}
+
+
+def is_materialized(con) -> bool:
+    return _relation_type(con, MASTER_REPORT) == "BASE TABLE"
+
+
+def report_version(con) -> Optional[str]:
+    """Identifies the source data the materialized report was last refreshed from ("" before state exists)."""
+    if not is_materialized(con):
+        return None
+    if not _relation_type(con, SOURCES_TABLE):
+        return ""
+    rows = con.execute(f"SELECT source, version FROM {SOURCES_TABLE} WHERE report = ? ORDER BY source",
+                       [MASTER_REPORT]).fetchall()
+    return "|".join(f"{s}={v}" for s, v in rows)
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import resource
+import uuid
+import inspect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+
+from src.db import get_manager
+
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE = "_metrics"
+RETENTION_DAYS = int(os.getenv("OPS_ASSIST_METRICS_RETENTION_DAYS", "30"))
+# Stages recorded outside a question; summarized over their own last N runs
+BACKGROUND_STAGES = ["ingest", "master_report"]
+
+# Question being answered in this context; node wrappers set it so LLM calls made inside are attributed
+_run_id: ContextVar[Optional[str]] = ContextVar("metrics_run_id", default=None)
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+RSS_SAMPLE_SECONDS = float(os.getenv("OPS_ASSIST_RSS_SAMPLE_SECONDS", "0.05"))
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident memory of this process right now, in MB; None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def self_peak_rss_mb() -> float:
+    """Lifetime peak resident memory of the calling process (ru_maxrss), in MB.
+
+    Parse workers call this before returning, so an ingest can report its workers' peak:
+    they are separate processes, and the parent's RUSAGE_CHILDREN only keeps the largest
+    child since startup, which a later, smaller ingest would inherit.
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class PeakRss:
+    """Peak resident memory of this process between enter and exit, in MB (None without /proc).
+
+    A sampling thread runs while any block is open; concurrent stages (nodes running in
+    parallel, a background ingest) each get their own peak, which a process-wide high
+    water mark reset through /proc/self/clear_refs could not give them.
+    """
+
+    _lock = threading.Lock()
+    _open: Dict[int, "PeakRss"] = {}
+    _sampler: Optional[threading.Thread] = None
+
+    def __init__(self):
+        self.mb: Optional[float] = None
+
+    def _observe(self, rss: Optional[float]):
+        if rss is not None:
+            self.mb = rss if self.mb is None else max(self.mb, rss)
+
+    @classmethod
+    def _sample(cls):
+        while True:
+            time.sleep(RSS_SAMPLE_SECONDS)
+            rss = current_rss_mb()
+            with cls._lock:
+                if not cls._open:
+                    cls._sampler = None
+                    return
+                for peak in cls._open.values():
+                    peak._observe(rss)
+
+    def __enter__(self) -> "PeakRss":
+        self._observe(current_rss_mb())
+        with self._lock:
+            PeakRss._open[id(self)] = self
+            if PeakRss._sampler is None:
+                PeakRss._sampler = threading.Thread(target=PeakRss._sample, name="rss-sampler", daemon=True)
+                PeakRss._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            PeakRss._open.pop(id(self), None)
+        self._observe(current_rss_mb())
+
+
+class MetricsStore:
+    """Appends timings to the _metrics table through a dedicated cursor, so recording never waits on the writer.
+
+    Failures to record are logged, not raised: instrumentation must not break the step it measures.
+    """
+
+    def __init__(self, db_path: str):
+        self._con = get_manager(db_path).cursor()
+        self._lock = threading.Lock()
+        with self._lock:
+            self._con.execute(f"""
+                CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, run_id VARCHAR, stage VARCHAR,
+                    seconds DOUBLE, est_prompt_tokens INTEGER, est_completion_tokens INTEGER, rows BIGINT,
+                    rss_mb DOUBLE, workers_rss_mb DOUBLE, profile VARCHAR, detail VARCHAR
+                )
+            """)
+            # Tables created by earlier versions: token counts were always len/4 estimates
+            columns = {r[0] for r in self._con.execute(f"DESCRIBE {METRICS_TABLE}").fetchall()}
+            for old, new in [("prompt_tokens", "est_prompt_tokens"), ("completion_tokens", "est_completion_tokens")]:
+                if old in columns:
+                    self._con.execute(f"ALTER TABLE {METRICS_TABLE} RENAME COLUMN {old} TO {new}")
+            for column in ["rss_mb", "workers_rss_mb"]:
+                self._con.execute(f"ALTER TABLE {METRICS_TABLE} ADD COLUMN IF NOT EXISTS {column} DOUBLE")
+            self._con.execute(
+                f"DELETE FROM {METRICS_TABLE} WHERE recorded_at < CURRENT_TIMESTAMP - to_days(CAST(? AS INTEGER))",
+                [RETENTION_DAYS]
+            )
+
+    def record(self, stage: str, seconds: float, run_id: Optional[str] = None,
+               est_prompt_tokens: Optional[int] = None, est_completion_tokens: Optional[int] = None,
+               rows: Optional[int] = None, profile: Optional[str] = None, detail: Optional[str] = None,
+               peak: Optional[PeakRss] = None, workers_rss_mb: Optional[float] = None):
+        """Appends one measurement. rss_mb is the stage's peak when it ran under a PeakRss (peak),
+        else the resident memory at the time of recording."""
+        rss_mb = peak.mb if peak is not None else current_rss_mb()
+        try:
+            with self._lock:
+                self._con.execute(
+                    f"INSERT INTO {METRICS_TABLE} (run_id, stage, seconds, est_prompt_tokens, est_completion_tokens, "
+                    f"rows, rss_mb, workers_rss_mb, profile, detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [run_id or _run_id.get(), stage, seconds, est_prompt_tokens, est_completion_tokens, rows,
+                     rss_mb, workers_rss_mb, profile, detail]
+                )
+        except duckdb.Error as e:
+            logger.warning("Could not record %s metric: %s", stage, e)
+
+    def stage_summary(self, last_questions: int, last_runs: int = 20) -> pd.DataFrame:
+        """p50/p95 seconds per stage over the last questions, plus the background stages' last runs."""
+        with self._lock:
+            return self._con.execute(f"""
+                WITH recent_questions AS (
+                    SELECT run_id FROM {METRICS_TABLE} WHERE stage = 'question' ORDER BY recorded_at DESC LIMIT ?
+                ),
+                recent AS (
+                    SELECT * FROM {METRICS_TABLE} WHERE run_id IN (SELECT run_id FROM recent_questions)
+                    UNION ALL BY NAME
+                    SELECT * FROM {METRICS_TABLE} WHERE stage IN ({", ".join("?" for _ in BACKGROUND_STAGES)})
+                    QUALIFY row_number() OVER (PARTITION BY stage ORDER BY recorded_at DESC) <= ?
+                )
+                SELECT stage, COUNT(*) AS runs,
+                       quantile_cont(seconds, 0.5) AS p50_s, quantile_cont(seconds, 0.95) AS p95_s,
+                       ROUND(AVG(est_prompt_tokens)) AS est_prompt_tokens,
+                       ROUND(AVG(est_completion_tokens)) AS est_completion_tokens,
+                       ROUND(median(rows / NULLIF(seconds, 0))) AS rows_per_s, MAX(rss_mb) AS max_rss_mb,
+                       MAX(workers_rss_mb) AS max_workers_rss_mb
+                FROM recent GROUP BY stage ORDER BY p50_s DESC
+            """, [last_questions, *BACKGROUND_STAGES, last_runs]).df()
+
+    def latest_profile(self, stage: str) -> Optional[str]:
+        with self._lock:
+            row = self._con.execute(
+                f"SELECT profile FROM {METRICS_TABLE} WHERE stage = ? AND profile IS NOT NULL "
+                f"ORDER BY recorded_at DESC LIMIT 1", [stage]
+            ).fetchone()
+        return row[0] if row else None
+
+
+_stores: Dict[str, MetricsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_metrics(db_path: str) -> MetricsStore:
+    """The process-wide metrics store for path, created on first use."""
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = MetricsStore(db_path)
+        return _stores[db_path]
+
+
+def timed_node(db_path: str, name: str, fn: Callable):
+    """Wraps a LangGraph node (sync or async) to record its wall time and peak RSS under "node:<name>".
+
+    The state's run_id is made current while the node runs, so LLM calls inside it are attributed.
+    """
+    def start(state) -> Tuple[float, object]:
+        return time.perf_counter(), _run_id.set(state.get("run_id"))
+
+    def finish(started: float, token, peak: PeakRss):
+        get_metrics(db_path).record(f"node:{name}", time.perf_counter() - started, peak=peak)
+        _run_id.reset(token)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            started, token = start(state)
+            peak = PeakRss()
+            try:
+                with peak:
+                    return await fn(state)
+            finally:
+                finish(started, token, peak)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        started, token = start(state)
+        peak = PeakRss()
+        try:
+            with peak:
+                return fn(state)
+        finally:
+            finish(started, token, peak)
+    return wrapper
+
+
+def llm_listener(db_path: str) -> Callable:
+    """An src.llm listener recording each model call under "llm:<node>" with its estimated token counts."""
+    def listener(call):
+        get_metrics(db_path).record(f"llm:{call.node or 'other'}", call.seconds, est_prompt_tokens=call.prompt_tokens,
+                                    est_completion_tokens=call.response_tokens, detail=call.kind)
+    return listener
+
+
+@contextmanager
+def profiling(con):
+    """Enables DuckDB profiling on con for the block; read each statement's profile with last_profile."""
+    con.execute("SET enable_profiling = 'no_output'")
+    try:
+        yield
+    finally:
+        con.execute("RESET enable_profiling")
+
+
+def last_profile(con) -> Optional[str]:
+    """Compact JSON profile of the last statement run on con, or None when profiling is off."""
+    profile = json.loads(con.get_profiling_information(format="json"))
+    return json.dumps(profile, separators=(",", ":")) if "query_name" in profile else None
+
+
+def hot_operators(profile: str, n: int = 3) -> List[Tuple[str, float]]:
+    """The n operators with the most time in a profile, as (name, seconds)."""
+    operators, stack = [], [json.loads(profile)]
+    while stack:
+        node = stack.pop()
+        if "operator_name" in node:
+            operators.append((node["operator_name"], node.get("operator_timing", 0.0)))
+        stack.extend(node.get("children", []))
+    return sorted(operators, key=lambda o: o[1], reverse=True)[:n]
@@ -0,0 +1,93 @@
+import os
+import json
+import math
+import threading
+from typing import List, Tuple
+
+import duckdb
+
+# Budget for LLM-written SQL: plans whose largest operator is estimated above
+# MAX_PLAN_ROWS are rejected before they run, and anything that still runs
+# longer than QUERY_TIMEOUT_SECONDS is interrupted.
+MAX_PLAN_ROWS = int(os.getenv("OPS_ASSIST_MAX_PLAN_ROWS", "50000000"))
+QUERY_TIMEOUT_SECONDS = float(os.getenv("OPS_ASSIST_QUERY_TIMEOUT_SECONDS", "30"))
+
+_JOIN_WITHOUT_KEYS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN"}
+
+
+class QueryRejected(Exception):
+    """Raised for SQL that fails the pre-flight check or exceeds the timeout; the message is meant for the LLM."""
+
+
+def _estimates(node: dict, out: List[Tuple[str, int]]) -> int:
+    """Appends (operator, estimated rows) for node and its subtree to out; returns node's estimate.
+
+    Operators DuckDB leaves unestimated inherit from their inputs: the product for joins
+    without keys, the largest input otherwise.
+    """
+    children = [_estimates(child, out) for child in node.get("children", [])]
+    try:
+        rows = int(node.get("extra_info", {}).get("Estimated Cardinality", 0))
+    except (TypeError, ValueError):
+        rows = 0
+    if not rows and children:
+        rows = math.prod(children) if node["name"] in _JOIN_WITHOUT_KEYS else max(children)
+    out.append((node["name"], rows))
+    return rows
+
+
+def plan_estimates(con, sql: str) -> List[Tuple[str, int]]:
+    """(operator, estimated rows) for every operator of the physical plan.
+
+    Parser and binder errors surface here as duckdb exceptions, before any data is read.
+    """
+    row = con.execute(f"EXPLAIN (FORMAT json) {sql}").fetchone()
+    estimates = []
+    for root in json.loads(row[1]):
+        _estimates(root, estimates)
+    return estimates
+
+
+def check_read_only(sql: str):
+    """Raises QueryRejected unless sql is a single SELECT statement (WITH ... SELECT included).
+
+    Read cursors share the database with the writer, so this is what keeps LLM-written SQL
+    from modifying data outside the writer lock.
+    """
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1:
+        raise QueryRejected(f"Expected exactly one SQL statement, got {len(statements)}. Return a single SELECT query.")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise QueryRejected(
+            f"Only read-only SELECT queries may be run, not {statements[0].type.name}. Return a single SELECT query."
+        )
+
+
+def check_plan(con, sql: str, max_rows: int = MAX_PLAN_ROWS):
+    """Raises QueryRejected for anything but a single SELECT, or when any operator is estimated
+    to produce more than max_rows rows."""
+    check_read_only(sql)
+    name, rows = max(plan_estimates(con, sql), key=lambda op: op[1], default=("", 0))
+    if rows <= max_rows:
+        return
+    if name in _JOIN_WITHOUT_KEYS:
+        raise QueryRejected(
+            f"The query joins tables without a join condition ({name}, ~{rows:,} estimated rows). "
+            f"Join on matching key columns instead."
+        )
+    raise QueryRejected(
+        f"The query is estimated to produce ~{rows:,} intermediate rows ({name}), above the limit of "
+        f"{max_rows:,}. Filter or aggregate earlier."
+    )
+
+
+def run_with_timeout(con, fn, timeout: float = QUERY_TIMEOUT_SECONDS):
+    """Calls fn(), interrupting whatever con is executing once timeout seconds have passed."""
+    timer = threading.Timer(timeout, con.interrupt)
+    timer.start()
+    try:
+        return fn()
+    except duckdb.InterruptException:
+        raise QueryRejected(f"The query was stopped after {timeout:g} seconds. Make it cheaper.")
+    finally:
+        timer.cancel()
@@ -0,0 +1,42 @@
+from typing import List, Optional, Tuple
+
+from src.db import quote_identifier
+
+PAGE_SIZE = 100
+
+
+def search_filter(columns: List[str], search: Optional[str]) -> Tuple[str, list]:
+    """WHERE clause and parameters matching rows where any column contains search (case-insensitive).
+
+    The columns are concatenated into one string per row inside DuckDB, so the filter is
+    a single vectorized ILIKE instead of a Python loop over every cell.
+    """
+    if not search or not columns:
+        return "", []
+    row_text = f"concat_ws(chr(31), {', '.join(f'CAST({quote_identifier(c)} AS VARCHAR)' for c in columns)})"
+    # % and _ in the search text are matched literally
+    pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"WHERE {row_text} ILIKE ? ESCAPE '\\'", [f"%{pattern}%"]
+
+
+def count_rows(con, table: str, columns: List[str], search: Optional[str] = None) -> int:
+    where, params = search_filter(columns, search)
+    return con.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)} {where}", params).fetchone()[0]
+
+
+def page_order(con, table: str) -> str:
+    """ORDER BY that keeps pages stable between queries: storage order for tables, every column for views."""
+    is_view = con.execute(
+        "SELECT 1 FROM duckdb_views() WHERE view_name = ? AND NOT internal", [table]
+    ).fetchone()
+    return "ORDER BY ALL" if is_view else "ORDER BY rowid"
+
+
+def fetch_page(con, table: str, columns: List[str], page: int = 0, page_size: int = PAGE_SIZE,
+               search: Optional[str] = None):
+    """One page of table (optionally filtered by search) as a DataFrame."""
+    where, params = search_filter(columns, search)
+    return con.execute(
+        f"SELECT * FROM {quote_identifier(table)} {where} {page_order(con, table)} "
+        f"LIMIT {int(page_size)} OFFSET {int(page) * int(page_size)}", params
+    ).df()
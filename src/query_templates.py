@@ -0,0 +1,188 @@
+import re
+import json
+import hashlib
+from typing import List, Optional, Tuple
+
+QUERY_TEMPLATES_TABLE = "_query_templates"
+
+# Text literals shorter than this are too likely to match unrelated words in the question.
+# Numbers have no minimum: they only match a whole number in the question ("top 5").
+MIN_SLOT_LENGTH = 2
+
+_STRING_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+_QUOTED_IDENTIFIER = re.compile(r'"(?:[^"]|"")*"')
+_NUMBER_LITERAL = re.compile(r"(?<![\w.\"])(\d+(?:\.\d+)?)(?![\w.\"])")
+
+
+def ensure_query_templates(con):
+    """Creates the template table."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUERY_TEMPLATES_TABLE} (
+            schema_fingerprint VARCHAR, skeleton VARCHAR, sql_template VARCHAR, slots VARCHAR,
+            uses BIGINT DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (schema_fingerprint, skeleton)
+        )
+    """)
+
+
+def schema_fingerprint(columns_by_table: dict) -> str:
+    """Hash of the selected tables and their column names/types."""
+    raw = "\n".join(
+        f"{table}:" + ",".join(f"{name} {col_type}" for name, col_type in columns)
+        for table, columns in sorted(columns_by_table.items())
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _collapse(question: str) -> str:
+    """Collapses whitespace and drops trailing punctuation, keeping the question's case."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.! ")
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, collapses whitespace and drops trailing punctuation."""
+    return _collapse(question).lower()
+
+
+# Bare numbers are lifted only where they read as a value the user chose: a row limit or the
+# right-hand side of a comparison. A number elsewhere (ROUND(x, 2)) stays fixed.
+_NUMBER_SLOT_CONTEXT = re.compile(r"(?:\bLIMIT|<>|!=|<=|>=|=|<|>)\s*$", re.IGNORECASE)
+
+
+def parameterize(question: str, sql: str) -> Optional[Tuple[str, str, List[str]]]:
+    """Turns literals that the question itself supplied into numbered slots.
+
+    Returns (skeleton, sql_template, slot_kinds), where the skeleton is the normalized
+    question with "{pN}" in place of each lifted literal and the SQL carries the same
+    slots. Text slots are "text:<words>" and later match exactly that many words; number
+    slots are "number". Literals the question does not mention (e.g. a status filter the
+    model added) stay fixed. Returns None for SQL containing braces, which would clash with
+    the slots, and when a number the question mentions cannot be lifted unambiguously
+    (it occurs more than once in the SQL, or outside a LIMIT or comparison).
+    """
+    if "{" in sql or "}" in sql:
+        return None
+    skeleton, kinds, spans, lifted = normalize_question(question), [], [], {}
+
+    def mentioned(value: str) -> re.Pattern:
+        return re.compile(rf"(?<![\w{{}}]){re.escape(value.lower())}(?![\w{{}}])")
+
+    def lift(value: str, kind: str) -> Optional[str]:
+        nonlocal skeleton
+        if value.lower() in lifted:
+            return lifted[value.lower()]
+        pattern = mentioned(value)
+        if (kind.startswith("text") and len(value) < MIN_SLOT_LENGTH) or not pattern.search(skeleton):
+            return None
+        slot = f"{{p{len(kinds)}}}"
+        skeleton = pattern.sub(slot, skeleton, count=1)
+        kinds.append(kind)
+        lifted[value.lower()] = slot
+        return slot
+
+    for found in _STRING_LITERAL.finditer(sql):
+        literal = found.group(1).replace("''", "'")
+        core = literal.strip("%")
+        slot = lift(core, f"text:{len(core.split())}") if core.strip() else None
+        if slot:
+            spans.append((found.start(), found.end(), "'" + literal.replace(core, slot).replace("'", "''") + "'"))
+
+    # Blank out string literals and quoted identifiers so only bare numbers are considered.
+    masked = _QUOTED_IDENTIFIER.sub(lambda m: " " * len(m.group(0)), sql)
+    masked = _STRING_LITERAL.sub(lambda m: " " * len(m.group(0)), masked)
+    numbers = {}
+    for found in _NUMBER_LITERAL.finditer(masked):
+        numbers.setdefault(found.group(1), []).append(found)
+    for value, occurrences in numbers.items():
+        if not mentioned(value).search(skeleton):
+            continue
+        if len(occurrences) > 1 or not _NUMBER_SLOT_CONTEXT.search(masked[:occurrences[0].start(1)]):
+            return None
+        spans.append((occurrences[0].start(1), occurrences[0].end(1), lift(value, "number")))
+
+    sql_template, last = [], 0
+    for start, end, replacement in sorted(spans):
+        sql_template.append(sql[last:start] + replacement)
+        last = end
+    sql_template.append(sql[last:])
+    return skeleton, "".join(sql_template), kinds
+
+
+def _slot_group(kind: str) -> str:
+    if kind == "number":
+        return r"\d+(?:\.\d+)?"
+    words = int(kind.partition(":")[2] or 1)
+    return r"\S+" + r"(?: \S+)" * (words - 1)
+
+
+def _skeleton_regex(skeleton: str, kinds: List[str]) -> re.Pattern:
+    """Matches questions of the skeleton's shape, case-insensitively, so slot values keep their case."""
+    pattern = re.escape(skeleton)
+    for i, kind in enumerate(kinds):
+        pattern = pattern.replace(re.escape(f"{{p{i}}}"), f"(?P<p{i}>{_slot_group(kind)})", 1)
+    return re.compile(rf"^{pattern}$", re.IGNORECASE)
+
+
+def find(con, question: str, fingerprint: str) -> Optional[Tuple[str, str]]:
+    """(skeleton, sql) for the question from a stored template with new values bound, or None.
+
+    Does not count the use; call record_use for that.
+    """
+    templates = con.execute(
+        f"SELECT skeleton, sql_template, slots FROM {QUERY_TEMPLATES_TABLE} WHERE schema_fingerprint = ? "
+        f"ORDER BY uses DESC",
+        [fingerprint]
+    ).fetchall()
+    collapsed = _collapse(question)
+    for skeleton, sql_template, slots in templates:
+        kinds = json.loads(slots)
+        found = _skeleton_regex(skeleton, kinds).match(collapsed)
+        if not found:
+            continue
+        values = {
+            slot: value.replace("'", "''") if kinds[int(slot[1:])] != "number" else value
+            for slot, value in found.groupdict().items()
+        }
+        return skeleton, sql_template.format(**values)
+    return None
+
+
+def record_use(con, fingerprint: str, skeleton: str):
+    con.execute(
+        f"UPDATE {QUERY_TEMPLATES_TABLE} SET uses = uses + 1 WHERE schema_fingerprint = ? AND skeleton = ?",
+        [fingerprint, skeleton]
+    )
+
+
+def match(con, question: str, fingerprint: str) -> Optional[str]:
+    """SQL for the question from a stored template with new values bound, or None; counts the use."""
+    found = find(con, question, fingerprint)
+    if found is None:
+        return None
+    record_use(con, fingerprint, found[0])
+    return found[1]
+
+
+def remember(con, question: str, sql: str, fingerprint: str):
+    """Stores the SQL that answered question successfully as a reusable template."""
+    parameterized = parameterize(question, sql)
+    if parameterized is None:
+        return
+    skeleton, sql_template, kinds = parameterized
+    ensure_query_templates(con)
+    con.execute(f"""
+        INSERT OR REPLACE INTO {QUERY_TEMPLATES_TABLE} (schema_fingerprint, skeleton, sql_template, slots)
+        VALUES (?, ?, ?, ?)
+    """, [fingerprint, skeleton, sql_template, json.dumps(kinds)])
+
+
+def forget(con, question: str, fingerprint: str):
+    """Drops whichever template produced SQL for question, e.g. after that SQL failed."""
+    ensure_query_templates(con)
+    collapsed = _collapse(question)
+    for skeleton, slots in con.execute(
+        f"SELECT skeleton, slots FROM {QUERY_TEMPLATES_TABLE} WHERE schema_fingerprint = ?", [fingerprint]
+    ).fetchall():
+        if _skeleton_regex(skeleton, json.loads(slots)).match(collapsed):
+            con.execute(f"DELETE FROM {QUERY_TEMPLATES_TABLE} WHERE schema_fingerprint = ? AND skeleton = ?",
+                        [fingerprint, skeleton])
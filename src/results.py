@@ -0,0 +1,122 @@
+import os
+import time
+import uuid
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.metrics import last_profile
+
+# What may flow into the LangGraph state. Anything beyond this is spilled to Parquet and
+# the LLM gets a statistical digest of the full result instead of the rows themselves.
+MAX_STATE_ROWS = int(os.getenv("OPS_ASSIST_MAX_STATE_ROWS", "200"))
+MAX_STATE_BYTES = int(os.getenv("OPS_ASSIST_MAX_STATE_BYTES", str(256 * 1024)))
+FETCH_BATCH_ROWS = 10_000
+
+RESULT_DIR = os.getenv("OPS_ASSIST_RESULT_DIR", os.path.join(tempfile.gettempdir(), "ops_assist_results"))
+RESULT_TTL_SECONDS = 24 * 3600
+
+
+@dataclass
+class QueryResult:
+    columns: List[str]
+    rows: List[dict] = field(default_factory=list)
+    total_rows: int = 0
+    truncated: bool = False
+    artifact: Optional[str] = None
+    digest: str = ""
+    # DuckDB profile JSON of the query, when profiling was enabled on the connection
+    profile: Optional[str] = None
+
+
+def _new_artifact_path() -> str:
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    prune_artifacts()
+    return os.path.join(RESULT_DIR, f"{uuid.uuid4().hex}.parquet")
+
+
+def prune_artifacts(max_age: int = RESULT_TTL_SECONDS):
+    """Removes spilled results older than max_age seconds."""
+    cutoff = time.time() - max_age
+    for name in os.listdir(RESULT_DIR):
+        path = os.path.join(RESULT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def run_bounded(con, sql: str, max_rows: int = MAX_STATE_ROWS, max_bytes: int = MAX_STATE_BYTES) -> QueryResult:
+    """Executes sql and streams the result as Arrow batches, keeping at most max_rows/max_bytes in memory.
+
+    Results that fit are returned whole. Larger ones are written batch by batch to a Parquet
+    artifact (result.artifact) that the UI can page through or download, and the kept rows
+    become a preview alongside a digest of the full result.
+    """
+    reader = con.execute(sql).fetch_record_batch(FETCH_BATCH_ROWS)
+    result = QueryResult(columns=reader.schema.names)
+    kept, kept_rows, kept_bytes = [], 0, 0
+    writer = None
+
+    for batch in reader:
+        result.total_rows += batch.num_rows
+        if writer is None and kept_rows + batch.num_rows <= max_rows and kept_bytes + batch.nbytes <= max_bytes:
+            kept.append(batch)
+            kept_rows += batch.num_rows
+            kept_bytes += batch.nbytes
+            continue
+        if writer is None:
+            result.truncated = True
+            result.artifact = _new_artifact_path()
+            writer = pq.ParquetWriter(result.artifact, reader.schema)
+            for previous in kept:
+                writer.write_batch(previous)
+            kept = _head(kept, batch, max_rows, max_bytes)
+        writer.write_batch(batch)
+    result.profile = last_profile(con)
+
+    if writer is not None:
+        writer.close()
+        result.digest = digest(con, result.artifact)
+
+    table = pa.Table.from_batches(kept, schema=reader.schema)
+    result.rows = table.to_pylist()
+    return result
+
+
+def _head(kept: List[pa.RecordBatch], batch: pa.RecordBatch, max_rows: int, max_bytes: int) -> List[pa.RecordBatch]:
+    """Trims the preview to the row and byte caps, topping it up from the batch that overflowed."""
+    table = pa.Table.from_batches(kept + [batch], schema=batch.schema).slice(0, max_rows)
+    if table.num_rows and table.nbytes > max_bytes:
+        table = table.slice(0, max(1, int(table.num_rows * max_bytes / table.nbytes)))
+    return table.to_batches()
+
+
+def digest(con, artifact: str) -> str:
+    """Per-column summary (type, min, max, distinct, mean, nulls) of a spilled result."""
+    summary = con.execute(f"SUMMARIZE SELECT * FROM read_parquet('{artifact}')").df()
+    keep = ["column_name", "column_type", "min", "max", "approx_unique", "avg", "null_percentage"]
+    return summary[[c for c in keep if c in summary.columns]].to_string(index=False)
+
+
+def format_for_llm(result: QueryResult) -> str:
+    """The text handed to the summarizer: the whole result when small, a preview plus digest otherwise."""
+    preview = pd.DataFrame(result.rows, columns=result.columns).to_string(index=False)
+    if not result.truncated:
+        return preview
+    return (
+        f"The query returned {result.total_rows:,} rows; showing the first {len(result.rows):,}.\n"
+        f"{preview}\n\n"
+        f"Column statistics over all {result.total_rows:,} rows:\n{result.digest}"
+    )
+
+
+def read_page(con, artifact: str, page: int, page_size: int = 100) -> pd.DataFrame:
+    return con.execute(
+        f"SELECT * FROM read_parquet('{artifact}') LIMIT {int(page_size)} OFFSET {int(page) * int(page_size)}"
+    ).df()
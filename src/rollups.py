@@ -0,0 +1,72 @@
+from typing import List, Tuple
+
+from src.db import quote_identifier
+
+# Levels the business asks about; every grouping set below is drawn from these.
+DIMENSIONS = ["Market", "SBU", "PDL Name", "parent_customer_name", "Practice", "Grade", "Tower"]
+
+# Single levels, the SBU drill-downs and the combinations the dashboards use. A full CUBE
+# over seven dimensions would be 128 sets, mostly never asked for.
+GROUPING_SETS: List[Tuple[str, ...]] = [
+    (),
+    *[(d,) for d in DIMENSIONS],
+    ("Market", "SBU"),
+    ("SBU", "PDL Name"), ("SBU", "parent_customer_name"), ("SBU", "Practice"), ("SBU", "Grade"), ("SBU", "Tower"),
+    ("PDL Name", "parent_customer_name"), ("PDL Name", "Practice"),
+    ("Practice", "Grade"),
+]
+
+MEASURES = [
+    "prev_mon_billed_fte", "prev_mon_total_fte", "eff_billed_fte", "eff_total_fte",
+    "prev_billed_cost", "prev_mon_total_cost", "proj_billed_cost", "proj_total_cost",
+    "open_demands", "demands_fulfilled", "release_count", "attr_count",
+]
+
+
+def rollup_table(source: str) -> str:
+    return f"{source}_rollup"
+
+
+def level_name(grouping_set: Tuple[str, ...]) -> str:
+    return " + ".join(grouping_set) if grouping_set else "total"
+
+
+def _grouping_id(grouping_set: Tuple[str, ...]) -> int:
+    """GROUPING_ID(DIMENSIONS...) for a set: bit set for every dimension rolled up, first dimension highest."""
+    return sum(1 << (len(DIMENSIONS) - 1 - i) for i, d in enumerate(DIMENSIONS) if d not in grouping_set)
+
+
+def rollup_sql(source: str) -> str:
+    dims = ", ".join(quote_identifier(d) for d in DIMENSIONS)
+    level = "CASE GROUPING_ID({dims}) {whens} END".format(
+        dims=dims,
+        whens=" ".join(f"WHEN {_grouping_id(s)} THEN '{level_name(s)}'" for s in GROUPING_SETS),
+    )
+    sets = ", ".join("(" + ", ".join(quote_identifier(d) for d in s) + ")" for s in GROUPING_SETS)
+    measures = ", ".join(f"ROUND(SUM({quote_identifier(m)}), 2) AS {quote_identifier(m)}" for m in MEASURES)
+    return f"""
+        SELECT {level} AS grouping_level, {dims},
+               COUNT(DISTINCT "Project Id") AS project_count, {measures}
+        FROM {source}
+        GROUP BY GROUPING SETS ({sets})
+    """
+
+
+def build_rollups(con, source: str) -> int:
+    """(Re)creates the roll-up table of source; returns its row count.
+
+    Called from within the master report refresh transaction, so the roll-up always
+    matches the detail it was built from.
+    """
+    con.execute(f"CREATE OR REPLACE TABLE {rollup_table(source)} AS {rollup_sql(source)}")
+    return con.execute(f"SELECT COUNT(*) FROM {rollup_table(source)}").fetchone()[0]
+
+
+def rollup_note(source: str) -> str:
+    """How the agent should use the roll-up, shown next to it in the schema context."""
+    levels = ", ".join(f"'{level_name(s)}'" for s in GROUPING_SETS)
+    return (
+        f"Pre-aggregated sums of {source}. PREFER this table for totals at these grouping_level values: "
+        f"{levels}. Always filter on grouping_level; dimensions outside the level are NULL. "
+        f"Use {source} only for project-level detail or other combinations."
+    )
@@ -0,0 +1,81 @@
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.master_report import MASTER_REPORT, OPEN_TOTAL_WEIGHT
+
+# eff_billed_fte = prev_billed + f_weight * fulfilled + d_weight * open       - attrition - releases
+# eff_total_fte  = prev_total  + fulfilled          + d_total_weight * open - attrition - releases
+# The report uses f=0.5, d=0.2 and d_total=0.5 (see src.master_report). Both are linear in the
+# weights, so per-group sums of each term (and of each term times std_cost) are enough to
+# evaluate any weights without touching the detail rows again.
+TERMS = {
+    "prev_billed": "prev_mon_billed_fte",
+    "prev_total": "prev_mon_total_fte",
+    "fulfilled": "demands_fulfilled",
+    "open": "open_demands",
+    "exits": "attr_count + release_count",
+}
+
+
+def build_scenario_base(con, group_by: Sequence[str] = ("PDL Name",)) -> pd.DataFrame:
+    """Weight-independent coefficients per group, computed in one pass over the master report."""
+    dims = ", ".join(f'"{d}"' for d in group_by)
+    sums = []
+    for term, expr in TERMS.items():
+        sums.append(f"SUM(COALESCE({expr}, 0)) AS {term}")
+        # Rows without a std_cost drop out of cost sums, as they do in the report's cost columns.
+        sums.append(f"SUM(COALESCE(({expr}) * std_cost, 0)) AS {term}_cost")
+    return con.execute(f"""
+        SELECT {dims}, {', '.join(sums)}
+        FROM {MASTER_REPORT}
+        GROUP BY {dims}
+        ORDER BY {dims}
+    """).df()
+
+
+def _coefficient_columns() -> List[str]:
+    return [name for term in TERMS for name in (term, f"{term}_cost")]
+
+
+def _evaluate(base: pd.DataFrame, f_weights: np.ndarray, d_weights: np.ndarray, d_total_weight: float) -> dict:
+    """Vectorized evaluation: returns (groups x pairs) arrays for every projected measure."""
+    col = lambda name: base[name].to_numpy(dtype=float)[:, None]
+    f, d = f_weights[None, :], d_weights[None, :]
+    d_total = np.full_like(f, d_total_weight)
+    return {
+        "eff_billed_fte": col("prev_billed") + f * col("fulfilled") + d * col("open") - col("exits"),
+        "eff_total_fte": col("prev_total") + col("fulfilled") + d_total * col("open") - col("exits"),
+        "proj_billed_cost": col("prev_billed_cost") + f * col("fulfilled_cost") + d * col("open_cost") - col("exits_cost"),
+        "proj_total_cost": col("prev_total_cost") + col("fulfilled_cost") + d_total * col("open_cost") - col("exits_cost"),
+    }
+
+
+def evaluate_scenario(base: pd.DataFrame, f_weight: float, d_weight: float,
+                      d_total_weight: float = OPEN_TOTAL_WEIGHT) -> pd.DataFrame:
+    """Projected FTE and cost per group for one set of weights."""
+    measures = _evaluate(base, np.array([f_weight]), np.array([d_weight]), d_total_weight)
+    dims = [c for c in base.columns if c not in _coefficient_columns()]
+    result = base[dims].copy()
+    result["prev_billed_cost"] = base["prev_billed_cost"]
+    result["prev_total_cost"] = base["prev_total_cost"]
+    for name, values in measures.items():
+        result[name] = values[:, 0].round(5)
+    return result
+
+
+def evaluate_grid(base: pd.DataFrame, f_weights: Sequence[float], d_weights: Sequence[float],
+                  d_total_weight: float = OPEN_TOTAL_WEIGHT) -> pd.DataFrame:
+    """Overall totals for every (f_weight, d_weight) combination of the two weight lists.
+
+    The total-FTE measures do not depend on f_weight or d_weight, only on d_total_weight.
+    """
+    f_grid, d_grid = np.meshgrid(np.asarray(f_weights, dtype=float), np.asarray(d_weights, dtype=float))
+    f_flat, d_flat = f_grid.ravel(), d_grid.ravel()
+    measures = _evaluate(base, f_flat, d_flat, d_total_weight)
+    result = pd.DataFrame({"f_weight": f_flat, "d_weight": d_flat})
+    for name, values in measures.items():
+        result[name] = values.sum(axis=0).round(5)
+    return result
+
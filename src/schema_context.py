@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.catalog import Catalog
+from src.ingestion import KEY_COLUMN_PATTERN
+
+# How much of the selected tables goes into the text-to-SQL prompt. Every selected table is
+# always listed; beyond the MAX_TABLES best-scoring ones, tables keep only their key columns.
+MAX_TABLES = int(os.getenv("OPS_ASSIST_SCHEMA_MAX_TABLES", "4"))
+MAX_COLUMNS = int(os.getenv("OPS_ASSIST_SCHEMA_MAX_COLUMNS", "25"))
+# Selections at or below this many columns in total are sent whole.
+FULL_SCHEMA_COLUMNS = int(os.getenv("OPS_ASSIST_SCHEMA_FULL_COLUMNS", "40"))
+EXAMPLE_VALUES = 3
+
+# A name match outweighs a value match: "sbu" in the question is about the SBU column,
+# "retail" only hints that the column holding "Retail" will be filtered.
+NAME_WEIGHT = 3.0
+VALUE_WEIGHT = 1.0
+
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "by", "in", "on", "to", "and", "or", "is", "are", "what", "which",
+    "show", "me", "list", "give", "all", "how", "many", "much", "with", "per", "each", "wise", "top",
+}
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    col_type: str
+    cardinality: int
+    samples: List[str]
+    name_terms: Set[str]
+    value_terms: Set[str]
+
+
+@dataclass
+class SchemaContext:
+    text: str
+    tokens: int
+    full_tokens: int
+    tables: List[str]
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.full_tokens - self.tokens)
+
+
+def _terms(text: str) -> Set[str]:
+    return {t for t in re.split(r"[^0-9a-z]+", text.lower()) if t and t not in _STOPWORDS}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+_indexes: Dict[Tuple[str, str], Tuple[int, List[ColumnInfo]]] = {}
+_indexes_lock = threading.Lock()
+
+
+def column_index(catalog: Catalog, table: str) -> List[ColumnInfo]:
+    """Column names, types and profile statistics of table, tokenized for matching.
+
+    Built from the catalog's cached profile and kept until the catalog is invalidated,
+    so only the first question after a load pays for profiling (or precompute() does).
+    """
+    key = (catalog.db_path, table)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached and cached[0] == catalog.version:
+            return cached[1]
+    version = catalog.version
+    profile = catalog.profile(table)
+    index = [
+        ColumnInfo(
+            name=name, col_type=col_type,
+            cardinality=profile.cardinality.get(name, 0),
+            samples=profile.samples.get(name, []),
+            name_terms=_terms(name),
+            value_terms=set().union(*(_terms(v) for v in profile.samples.get(name, []))),
+        )
+        for name, col_type in catalog.columns(table)
+    ]
+    with _indexes_lock:
+        _indexes[key] = (version, index)
+    return index
+
+
+def precompute(catalog: Catalog, tables: List[str]):
+    """Profiles tables ahead of the first question, e.g. right after they are loaded."""
+    for table in tables:
+        column_index(catalog, table)
+
+
+def _column_line(column: ColumnInfo, with_stats: bool) -> str:
+    if not with_stats:
+        return f"{column.name} ({column.col_type})"
+    examples = ", ".join(f"'{v[:40]}'" for v in column.samples[:EXAMPLE_VALUES])
+    stats = f"{column.col_type}, ~{column.cardinality:,} distinct"
+    return f"{column.name} ({stats}{', e.g. ' + examples if examples else ''})"
+
+
+def full_schema(catalog: Catalog, tables: List[str]) -> str:
+    """Every column of every table, the way the prompt carried the schema before ranking."""
+    return "\n\n".join(
+        f"Table: {table}\nColumns: {', '.join(f'{name} ({col_type})' for name, col_type in catalog.columns(table))}"
+        for table in tables
+    )
+
+
+def build_schema_context(catalog: Catalog, tables: List[str], question: str,
+                         notes: Optional[Dict[str, str]] = None) -> SchemaContext:
+    """Schema text for the prompt, narrowed to the tables and columns relevant to question.
+
+    Every selected table is kept; only columns are pruned. Columns are scored by overlap
+    between the question and their names and example values; join keys are always kept and
+    matched columns carry type, cardinality and example values. Tables outside the
+    MAX_TABLES best-scoring ones, or with no match at all, are listed with their key columns
+    only. Small selections keep every column. Tables with a note (e.g. preferred roll-ups)
+    are kept whole, first, with the note printed above their columns.
+    """
+    notes = notes or {}
+    full = full_schema(catalog, tables)
+    question_terms = _terms(question)
+    indexes = {table: column_index(catalog, table) for table in tables}
+    compact = sum(len(index) for index in indexes.values()) <= FULL_SCHEMA_COLUMNS
+
+    scored = {}
+    for table, index in indexes.items():
+        scores = [
+            NAME_WEIGHT * len(question_terms & c.name_terms) + VALUE_WEIGHT * len(question_terms & c.value_terms)
+            for c in index
+        ]
+        scored[table] = (sum(sorted(scores, reverse=True)[:MAX_COLUMNS])
+                         + NAME_WEIGHT * len(question_terms & _terms(table)), scores)
+
+    ranked_tables = tables if compact else sorted(tables, key=lambda t: scored[t][0], reverse=True)
+    # With nothing matched anywhere, the first selections get their columns
+    relevant = set(tables if compact else [t for t in ranked_tables[:MAX_TABLES] if scored[t][0] > 0]
+                   or tables[:MAX_TABLES])
+    kept_tables = [t for t in notes if t in indexes] + [t for t in ranked_tables if t not in notes]
+
+    sections = []
+    for table in kept_tables:
+        index, scores = indexes[table], scored[table][1]
+        keep = set(range(len(index)))
+        if not compact and table not in notes:
+            keep = {i for i, c in enumerate(index) if KEY_COLUMN_PATTERN.search(c.name)}
+            if table in relevant:
+                ranked = sorted(range(len(index)), key=lambda i: scores[i], reverse=True)
+                keep |= {i for i in ranked[:MAX_COLUMNS] if scores[i] > 0}
+                keep |= set(ranked[:max(0, MAX_COLUMNS - len(keep))])
+        # Statistics only where the question points, plain name and type elsewhere
+        lines = ", ".join(_column_line(c, with_stats=scores[i] > 0) for i, c in enumerate(index) if i in keep)
+        section = f"Table: {table} ({catalog.profile(table).row_count:,} rows)\n"
+        if table in notes:
+            section += f"Note: {notes[table]}\n"
+        section += f"Columns: {lines or '(none shown)'}"
+        if len(keep) < len(index):
+            section += f"\n({len(index) - len(keep)} less relevant columns omitted)"
+        sections.append(section)
+
+    text = "\n\n".join(sections)
+    return SchemaContext(text=text, tokens=estimate_tokens(text), full_tokens=estimate_tokens(full), tables=kept_tables)
@@ -0,0 +1,115 @@
+import os
+import shutil
+from typing import List, Optional
+
+import duckdb
+
+from src.master_report import FACT_SOURCES
+
+# One Parquet dataset per source table, hive-partitioned by load month (and BU where the
+# table has one). Only the latest load of each month is kept, so the main database holds
+# the current data while the history lives here.
+SNAPSHOT_DIR = os.getenv("OPS_ASSIST_SNAPSHOT_DIR")
+SNAPSHOT_TABLES = FACT_SOURCES
+SNAPSHOT_PREFIX = "snap_"
+# (source, table) where the table can be served from the source's previous-month snapshot
+PREVIOUS_MONTH = ("utilization_prediction_report", "previous_month_actual")
+
+
+def snapshot_dir(db_path: str) -> str:
+    return os.path.abspath(SNAPSHOT_DIR or os.path.join(os.path.dirname(db_path) or ".", "snapshots"))
+
+
+def snapshot_view(table: str) -> str:
+    return f"{SNAPSHOT_PREFIX}{table}"
+
+
+def _partitions(con, table: str) -> List[str]:
+    columns = {r[0] for r in con.execute(f'DESCRIBE "{table}"').fetchall()}
+    return ["load_month"] + (["BU"] if "BU" in columns else [])
+
+
+def write_snapshot(con, table: str, root: str) -> Optional[str]:
+    """Writes the current contents of table as its snapshot for the month of its latest load.
+
+    An earlier snapshot of the same month is replaced. Returns the month written, or None
+    for an empty table.
+    """
+    month = con.execute(f'SELECT left(MAX(load_date), 7) FROM "{table}"').fetchone()[0]
+    if month is None:
+        return None
+    dataset = os.path.join(root, table)
+    shutil.rmtree(os.path.join(dataset, f"load_month={month}"), ignore_errors=True)
+    os.makedirs(dataset, exist_ok=True)
+    partitions = _partitions(con, table)
+    con.execute(f"""
+        COPY (SELECT *, '{month}' AS load_month FROM "{table}")
+        TO '{dataset}' (FORMAT parquet, COMPRESSION zstd, PARTITION_BY ({", ".join(f'"{p}"' for p in partitions)}),
+                        APPEND, FILENAME_PATTERN 'part_{{uuid}}')
+    """)
+    register_view(con, table, root)
+    return month
+
+
+def register_view(con, table: str, root: str):
+    """(Re)creates snap_<table> over the dataset; filters on load_month/BU prune whole directories."""
+    dataset = os.path.join(root, table)
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {snapshot_view(table)} AS
+        SELECT * FROM read_parquet('{dataset}/**/*.parquet', hive_partitioning = true, union_by_name = true,
+                                   hive_types = {{'load_month': VARCHAR}})
+    """)
+
+
+def snapshot_months(con, table: str) -> List[str]:
+    return [r[0] for r in con.execute(
+        f"SELECT DISTINCT load_month FROM {snapshot_view(table)} ORDER BY 1"
+    ).fetchall()]
+
+
+def snapshot_note(table: str) -> str:
+    """How the agent should query a snapshot view, shown next to it in the schema context."""
+    return (
+        f"Monthly snapshots of {table}, one per load_month ('YYYY-MM'). Always filter on load_month "
+        f"(e.g. load_month IN ('2025-05', '2025-06') to compare a month with the one before); "
+        f"unfiltered queries read every month."
+    )
+
+
+def link_previous_month(con, root: str) -> Optional[str]:
+    """Serves previous_month_actual from the utilization snapshot of the month before the latest one.
+
+    Only done while previous_month_actual is not a hand-loaded table (drop that table to switch
+    over). The view reads a single month directory. Returns the month linked, or None.
+    """
+    source, target = PREVIOUS_MONTH
+    row = con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [target]
+    ).fetchone()
+    if (row and row[0] == "BASE TABLE") or not os.path.isdir(os.path.join(root, source)):
+        return None
+    months = snapshot_months(con, source)
+    if len(months) < 2:
+        return None
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {target} AS
+        SELECT * EXCLUDE (load_month) FROM {snapshot_view(source)} WHERE load_month = '{months[-2]}'
+    """)
+    return months[-2]
+
+
+def snapshot_loads(con, tables: List[str], root: str) -> dict:
+    """Snapshots the freshly loaded source tables and relinks the previous month; returns {table: month}."""
+    written = {t: write_snapshot(con, t, root) for t in tables if t in SNAPSHOT_TABLES}
+    if written:
+        link_previous_month(con, root)
+        compact(con)
+    return written
+
+
+def compact(con):
+    """Checkpoints the database so space freed by replaced tables is reused; skipped while others write."""
+    try:
+        con.execute("CHECKPOINT")
+    except duckdb.Error:
+        pass
@@ -0,0 +1,53 @@
+import duckdb
+import pytest
+
+from src import answer_cache
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        answer_cache.ensure_answer_cache(con)
+        yield con
+
+
+def test_exact_repeat_is_a_hit(con):
+    answer_cache.store(con, "Total cost by SBU?", ["t"], "v1", "42", "SELECT 42")
+
+    cached = answer_cache.lookup(con, "  total cost by   sbu ", ["t"], "v1")
+
+    assert cached["answer"] == "42" and cached["sql_query"] == "SELECT 42"
+    assert answer_cache.lookup(con, "Total cost by SBU?", ["t"], "v2") is None
+
+
+def test_pruned_result_file_is_a_miss(con, tmp_path):
+    artifact = tmp_path / "result.parquet"
+    artifact.write_bytes(b"")
+    answer_cache.store(con, "q", ["t"], "v1", "a", result_path=str(artifact), total_rows=10_000)
+    assert answer_cache.lookup(con, "q", ["t"], "v1") is not None
+
+    artifact.unlink()
+
+    assert answer_cache.lookup(con, "q", ["t"], "v1") is None
+
+
+def test_paraphrase_matches_by_embedding(con):
+    vectors = {"total cost by sbu": [1.0, 0.0], "sbu wise total cost": [0.99, 0.05], "headcount": [0.0, 1.0]}
+    calls = []
+    embed = lambda text: calls.append(text) or vectors[text]
+    answer_cache.store(con, "Total cost by SBU", ["t"], "v1", "42", embed=embed)
+
+    assert answer_cache.lookup(con, "SBU wise total cost", ["t"], "v1", embed)["answer"] == "42"
+    assert answer_cache.lookup(con, "Headcount", ["t"], "v1", embed) is None
+    assert answer_cache.lookup(con, "total cost by SBU", ["t"], "v1", embed) is not None
+    assert calls == ["total cost by sbu", "sbu wise total cost", "headcount"]
+
+
+def test_lookup_does_not_write(con):
+    answer_cache.store(con, "q", ["t"], "v1", "a")
+    key = answer_cache.lookup(con, "q", ["t"], "v1")["cache_key"]
+    assert con.execute(f"SELECT hits FROM {answer_cache.ANSWER_CACHE_TABLE}").fetchone()[0] == 0
+
+    answer_cache.record_hit(con, key)
+
+    assert con.execute(f"SELECT hits FROM {answer_cache.ANSWER_CACHE_TABLE}").fetchone()[0] == 1
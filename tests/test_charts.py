@@ -0,0 +1,59 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.charts import MAX_CATEGORIES, OTHER_LABEL, PIE_MAX_SLICES, ChartPlan, chart_data, lttb_indices
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        yield con
+
+
+def test_lttb_keeps_short_series_whole():
+    assert lttb_indices(np.arange(10.0), 10) == list(range(10))
+    assert lttb_indices(np.arange(10.0), 2) == list(range(10))
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    values = np.zeros(1000)
+    values[337], values[702] = 50.0, -40.0
+
+    indices = lttb_indices(values, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+    assert 337 in indices and 702 in indices
+
+
+def test_bars_keep_top_categories_and_fold_the_rest(con):
+    con.register("src", pd.DataFrame({"sbu": [f"s{i:02d}" for i in range(30)] * 2, "cost": list(range(30)) * 2}))
+
+    df = chart_data(con, "src", ChartPlan("bar", "sbu", "cost", "Cost"))
+
+    assert len(df) == MAX_CATEGORIES
+    assert list(df["sbu"][:3]) == ["s29", "s28", "s27"] and df["sbu"].iloc[-1] == OTHER_LABEL
+    assert df["cost"].iloc[0] == 58
+    assert df["cost"].sum() == 2 * sum(range(30))
+
+
+def test_no_other_slice_when_everything_fits(con):
+    con.register("src", pd.DataFrame({"sbu": [f"s{i}" for i in range(PIE_MAX_SLICES)], "cost": range(PIE_MAX_SLICES)}))
+
+    df = chart_data(con, "src", ChartPlan("pie", "sbu", "cost", "Cost"))
+
+    assert len(df) == PIE_MAX_SLICES and OTHER_LABEL not in set(df["sbu"])
+
+
+def test_lines_are_ordered_and_downsampled(con):
+    days = pd.date_range("2020-01-01", periods=2000, freq="D")
+    con.register("src", pd.DataFrame({"day": days[::-1], "fte": np.sin(np.arange(2000) / 50)}))
+
+    df = chart_data(con, "src", ChartPlan("line", "day", "fte", "FTE"))
+
+    assert len(df) == 500
+    assert df["day"].is_monotonic_increasing
+    assert list(df.columns) == ["day", "fte"]
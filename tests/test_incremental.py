@@ -0,0 +1,102 @@
+import duckdb
+import pytest
+
+from src.incremental import (LOAD_BATCHES_TABLE, apply_incremental, history_note, history_table, list_load_batches,
+                             reset_incremental, snapshot_sql)
+
+KEYS = ["Associate ID"]
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        yield con
+
+
+def stage(con, rows, load_date, extra=None):
+    columns = '"Associate ID" VARCHAR, fte DOUBLE' + (f', "{extra}" VARCHAR' if extra else "")
+    con.execute(f"CREATE OR REPLACE TABLE stage ({columns}, load_date VARCHAR)")
+    for row in rows:
+        con.execute(f"INSERT INTO stage VALUES ({', '.join('?' for _ in row)}, ?)", [*row, load_date])
+
+
+def current(con, table="t"):
+    return sorted(con.execute(f'SELECT "Associate ID", fte FROM {table}').fetchall())
+
+
+def test_first_load_inserts_every_key(con):
+    stage(con, [("A1", 1.0), ("A2", 0.5)], "2025-05")
+
+    stats = apply_incremental(con, "stage", "t", KEYS)
+
+    assert (stats["inserted_keys"], stats["updated_keys"], stats["deleted_keys"]) == (2, 0, 0)
+    assert current(con) == [("A1", 1.0), ("A2", 0.5)]
+
+
+def test_merge_writes_only_the_delta_and_tombstones_removed_keys(con):
+    stage(con, [("A1", 1.0), ("A2", 0.5), ("A3", 1.0)], "2025-05")
+    apply_incremental(con, "stage", "t", KEYS)
+
+    stage(con, [("A1", 1.0), ("A2", 0.75), ("A4", 1.0)], "2025-06")
+    stats = apply_incremental(con, "stage", "t", KEYS)
+
+    assert (stats["inserted_keys"], stats["updated_keys"], stats["deleted_keys"], stats["unchanged_keys"]) == (1, 1, 1, 1)
+    assert stats["rows_written"] == 2
+    assert current(con) == [("A1", 1.0), ("A2", 0.75), ("A4", 1.0)]
+    tombstones = con.execute(f'SELECT _key, load_date FROM "{history_table("t")}" WHERE _deleted').fetchall()
+    assert tombstones == [("A3", "2025-06")]
+    assert con.execute(f"SELECT COUNT(*) FROM {LOAD_BATCHES_TABLE}").fetchone()[0] == 2
+
+
+def test_snapshot_sql_reads_the_table_as_of_a_batch(con):
+    stage(con, [("A1", 1.0), ("A3", 1.0)], "2025-05")
+    apply_incremental(con, "stage", "t", KEYS)
+    stage(con, [("A1", 0.5)], "2025-06")
+    apply_incremental(con, "stage", "t", KEYS)
+
+    assert list_load_batches(con, "t") == ["2025-06", "2025-05"]
+    as_of = con.execute(f'SELECT "Associate ID", fte FROM ({snapshot_sql("t", "2025-05")})').fetchall()
+    assert sorted(as_of) == [("A1", 1.0), ("A3", 1.0)]
+    latest = con.execute(f'SELECT "Associate ID", fte FROM ({snapshot_sql("t")})').fetchall()
+    assert latest == [("A1", 0.5)]
+    assert "load_date <= '2025-05'" in history_note(con, "t")
+
+
+def test_upload_only_columns_are_added(con):
+    stage(con, [("A1", 1.0)], "2025-05")
+    apply_incremental(con, "stage", "t", KEYS)
+
+    stage(con, [("A1", 1.0, "Chennai")], "2025-06", extra="Location")
+    stats = apply_incremental(con, "stage", "t", KEYS)
+
+    assert stats["added_columns"] == ["Location"]
+    assert con.execute('SELECT "Location" FROM t').fetchall() == [("Chennai",)]
+    assert con.execute(f'SELECT COUNT("Location") FROM "{history_table("t")}"').fetchone()[0] == 1
+
+
+def test_text_in_a_numeric_column_widens_it_instead_of_nulling(con):
+    stage(con, [("A1", 1.0), ("A2", 0.5)], "2025-05")
+    apply_incremental(con, "stage", "t", KEYS)
+
+    con.execute('CREATE OR REPLACE TABLE stage ("Associate ID" VARCHAR, fte VARCHAR, load_date VARCHAR)')
+    con.execute("INSERT INTO stage VALUES ('A1', '1', '2025-06'), ('A2', 'N/A', '2025-06')")
+    stats = apply_incremental(con, "stage", "t", KEYS)
+
+    assert stats["widened_columns"] == ["fte"]
+    assert (stats["updated_keys"], stats["unchanged_keys"]) == (1, 1)
+    assert current(con) == [("A1", "1"), ("A2", "N/A")]
+    history = con.execute(f'SELECT fte FROM "{history_table("t")}" ORDER BY load_date, fte').fetchall()
+    assert history == [("0.5",), ("1",), ("N/A",)]
+
+
+def test_reset_drops_keys_and_history(con):
+    stage(con, [("A1", 1.0)], "2025-05")
+    apply_incremental(con, "stage", "t", KEYS)
+    con.execute("CREATE OR REPLACE TABLE t AS SELECT 'A9' AS \"Associate ID\", 2.0 AS fte, '2025-06' AS load_date")
+
+    reset_incremental(con, "t")
+    stage(con, [("A9", 2.0)], "2025-07")
+    stats = apply_incremental(con, "stage", "t", KEYS)
+
+    assert (stats["inserted_keys"], stats["deleted_keys"], stats["unchanged_keys"]) == (0, 0, 1)
+    assert list_load_batches(con, "t") == ["2025-06"]
@@ -0,0 +1,129 @@
+import io
+import threading
+
+import duckdb
+import pytest
+import xlsxwriter
+
+from src.db import ConnectionManager
+from src.incremental import apply_incremental, history_table, keys_table
+from src.ingestion import _as_text, ingest_excel, ingest_uploads, write_batches
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        yield con
+
+
+def test_widening_renders_stored_doubles_like_later_batches(con):
+    values = [1.0, 1234567.0, 0.5, -3.0, 1e20]
+    batches = [(["amount"], [[v] for v in values]), (["amount"], [["n/a"], [2.0]])]
+
+    result = write_batches(con, "t", batches, "2025-01-01")
+
+    assert result.column_types == {"amount": "VARCHAR"}
+    stored = [r[0] for r in con.execute('SELECT amount FROM t').fetchall()]
+    assert stored == [_as_text(v) for v in values] + ["n/a", "2"]
+
+
+def test_numeric_batches_keep_double(con):
+    write_batches(con, "t", [(["amount"], [[1.5]]), (["amount"], [["2,000"], [None]])], "2025-01-01")
+
+    assert con.execute("SELECT typeof(amount) FROM t LIMIT 1").fetchone()[0] == "DOUBLE"
+    assert con.execute("SELECT SUM(amount) FROM t").fetchone()[0] == 2001.5
+
+
+def test_key_columns_stay_text(con):
+    write_batches(con, "t", [(["Project Id", "fte"], [[1001.0, 1.0]])], "2025-01-01")
+
+    assert con.execute('SELECT "Project Id", fte FROM t').fetchone() == ("1001", 1.0)
+
+
+def test_numeric_dimensions_stay_text(con):
+    write_batches(con, "t", [(["BU", "Grade", "Total FTE", "Cost Center Code"], [[1101.0, 4, 0.5, 77.0]])], "2025-01-01")
+
+    assert con.execute('SELECT BU, Grade, "Total FTE", "Cost Center Code" FROM t').fetchone() == ("1101", "4", 0.5, "77")
+
+
+def test_overwrite_drops_incremental_state(con):
+    write_batches(con, "t", [(["Associate ID", "fte"], [["A1", 1.0]])], "2025-01")
+    con.execute("CREATE TABLE stage AS SELECT 'A2' AS \"Associate ID\", 1.0::DOUBLE AS fte, '2025-02' AS load_date")
+    apply_incremental(con, "stage", "t", ["Associate ID"])
+
+    write_batches(con, "t", [(["Associate ID", "fte"], [["A3", 1.0]])], "2025-03")
+
+    tables = {r[0] for r in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    assert {history_table("t"), keys_table("t")} & tables == set()
+
+
+def _workbook(name, sheets):
+    payload = io.BytesIO()
+    with xlsxwriter.Workbook(payload) as wb:
+        for sheet, rows in sheets.items():
+            ws = wb.add_worksheet(sheet)
+            for r, row in enumerate(rows):
+                ws.write_row(r, 0, row)
+    upload = io.BytesIO(payload.getvalue())
+    upload.name = name
+    return upload
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "ops.duckdb"))
+    yield manager
+    manager.close()
+
+
+def test_ingest_uploads_reports_empty_sheets_as_errors(manager):
+    upload = _workbook("report.xlsx", {"Data": [["Project Id", "fte"], ["P1", 1.5]], "Blank": []})
+
+    results = {r.sheet_name: r for r in ingest_uploads(manager, [upload], max_workers=1)}
+
+    assert results["Data"].error is None and results["Data"].rows == 1
+    assert results["Data"].peak_rss_mb > 0
+    assert results["Blank"].error
+    with manager.read() as con:
+        tables = {r[0] for r in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    assert results["Data"].table_name in tables
+    assert results["Blank"].table_name not in tables
+
+
+def test_ingest_uploads_skips_identical_reupload(manager):
+    sheets = {"Data": [["Project Id", "fte"], ["P1", 1.5]]}
+    ingest_uploads(manager, [_workbook("report.xlsx", sheets)], max_workers=1)
+
+    results = ingest_uploads(manager, [_workbook("report.xlsx", sheets)], max_workers=1)
+
+    assert [r.skipped for r in results] == [True]
+
+
+def test_ingest_uploads_parses_without_holding_the_writer(manager):
+    upload = _workbook("report.xlsx", {"Data": [["Project Id", "fte"], ["P1", 1.5]]})
+    writer_held = []
+
+    def on_progress(result):
+        acquired = manager._write_lock.acquire(blocking=False)
+        writer_held.append(not acquired)
+        if acquired:
+            manager._write_lock.release()
+
+    def acquire_elsewhere(result):
+        thread = threading.Thread(target=lambda: on_progress(result))
+        thread.start()
+        thread.join()
+
+    ingest_uploads(manager, [upload], on_progress=acquire_elsewhere, max_workers=1)
+
+    assert writer_held == [False]
+
+
+def test_ingest_excel_and_ingest_uploads_share_ledger_entries(manager):
+    upload = _workbook("report.xlsx", {"Data": [["Project Id", "fte"], ["P1", 1.5]]})
+    ingest_uploads(manager, [upload], max_workers=1)
+
+    with manager.write() as con:
+        result = ingest_excel(con, upload, "report")
+
+    assert result.skipped and result.sheet_name == "Data"
@@ -0,0 +1,54 @@
+import duckdb
+import pytest
+
+from src.ledger import bump_data_epoch, current_load, data_version, record_load, unchanged_tables
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        for table, sheet in [("report_a", "A"), ("report_b", "B")]:
+            con.execute(f"CREATE TABLE {table} (x INTEGER)")
+            record_load(con, table, "report.xlsx", "h1", sheet, f"sheet-{sheet}", 10)
+        yield con
+
+
+def test_identical_file_is_unchanged(con):
+    assert sorted(unchanged_tables(con, "report.xlsx", "h1")) == [("report_a", "A", 10), ("report_b", "B", 10)]
+
+
+def test_changed_or_new_file_is_not(con):
+    assert unchanged_tables(con, "report.xlsx", "h2") == []
+    assert unchanged_tables(con, "other.xlsx", "h1") == []
+
+
+def test_dropping_one_table_reloads_the_whole_file(con):
+    con.execute("DROP TABLE report_b")
+
+    assert unchanged_tables(con, "report.xlsx", "h1") == []
+
+
+def test_reloading_one_table_from_elsewhere_reloads_the_file(con):
+    record_load(con, "report_a", "manual.xlsx", "h9", "A", "sheet-x", 3)
+
+    assert unchanged_tables(con, "report.xlsx", "h1") == []
+    assert current_load(con, "report_a") == ("h9", "A", "sheet-x")
+
+
+def test_data_version_changes_with_loads_and_epoch(con):
+    before = data_version(con, ["report_a"])
+    other = data_version(con, ["report_b"])
+
+    record_load(con, "report_a", "report.xlsx", "h2", "A", "sheet-A2", 11)
+    after_load = data_version(con, ["report_a"])
+    bump_data_epoch(con)
+
+    assert len({before, other, after_load, data_version(con, ["report_a"])}) == 4
+    assert data_version(con, ["report_b"]) != other
+
+
+def test_data_version_is_read_only():
+    with duckdb.connect() as con:
+        data_version(con, ["anything"])
+
+        assert con.execute("SELECT COUNT(*) FROM information_schema.tables").fetchone()[0] == 0
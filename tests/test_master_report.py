@@ -0,0 +1,42 @@
+import duckdb
+import pytest
+
+from bench.synthetic import generate, load_tables
+from src.master_report import MASTER_REPORT, refresh_master_report
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        load_tables(con, generate(scale=0.05), "2025-05")
+        refresh_master_report(con)
+        yield con
+
+
+def test_unchanged_sources_leave_the_report_fresh(con):
+    assert refresh_master_report(con)["mode"] == "fresh"
+
+
+def test_department_id_change_reaches_every_project(con):
+    name = con.execute('SELECT "HCM Department Name" FROM utilization_prediction_report LIMIT 1').fetchone()[0]
+    con.execute("""UPDATE utilization_prediction_report SET "HCM Department ID" = 'D-NEW'
+                   WHERE "HCM Department Name" = ?""", [name])
+
+    result = refresh_master_report(con)
+
+    assert result["mode"] == "full" and "dept_map" in result["changed"]
+    ids = con.execute(f"SELECT DISTINCT department_id FROM {MASTER_REPORT} WHERE department_name = ?", [name]).fetchall()
+    assert ids == [("D-NEW",)]
+
+
+def test_weights_rebuild_the_report_and_are_kept_for_later_refreshes(con):
+    billed = f"SELECT ROUND(SUM(eff_billed_fte), 3) FROM {MASTER_REPORT}"
+    before = con.execute(billed).fetchone()[0]
+
+    assert refresh_master_report(con, weights=(1.0, 0.0, 0.5))["mode"] == "full"
+    after = con.execute(billed).fetchone()[0]
+
+    assert after != before
+    assert refresh_master_report(con)["mode"] == "fresh"
+    assert refresh_master_report(con, force=True)["mode"] == "full"
+    assert con.execute(billed).fetchone()[0] == after
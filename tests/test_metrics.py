@@ -0,0 +1,85 @@
+import logging
+import time
+
+import duckdb
+import pytest
+
+from src.db import get_manager
+from src.metrics import (METRICS_TABLE, MetricsStore, PeakRss, current_rss_mb, hot_operators, last_profile,
+                         profiling, timed_node)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "ops.duckdb")
+    yield path
+    get_manager(path).close()
+
+
+def test_rss_is_sampled_per_record(db_path):
+    store = MetricsStore(db_path)
+    store.record("ingest", 1.0, rows=100)
+    ballast = bytearray(64 * 1024 * 1024)
+    store.record("ingest", 1.0, rows=100)
+    del ballast
+
+    with get_manager(db_path).read() as con:
+        first, second = [r[0] for r in con.execute(f"SELECT rss_mb FROM {METRICS_TABLE} ORDER BY recorded_at").fetchall()]
+    assert second - first > 32
+    assert current_rss_mb() > 0
+
+
+def test_peak_rss_keeps_memory_freed_before_the_stage_ends(db_path):
+    with PeakRss() as peak:
+        ballast = bytearray(64 * 1024 * 1024)
+        time.sleep(0.3)
+        del ballast
+    MetricsStore(db_path).record("master_report", 1.0, peak=peak)
+
+    with get_manager(db_path).read() as con:
+        recorded = con.execute(f"SELECT rss_mb FROM {METRICS_TABLE}").fetchone()[0]
+    assert recorded == peak.mb and peak.mb - current_rss_mb() > 32
+
+
+def test_token_estimates_are_named_as_such_in_older_tables(db_path):
+    with get_manager(db_path).write() as con:
+        con.execute(f"CREATE TABLE {METRICS_TABLE} (recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, run_id VARCHAR, "
+                    f"stage VARCHAR, seconds DOUBLE, prompt_tokens INTEGER, completion_tokens INTEGER, rows BIGINT, "
+                    f"profile VARCHAR, detail VARCHAR)")
+
+    MetricsStore(db_path).record("llm:summerize", 1.0, est_prompt_tokens=120, est_completion_tokens=30)
+
+    with get_manager(db_path).read() as con:
+        row = con.execute(f"SELECT est_prompt_tokens, est_completion_tokens, rss_mb FROM {METRICS_TABLE}").fetchone()
+    assert row[:2] == (120, 30) and row[2] > 0
+
+
+def test_record_failures_are_logged_not_raised(db_path, caplog):
+    store = MetricsStore(db_path)
+
+    with caplog.at_level(logging.WARNING, logger="src.metrics"):
+        store.record("ingest", 1.0, rows="many")
+
+    assert "Could not record ingest metric" in caplog.text
+
+
+def test_timed_node_records_and_summarizes(db_path):
+    node = timed_node(db_path, "generate_query", lambda state: {"sql_query": "SELECT 1"})
+
+    assert node({"run_id": "r1"}) == {"sql_query": "SELECT 1"}
+    MetricsStore(db_path).record("question", 2.0, run_id="r1")
+
+    summary = MetricsStore(db_path).stage_summary(last_questions=5).set_index("stage")
+    assert set(summary.index) == {"node:generate_query", "question"}
+    assert summary.loc["question", "p50_s"] == 2.0
+
+
+def test_profiles_name_the_hot_operators():
+    with duckdb.connect() as con:
+        assert last_profile(con) is None
+        with profiling(con):
+            con.execute("SELECT range % 7 AS k, COUNT(*) FROM range(100000) GROUP BY 1").fetchall()
+            profile = last_profile(con)
+
+    operators = [name for name, _ in hot_operators(profile, n=10)]
+    assert "HASH_GROUP_BY" in operators
@@ -0,0 +1,44 @@
+import duckdb
+import pytest
+
+from src.preflight import QueryRejected, check_plan, check_read_only
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        con.execute("CREATE TABLE t AS SELECT range AS x FROM range(100)")
+        yield con
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT x FROM t",
+    "WITH big AS (SELECT x FROM t WHERE x > 50) SELECT COUNT(*) FROM big;",
+    "FROM t LIMIT 3",
+])
+def test_selects_pass(con, sql):
+    check_plan(con, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE t",
+    "INSERT INTO t VALUES (1)",
+    "SELECT 1; DROP TABLE t",
+    "COPY t TO 'out.csv'",
+    "ATTACH 'other.duckdb'",
+    "SET threads = 1",
+])
+def test_anything_else_is_rejected(sql):
+    with pytest.raises(QueryRejected):
+        check_read_only(sql)
+
+
+def test_rejection_happens_before_execution(con):
+    with pytest.raises(QueryRejected):
+        check_plan(con, "SELECT 1; DROP TABLE t")
+    assert con.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 100
+
+
+def test_cross_join_over_budget_is_rejected(con):
+    with pytest.raises(QueryRejected, match="join condition"):
+        check_plan(con, "SELECT * FROM t a, t b, t c", max_rows=10_000)
@@ -0,0 +1,35 @@
+import duckdb
+import pytest
+
+from src.preview import count_rows, fetch_page
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        con.execute("CREATE TABLE t (name VARCHAR, pct VARCHAR)")
+        con.execute("INSERT INTO t VALUES ('a_b', '50%'), ('axb', '500'), ('A\\B', '5'), ('ab', NULL)")
+        con.execute("CREATE VIEW v AS SELECT * FROM t")
+        yield con
+
+
+@pytest.mark.parametrize("search, expected", [("a_b", 1), ("0%", 1), ("%", 1), ("a\\b", 1), ("AB", 1), ("a", 4)])
+def test_search_matches_wildcards_literally(con, search, expected):
+    assert count_rows(con, "t", ["name", "pct"], search) == expected
+
+
+def test_pages_follow_storage_order(con):
+    con.execute("INSERT INTO t SELECT 'row ' || range, NULL FROM range(250)")
+
+    pages = [fetch_page(con, "t", ["name", "pct"], page, 100) for page in range(3)]
+
+    names = [n for page in pages for n in page["name"]]
+    assert len(names) == 254 == len(set(names))
+    assert names[:4] == ["a_b", "axb", "A\\B", "ab"]
+
+
+def test_views_page_in_a_stable_order(con):
+    first = fetch_page(con, "v", ["name", "pct"], 0, 2)
+    second = fetch_page(con, "v", ["name", "pct"], 1, 2)
+
+    assert sorted(list(first["name"]) + list(second["name"])) == sorted(["a_b", "axb", "A\\B", "ab"])
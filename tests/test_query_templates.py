@@ -0,0 +1,90 @@
+import duckdb
+import pytest
+
+from src import query_templates
+from src.query_templates import parameterize, schema_fingerprint
+
+FINGERPRINT = schema_fingerprint({"dashboard15": [("SBU", "VARCHAR"), ("proj_billed_cost", "DOUBLE")]})
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        query_templates.ensure_query_templates(con)
+        yield con
+
+
+def test_parameterize_lifts_literals_the_question_supplied():
+    skeleton, sql_template, kinds = parameterize(
+        "Top 5 projects in Retail?",
+        "SELECT \"Project Id\" FROM t WHERE SBU = 'Retail' AND status = 'Active' ORDER BY cost DESC LIMIT 5"
+    )
+
+    assert skeleton == "top {p1} projects in {p0}"
+    assert sql_template == ("SELECT \"Project Id\" FROM t WHERE SBU = '{p0}' AND status = 'Active' "
+                            "ORDER BY cost DESC LIMIT {p1}")
+    assert kinds == ["text:1", "number"]
+
+
+def test_parameterize_keeps_like_wildcards_and_ignores_identifiers():
+    skeleton, sql_template, _ = parameterize(
+        "Attrition in Chennai", "SELECT SUM(\"attr 2\") FROM t WHERE Location ILIKE '%Chennai%'"
+    )
+
+    assert skeleton == "attrition in {p0}"
+    assert sql_template == "SELECT SUM(\"attr 2\") FROM t WHERE Location ILIKE '%{p0}%'"
+
+
+def test_parameterize_refuses_sql_with_braces():
+    assert parameterize("list the structs", "SELECT {'a': 1}") is None
+
+
+def test_parameterize_skips_numbers_it_cannot_place():
+    sql = "SELECT Project, ROUND(SUM(cost), 2) AS cost FROM t GROUP BY 1 ORDER BY 2 DESC LIMIT 2"
+
+    assert parameterize("Top 2 projects by cost", sql) is None
+    assert parameterize("Projects over 2 FTE", "SELECT * FROM t WHERE ROUND(fte, 2) > 1") is None
+
+
+def test_match_binds_new_values_in_their_original_case(con):
+    query_templates.remember(con, "Total cost for Retail", "SELECT SUM(c) FROM t WHERE SBU = 'Retail'", FINGERPRINT)
+
+    assert (query_templates.match(con, "total cost for O'Brien", FINGERPRINT)
+            == "SELECT SUM(c) FROM t WHERE SBU = 'O''Brien'")
+
+
+def test_text_slots_take_as_many_words_as_the_original_literal(con):
+    query_templates.remember(con, "Attrition in Chennai", "SELECT * FROM t WHERE Location = 'Chennai'", FINGERPRINT)
+    query_templates.remember(con, "Cost for Acme Labs", "SELECT * FROM t WHERE Client = 'Acme Labs'", FINGERPRINT)
+
+    assert query_templates.match(con, "Attrition in Chennai excluding grade E4", FINGERPRINT) is None
+    assert (query_templates.match(con, "cost for O'Brien Labs", FINGERPRINT)
+            == "SELECT * FROM t WHERE Client = 'O''Brien Labs'")
+    assert query_templates.match(con, "cost for Labs", FINGERPRINT) is None
+
+
+def test_match_needs_the_same_schema_and_shape(con):
+    query_templates.remember(con, "Top 5 projects", "SELECT * FROM t LIMIT 5", FINGERPRINT)
+
+    assert query_templates.match(con, "Top 10 projects", FINGERPRINT) == "SELECT * FROM t LIMIT 10"
+    assert query_templates.match(con, "Top ten projects", FINGERPRINT) is None
+    assert query_templates.match(con, "Top 10 projects", "other-schema") is None
+
+
+def test_forget_drops_the_matching_template(con):
+    query_templates.remember(con, "Top 5 projects", "SELECT * FROM t LIMIT 5", FINGERPRINT)
+
+    query_templates.forget(con, "top 7 projects", FINGERPRINT)
+
+    assert query_templates.match(con, "Top 5 projects", FINGERPRINT) is None
+
+
+def test_find_does_not_count_uses(con):
+    query_templates.remember(con, "Top 5 projects", "SELECT * FROM t LIMIT 5", FINGERPRINT)
+    uses = f"SELECT uses FROM {query_templates.QUERY_TEMPLATES_TABLE}"
+
+    skeleton, sql = query_templates.find(con, "Top 3 projects", FINGERPRINT)
+    assert sql == "SELECT * FROM t LIMIT 3" and con.execute(uses).fetchone()[0] == 0
+
+    query_templates.record_use(con, FINGERPRINT, skeleton)
+    assert con.execute(uses).fetchone()[0] == 1
@@ -0,0 +1,43 @@
+import duckdb
+import numpy as np
+import pytest
+
+from bench import synthetic
+from src.master_report import (FULFILLED_BILLED_WEIGHT, MASTER_REPORT, OPEN_BILLED_WEIGHT, refresh_master_report,
+                               report_version)
+from src.scenarios import build_scenario_base, evaluate_grid, evaluate_scenario
+
+
+@pytest.fixture(scope="module")
+def con():
+    with duckdb.connect() as con:
+        synthetic.load_tables(con, synthetic.generate(0.05, seed=3), "2025-06-30 09:00:00 IST")
+        refresh_master_report(con, force=True)
+        yield con
+
+
+def test_report_weights_reproduce_the_report(con):
+    scenario = evaluate_scenario(build_scenario_base(con), FULFILLED_BILLED_WEIGHT, OPEN_BILLED_WEIGHT)
+    expected = con.execute(f"""
+        SELECT "PDL Name", SUM(eff_billed_fte), SUM(eff_total_fte), SUM(proj_billed_cost), SUM(proj_total_cost)
+        FROM {MASTER_REPORT} GROUP BY 1 ORDER BY 1
+    """).df()
+
+    for i, measure in enumerate(["eff_billed_fte", "eff_total_fte", "proj_billed_cost", "proj_total_cost"], start=1):
+        np.testing.assert_allclose(scenario[measure], expected.iloc[:, i], rtol=1e-6, atol=1e-3)
+
+
+def test_total_fte_follows_its_own_open_demand_weight(con):
+    base = build_scenario_base(con)
+    low, high = (evaluate_grid(base, [0.5, 1.0], [0.2], d_total_weight=w) for w in (0.0, 1.0))
+
+    assert list(high.eff_total_fte - low.eff_total_fte) == pytest.approx([base.open.sum()] * 2)
+    assert list(low.eff_billed_fte) == list(high.eff_billed_fte)
+
+
+def test_report_version_creates_nothing():
+    with duckdb.connect() as con:
+        con.execute(f"CREATE TABLE {MASTER_REPORT} (x INTEGER)")
+
+        assert report_version(con) == ""
+        assert con.execute("SELECT COUNT(*) FROM information_schema.tables").fetchone()[0] == 1
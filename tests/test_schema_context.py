@@ -0,0 +1,46 @@
+import pytest
+
+from src.catalog import Catalog
+from src.db import get_manager
+from src.schema_context import MAX_TABLES, build_schema_context
+
+TABLES = ["attrition", "releases", "fulfilment", "demand_base", "cost_file", "map_location"]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    db_path = str(tmp_path / "ops.duckdb")
+    with get_manager(db_path).write() as con:
+        for table in TABLES:
+            measures = ", ".join(f"{i} AS {table}_measure_{i}" for i in range(10))
+            con.execute(f"""CREATE TABLE {table} AS SELECT 'P1' AS "Project Id", 'Chennai' AS city, {measures}""")
+    yield Catalog(db_path)
+    get_manager(db_path).close()
+
+
+def test_every_selected_table_is_kept(catalog):
+    context = build_schema_context(catalog, TABLES, "attrition measure 3 by project")
+
+    assert sorted(context.tables) == sorted(TABLES)
+    for table in TABLES:
+        assert f"Table: {table} " in context.text
+    assert context.text.count("Project Id (VARCHAR") == len(TABLES)
+
+
+def test_only_the_best_tables_keep_other_columns(catalog):
+    context = build_schema_context(catalog, TABLES, "attrition measure 3")
+    sections = {s.split(" ", 2)[1]: s for s in context.text.split("\n\n")}
+
+    assert context.tables[0] == "attrition"
+    assert "attrition_measure_3 (" in sections["attrition"]
+    trimmed = [t for t in TABLES if "measure_0" not in sections[t]]
+    assert len(trimmed) == len(TABLES) - MAX_TABLES
+    for table in trimmed:
+        assert "city" not in sections[table] and "11 less relevant columns omitted" in sections[table]
+
+
+def test_small_selections_are_sent_whole(catalog):
+    context = build_schema_context(catalog, TABLES[:2], "anything")
+
+    assert "omitted" not in context.text
+    assert context.tables == TABLES[:2]